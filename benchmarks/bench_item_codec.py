@@ -0,0 +1,96 @@
+"""
+Benchmarks the work item encodings: the old str(dict) / ast.literal_eval,
+plain json, the orjson codec of modules/codec.py and msgpack, plus
+decoding of a status hash entry with json vs orjson.
+
+Memory is measured as the MEMORY USAGE of a sorted set queue holding all
+items when a redis server is reachable, otherwise only the raw payload
+bytes are reported.
+
+    python3 benchmarks/bench_item_codec.py --items 100000 --redis-port 6379
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import sys
+import time
+
+import ormsgpack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.codec import encode_item, decode_item, decode_status
+
+STATUS = json.dumps([{
+    "pid": 123456, "status": "running", "topic_name": "panel_00001_readUserAttributes",
+    "group_name": "panel_00001_readUserAttributes_grp", "env": "prod",
+    "start_time": "2025-04-24 10:00:00.000", "update_time": "2025-04-24 11:00:00.000",
+    "current_producer_offset": 1234567, "current_consumer_offset": 1234000, "prev_lag": 600, "current_lag": 567
+}])
+
+CODECS = {
+    "str/literal_eval": (str, ast.literal_eval),
+    "json": (json.dumps, json.loads),
+    "orjson codec": (encode_item, decode_item),
+    "msgpack": (ormsgpack.packb, ormsgpack.unpackb),
+}
+
+
+def make_items(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        max_uid = int(rng.lognormvariate(0, 1.6) * 2_000_000)
+        items.append({"panel_name": f"panel_{i:06d}", "start_uid": 1, "end_uid": int(max_uid * 1.1)})
+    return items
+
+
+def time_it(func, values) -> tuple:
+    started = time.perf_counter()
+    results = [func(value) for value in values]
+    return time.perf_counter() - started, results
+
+
+def redis_memory(redis_client, encoded: list) -> int:
+    key = "bench_item_codec_queue"
+    redis_client.delete(key)
+    pipe = redis_client.pipeline(transaction=False)
+    for start in range(0, len(encoded), 10000):
+        pipe.zadd(key, {item: n for n, item in enumerate(encoded[start:start + 10000], start)})
+    pipe.execute()
+    memory = redis_client.memory_usage(key, samples=0)
+    redis_client.delete(key)
+    return memory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Work item codec throughput and redis memory.")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=None, help="Measure queue memory on this redis server")
+    args = parser.parse_args()
+
+    redis_client = None
+    if args.redis_port:
+        import redis
+        redis_client = redis.Redis(host=args.redis_host, port=args.redis_port)
+
+    items = make_items(args.items)
+    print(f"{args.items} items, per 100k items:\n")
+    print(f"{'codec':<18} {'encode/s':>12} {'decode/s':>12} {'bytes':>12} {'redis bytes':>12}")
+    for name, (encode, decode) in CODECS.items():
+        encode_sec, encoded = time_it(encode, items)
+        decode_sec, decoded = time_it(decode, encoded)
+        assert decoded == items, name
+        payload_bytes = sum(len(value) for value in encoded)
+        memory = redis_memory(redis_client, encoded) if redis_client else None
+        scale = 100000 / args.items
+        print(f"{name:<18} {args.items / encode_sec:>12,.0f} {args.items / decode_sec:>12,.0f} {payload_bytes * scale:>12,.0f} "
+              f"{memory * scale if memory else float('nan'):>12,.0f}")
+
+    statuses = [STATUS] * args.items
+    json_sec, _ = time_it(lambda value: json.loads(value)[0], statuses)
+    orjson_sec, _ = time_it(decode_status, statuses)
+    print(f"\nstatus entry decode/s: json {args.items / json_sec:,.0f}, orjson {args.items / orjson_sec:,.0f}")
@@ -0,0 +1,127 @@
+"""
+Benchmarks one kill_consumer.py cycle of offset reads for N consumer groups:
+two kafka-consumer-groups.sh --describe per group as before, and
+KafkaOffsetReader.get_offsets() kill_consumer.py uses now: the log end
+offsets of all topics in one request, the committed offsets group by group.
+
+    python3 benchmarks/bench_kafka_offsets.py --bootstrap-servers localhost:9092 --groups 1000
+
+Needs a kafka cluster to talk to. N topics (bench_offsets_<n>, with
+bench_offsets_<n>_grp groups the way the migration names them) are created,
+filled with a few messages and given committed offsets, and deleted again at
+the end unless --keep is given. Starting a JVM per group takes too long at 1k
+groups, the script is timed for --legacy-samples groups and extrapolated.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from kafka import KafkaAdminClient, KafkaConsumer, KafkaProducer, TopicPartition
+from kafka.admin import NewTopic
+from kafka.errors import TopicAlreadyExistsError
+from kafka.structs import OffsetAndMetadata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.kafka_offsets import KafkaOffsetReader
+
+KAFKA_CONSUMER_GROUPS = "/usr/local/kafka_2.13-2.6.2/bin/kafka-consumer-groups.sh"
+MESSAGES_PER_PARTITION = 10
+
+
+def get_topic_groups(prefix: str, count: int) -> list:
+    return [(f"{prefix}{n:05d}", f"{prefix}{n:05d}_grp") for n in range(count)]
+
+
+def set_up(bootstrap_servers: str, topic_groups: list, partitions: int):
+    admin_client = KafkaAdminClient(bootstrap_servers=bootstrap_servers)
+    topics = [NewTopic(topic, num_partitions=partitions, replication_factor=1) for topic, _ in topic_groups]
+    for start in range(0, len(topics), 100):
+        try:
+            admin_client.create_topics(topics[start:start + 100])
+        except TopicAlreadyExistsError:
+            pass
+    admin_client.close()
+
+    producer = KafkaProducer(bootstrap_servers=bootstrap_servers)
+    for topic, _ in topic_groups:
+        for partition in range(partitions):
+            for _ in range(MESSAGES_PER_PARTITION):
+                producer.send(topic, b"x", partition=partition)
+    producer.flush()
+    producer.close()
+
+    # every group consumed half of its topic
+    for topic, group in topic_groups:
+        consumer = KafkaConsumer(bootstrap_servers=bootstrap_servers, group_id=group, enable_auto_commit=False)
+        consumer.commit({TopicPartition(topic, partition): OffsetAndMetadata(MESSAGES_PER_PARTITION // 2, "", -1) for partition in range(partitions)})
+        consumer.close()
+
+
+def tear_down(bootstrap_servers: str, topic_groups: list):
+    admin_client = KafkaAdminClient(bootstrap_servers=bootstrap_servers)
+    for start in range(0, len(topic_groups), 100):
+        batch = topic_groups[start:start + 100]
+        admin_client.delete_consumer_groups([group for _, group in batch])
+        admin_client.delete_topics([topic for topic, _ in batch])
+    admin_client.close()
+
+
+def legacy_cycle(bootstrap_servers: str, topic_groups: list, kafka_consumer_groups: str) -> float:
+    started = time.monotonic()
+    for _, group in topic_groups:
+        # get_kafka_offsets() and check_produced_eq_conumed() each described the group
+        for _ in range(2):
+            subprocess.run([kafka_consumer_groups, "--bootstrap-server", bootstrap_servers, "--group", group, "--describe"], capture_output=True)
+    return time.monotonic() - started
+
+
+def reader_cycle(reader: KafkaOffsetReader, topic_groups: list) -> float:
+    started = time.monotonic()
+    reader.get_offsets(topic_groups)
+    return time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bootstrap-servers", required=True)
+    parser.add_argument("--groups", type=int, default=1000)
+    parser.add_argument("--partitions", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=3, help="cycles timed per approach, the median is reported")
+    parser.add_argument("--legacy-samples", type=int, default=5, help="groups kafka-consumer-groups.sh is timed on, 0 to skip it")
+    parser.add_argument("--kafka-consumer-groups", default=KAFKA_CONSUMER_GROUPS)
+    parser.add_argument("--topic-prefix", default="bench_offsets_")
+    parser.add_argument("--keep", action="store_true", help="keep the topics and groups for the next run")
+    args = parser.parse_args()
+
+    topic_groups = get_topic_groups(args.topic_prefix, args.groups)
+    set_up(args.bootstrap_servers, topic_groups, args.partitions)
+    results = []
+    try:
+        if args.legacy_samples:
+            sample = topic_groups[:args.legacy_samples]
+            per_group = statistics.median(legacy_cycle(args.bootstrap_servers, sample, args.kafka_consumer_groups) for _ in range(args.rounds)) / len(sample)
+            results.append(("kafka-consumer-groups.sh x2 (extrapolated)", per_group * args.groups))
+
+        reader = KafkaOffsetReader(args.bootstrap_servers)
+        try:
+            # the first cycle also connects to every broker and looks the coordinators up
+            reader_cycle(reader, topic_groups)
+            results.append(("offset reader", statistics.median(reader_cycle(reader, topic_groups) for _ in range(args.rounds))))
+        finally:
+            reader.close()
+    finally:
+        if not args.keep:
+            tear_down(args.bootstrap_servers, topic_groups)
+
+    print(f"{args.groups} groups, {args.partitions} partitions each")
+    print(f"{'approach':>44} | {'cycle_s':>10} | {'per_group_ms':>12}")
+    for label, seconds in results:
+        print(f"{label:>44} | {seconds:>10.2f} | {seconds * 1000 / args.groups:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmarks how run_producer.py / run_consumer.py notice that a migration
+process has exited, before and after the shared ProcessWatcher.
+
+Every method thread runs a chain of short dummy jobs back to back, the same
+way run_migration() does: launch, wait for the process to exit, pop the
+next panel. The dummy job records its own exit time so we can measure the
+gap between a process finishing and the next launch for that method.
+
+    python3 benchmarks/bench_process_completion.py --methods 18 --jobs 4
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.process_watcher import ProcessWatcher
+
+JOB = "import sys, time; time.sleep(float(sys.argv[1])); print(repr(time.time()), flush=True)"
+
+
+class Counter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def incr(self):
+        with self.lock:
+            self.value += 1
+
+
+def legacy_wait(pid, ps_forks, check_interval=1):
+    """The pre-watcher wait_for_process_to_complete() plus the trailing sleep(1)."""
+    while True:
+        ps_forks.incr()
+        result = subprocess.run(["ps", str(pid)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if str(pid) not in result.stdout.decode():
+            break
+        time.sleep(check_interval)
+    time.sleep(1)
+
+
+def run_method(durations, wait, gaps, ps_forks):
+    previous_exit = None
+    for duration in durations:
+        launched_at = time.time()
+        if previous_exit is not None:
+            gaps.append(launched_at - previous_exit)
+        process = subprocess.Popen([sys.executable, "-c", JOB, str(duration)], stdout=subprocess.PIPE, text=True)
+        # mongo_migration.sh's java child is reaped by the shell, mimic that so `ps` stops seeing it
+        output = {}
+        reaper = threading.Thread(target=lambda: output.update(exit=float(process.communicate()[0])), daemon=True)
+        reaper.start()
+        wait(process.pid, ps_forks)
+        reaper.join()
+        previous_exit = output["exit"]
+
+
+def run(label, wait, methods, jobs, min_duration, max_duration):
+    gaps = []
+    ps_forks = Counter()
+    threads = []
+    started = time.monotonic()
+    for m in range(methods):
+        durations = [min_duration + (max_duration - min_duration) * ((m * jobs + j) % 7) / 6 for j in range(jobs)]
+        thread = threading.Thread(target=run_method, args=(durations, wait, gaps, ps_forks))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    gaps.sort()
+    return {
+        "approach": label,
+        "wall_s": round(elapsed, 2),
+        "ps_forks": ps_forks.value,
+        "ps_forks_per_s": round(ps_forks.value / elapsed, 2),
+        "gap_mean_ms": round(statistics.mean(gaps) * 1000, 1),
+        "gap_p95_ms": round(gaps[int(len(gaps) * 0.95) - 1] * 1000, 1),
+        "gap_max_ms": round(gaps[-1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--methods", type=int, default=18, help="concurrent method threads (9 producer + 9 consumer)")
+    parser.add_argument("--jobs", type=int, default=4, help="panels processed back to back per method")
+    parser.add_argument("--min-duration", type=float, default=0.5)
+    parser.add_argument("--max-duration", type=float, default=3.0)
+    args = parser.parse_args()
+
+    watcher = ProcessWatcher()
+    results = [
+        run("ps polling (before)", legacy_wait, args.methods, args.jobs, args.min_duration, args.max_duration),
+        run("ProcessWatcher (after)", lambda pid, _: watcher.wait(pid), args.methods, args.jobs, args.min_duration, args.max_duration),
+    ]
+
+    columns = list(results[0])
+    print(" | ".join(f"{c:>22}" if i == 0 else f"{c:>14}" for i, c in enumerate(columns)))
+    for row in results:
+        print(" | ".join(f"{row[c]!s:>22}" if i == 0 else f"{row[c]!s:>14}" for i, c in enumerate(columns)))
+
+
+if __name__ == "__main__":
+    main()
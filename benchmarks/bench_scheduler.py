@@ -0,0 +1,215 @@
+"""
+Benchmarks run_producer.py, run_consumer.py and kill_consumer.py end to end
+against a local redis-server, with fake_mongo_migration.py standing in for
+mongo_migration.sh, so the real launch, registration, completion and kill
+paths run instead of the LOG_LEVEL == "DEBUG" shortcuts:
+
+    redis-server --port 6390 --save "" --daemonize yes
+    python3 benchmarks/bench_scheduler.py --redis-port 6390 --panels 100,1000,10000 --slots 16
+
+For every wave the redis db is flushed and N synthetic panels are queued for
+one read method and its write method the way push_panels_to_redis.py queues
+them. The three scripts are started on a generated property file and the wave
+runs until the producer and the consumer entry of every panel is completed.
+
+Panel durations are sampled from --durations (the output of
+get_execution_time_mins_from_log_files.py) scaled by --time-scale, or from a
+lognormal around --median-sec. Reported per wave: the makespan, the launch
+latency (spawn + pid registration, from the orchestration_timing histograms),
+the kill latency of kill_consumer.py and the CPU seconds of every script,
+without the migration processes they started.
+"""
+import argparse
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import psutil
+import redis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules.codec import encode_item, decode_status
+from modules.migration_methods import producer_consumer_methods_map
+from modules.phase_timer import get_timings, KILL_TOTAL_PHASE
+from modules.work_queue import enqueue
+
+FAKE_MIGRATION = os.path.join(ROOT, "benchmarks", "fake_mongo_migration.py")
+# kill_consumer.py reading the offsets FAKE_MIGRATION keeps in redis
+FAKE_KILL_CONSUMER = os.path.join(ROOT, "benchmarks", "fake_kill_consumer.py")
+POLL_INTERVAL_SEC = 0.5
+STOP_TIMEOUT_SEC = 30
+
+
+def write_environment(work_dir: str, args) -> str:
+    """The wrapper script, its `java` and the property file of a wave, returns the property file."""
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    java = os.path.join(bin_dir, "java")
+    if not os.path.exists(java):
+        # the orchestrators look for a process named java under the script
+        os.symlink(sys.executable, java)
+    script = os.path.join(work_dir, "mongo_migration.sh")
+    with open(script, "w") as f:
+        f.write(f'#!/bin/sh\n"{java}" "{FAKE_MIGRATION}" "$@"\n')
+    os.chmod(script, 0o755)
+
+    properties = {
+        "redis_uri": args.redis_host,
+        "redis_port": args.redis_port,
+        "redis_db": args.redis_db,
+        "kafka_bootstrap_servers": "localhost:9092",
+        # the drain of a consumer is confirmed over its samples, taken at the benchmark's time scale
+        "offset_history_interval_sec": 1,
+        "migration_script": script,
+        "custom_property_file_migration_script": script,
+        "log_level": "INFO",
+        "env": "bench",
+        "fake_migration_median_sec": args.median_sec,
+        "fake_migration_sigma": args.sigma,
+        "fake_migration_time_scale": args.time_scale,
+    }
+    if args.durations:
+        properties["fake_migration_durations"] = os.path.abspath(args.durations)
+    property_file = os.path.join(work_dir, "mongoremodel.properties")
+    with open(property_file, "w") as f:
+        f.writelines(f"{key}={value}\n" for key, value in properties.items())
+    return property_file
+
+
+def queue_panels(r, count: int, read_method: str, write_method: str, median_uids: int, seed: int) -> list:
+    rng = random.Random(seed)
+    panels = [f"benchpanel{i:05d}" for i in range(count)]
+    producer_items, consumer_items = [], []
+    for panel_name in panels:
+        panel_data = {"panel_name": panel_name, "start_uid": 1, "end_uid": int(rng.lognormvariate(0, 1) * median_uids) + 1}
+        producer_items.append((encode_item(panel_data), panel_data))
+        consumer_data = {"panel_name": panel_name}
+        consumer_items.append((encode_item(consumer_data), consumer_data))
+    enqueue(r, read_method, producer_items)
+    enqueue(r, write_method, consumer_items)
+    return panels
+
+
+def count_completed(r, panels: list, read_method: str, write_method: str) -> int:
+    pipe = r.pipeline(transaction=False)
+    for panel_name in panels:
+        pipe.hget("producer_" + panel_name, read_method)
+        pipe.hget("consumer_" + panel_name, write_method)
+    return sum(1 for value in pipe.execute() if value and decode_status(value).get("status") == "completed")
+
+
+def get_cpu_sec(process: subprocess.Popen) -> float:
+    try:
+        cpu = psutil.Process(process.pid).cpu_times()
+        return round(cpu.user + cpu.system, 2)
+    except psutil.NoSuchProcess:
+        return None
+
+
+def stop(processes: dict):
+    for process in processes.values():
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    deadline = time.monotonic() + STOP_TIMEOUT_SEC
+    for process in processes.values():
+        try:
+            process.wait(max(deadline - time.monotonic(), 0.1))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    # kill_consumer.py has no SIGTERM handler of its own, clean up what the wave left running
+    for proc in psutil.process_iter(["cmdline"]):
+        if FAKE_MIGRATION in (proc.info["cmdline"] or []):
+            proc.kill()
+
+
+def phase_stat(timings: dict, phase: str, stat: str):
+    return timings.get(phase, {}).get(stat)
+
+
+def run_wave(args, count: int, work_dir: str) -> dict:
+    property_file = write_environment(work_dir, args)
+    r = redis.Redis(host=args.redis_host, port=args.redis_port, db=args.redis_db)
+    r.flushdb()
+    write_method = producer_consumer_methods_map[args.method]
+    panels = queue_panels(r, count, args.method, write_method, args.median_uids, args.seed)
+    panels_file = os.path.join(work_dir, "panels.txt")
+    with open(panels_file, "w") as f:
+        f.writelines(panel_name + "\n" for panel_name in panels)
+
+    env = dict(os.environ, PROPERTY_FILE=property_file)
+    commands = {
+        "run_producer": [sys.executable, "run_producer.py", os.path.join(work_dir, "producer.log"), "--methods", args.method, "--slots", str(args.slots)],
+        "run_consumer": [sys.executable, "run_consumer.py", os.path.join(work_dir, "consumer.log"), "--methods", write_method, "--slots", str(args.slots)],
+        "kill_consumer": [sys.executable, FAKE_KILL_CONSUMER, panels_file, os.path.join(work_dir, "kill_consumer.log"), "bench"],
+    }
+    started = time.monotonic()
+    processes = {name: subprocess.Popen(command, cwd=ROOT, env=env) for name, command in commands.items()}
+
+    expected = 2 * count
+    completed = 0
+    try:
+        while completed < expected and time.monotonic() - started < args.timeout:
+            time.sleep(POLL_INTERVAL_SEC)
+            exited = [name for name, process in processes.items() if process.poll() is not None]
+            if exited:
+                raise RuntimeError(f"{', '.join(exited)} exited early, see the logs in {work_dir}")
+            completed = count_completed(r, panels, args.method, write_method)
+        makespan = time.monotonic() - started
+        cpu = {name: get_cpu_sec(process) for name, process in processes.items()}
+    finally:
+        stop(processes)
+
+    producer_timings = get_timings(r, args.method)
+    consumer_timings = get_timings(r, write_method)
+    launches = [phase_stat(timings, phase, "sum") or 0 for timings in (producer_timings, consumer_timings) for phase in ("spawn", "registration")]
+    runs = sum(phase_stat(timings, "registration", "count") or 0 for timings in (producer_timings, consumer_timings))
+    return {
+        "panels": count,
+        "completed": f"{completed}/{expected}",
+        "makespan_s": round(makespan, 1),
+        "launch_avg_ms": round(sum(launches) * 1000 / runs, 1) if runs else None,
+        "registration_p95_s": phase_stat(producer_timings, "registration", "p95"),
+        "kill_avg_s": phase_stat(consumer_timings, KILL_TOTAL_PHASE, "avg"),
+        "producer_cpu_s": cpu["run_producer"],
+        "consumer_cpu_s": cpu["run_consumer"],
+        "kill_cpu_s": cpu["kill_consumer"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", default="100,1000,10000", help="comma-separated wave sizes")
+    parser.add_argument("--method", default="readUserAttributes", help="read method to queue the panels for, with its write method")
+    parser.add_argument("--slots", type=int, default=16, help="slots of each of run_producer.py and run_consumer.py")
+    parser.add_argument("--durations", default=None, help="recorded panel durations, the output of get_execution_time_mins_from_log_files.py")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="factor applied to every sampled duration")
+    parser.add_argument("--median-sec", type=float, default=1.0, help="median panel duration without --durations")
+    parser.add_argument("--sigma", type=float, default=1.0, help="sigma of the lognormal durations without --durations")
+    parser.add_argument("--median-uids", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds after which a wave is cut short")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=15, help="flushed before every wave")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_scheduler_") as work_dir:
+        for count in [int(count) for count in args.panels.split(",")]:
+            results.append(run_wave(args, count, work_dir))
+
+    columns = list(results[0])
+    print(" | ".join(f"{c:>18}" for c in columns))
+    for row in results:
+        print(" | ".join(f"{row[c]!s:>18}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
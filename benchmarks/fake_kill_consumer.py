@@ -0,0 +1,62 @@
+"""
+Runs kill_consumer.py against the offsets fake_mongo_migration.py keeps in
+redis instead of kafka, for the benchmarks without a broker:
+
+    fake_kill_consumer.py [<panels_file_path>] <log_file_path> <current_env>
+
+It takes the arguments of kill_consumer.py and only swaps its offset reader
+for RedisOffsetReader, everything else runs the real code.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kill_consumer
+
+# hash of current:<partition> / end:<partition> -> offset per consumer group,
+# the one benchmarks/fake_mongo_migration.py writes
+REDIS_OFFSETS_KEY_PREFIX = "kafka_offsets:"
+
+
+class RedisOffsetReader:
+    """Stand-in for modules.kafka_offsets.KafkaOffsetReader reading the kafka_offsets:<group> hashes."""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+
+    def get_offsets(self, topic_groups) -> dict:
+        """The offsets of every (topic, group) pair in the format of KafkaOffsetReader.get_offsets()."""
+        topic_groups = list(topic_groups)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for _, group_name in topic_groups:
+            pipe.hgetall(REDIS_OFFSETS_KEY_PREFIX + group_name)
+
+        offsets = {}
+        for topic_group, fields in zip(topic_groups, pipe.execute()):
+            current, end = parse_offsets(fields)
+            offsets[topic_group] = {
+                "current": current,
+                "end": end,
+                "lag": sum(max(end[partition] - current[partition], 0) for partition in end)
+            }
+        return offsets
+
+    def close(self):
+        pass
+
+
+def parse_offsets(fields: dict) -> tuple:
+    """(current, end) {partition: offset} of a kafka_offsets:<group> hash, partitions never consumed at 0."""
+    current, end = {}, {}
+    for field, value in fields.items():
+        if isinstance(field, bytes):
+            field = field.decode()
+        kind, partition = field.split(":", 1)
+        (current if kind == "current" else end)[int(partition)] = int(value)
+    return {partition: current.get(partition, 0) for partition in end}, end
+
+
+if __name__ == "__main__":
+    kill_consumer.offset_reader_factory = lambda: RedisOffsetReader(kill_consumer.redis_client)
+    kill_consumer.main(sys.argv)
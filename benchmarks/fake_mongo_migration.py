@@ -0,0 +1,177 @@
+"""
+Local stand-in for mongo_migration.sh, to run the orchestrators, kill_consumer.py
+and the smart_migration APIs against a plain redis-server without mongo or kafka.
+
+    fake_mongo_migration.py <method> <panel> [<start_uid> <end_uid>] [<custom_property_file>]
+
+It takes the arguments of the real script and registers itself the same way:
+an entry {"pid", "status", "topic_name", "group_name", "env", ...} in the
+method's field of producer_<panel> / consumer_<panel>.
+
+A read method sleeps for a duration sampled from recorded panel durations
+(the output of get_execution_time_mins_from_log_files.py, property
+fake_migration_durations) scaled by fake_migration_time_scale, or from a
+lognormal around fake_migration_median_sec without one. Meanwhile it grows the
+log end offsets of its topic, kept in redis under kafka_offsets:<group>, and
+marks itself completed when done. A write method follows the end offsets of
+its topic until it is stopped with SIGTERM, as kill_consumer.py does with the
+real consumers (run kill_consumer.py through fake_kill_consumer.py).
+
+The orchestrators find the migration process by name, run this through a
+`java` symlink to python from a wrapper script for the launch path to be the
+one of production, see bench_scheduler.py.
+"""
+import os
+import random
+import signal
+import sys
+import time
+from datetime import datetime
+
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# one python start per panel, so nothing that pulls in kafka: the keys of
+# fake_kill_consumer.py and modules.orchestrator are spelled out here
+from modules.codec import encode_status
+from modules.migration_methods import consumer_producer_methods_map
+
+REDIS_OFFSETS_KEY_PREFIX = "kafka_offsets:"
+PROPERTY_FILE = os.getenv("PROPERTY_FILE", "/etc/mongoremodel.properties")
+PARTITIONS = 3
+# seconds between two offset updates, at most
+UPDATE_INTERVAL_SEC = 1.0
+DEFAULT_MEDIAN_SEC = 1.0
+DEFAULT_SIGMA = 1.0
+DEFAULT_MESSAGES = 100000
+
+stopping = False
+
+
+def read_properties(path: str) -> dict:
+    properties = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                properties[key.strip()] = value.strip()
+    return properties
+
+
+def get_redis_offsets(r, offsets_key: str) -> tuple:
+    """(current, end) {partition: offset}, as fake_kill_consumer.RedisOffsetReader reads them."""
+    current, end = {}, {}
+    for field, value in r.hgetall(offsets_key).items():
+        kind, partition = field.decode().split(":", 1)
+        (current if kind == "current" else end)[int(partition)] = int(value)
+    return current, end
+
+
+def load_durations(path: str, method: str) -> list:
+    """Recorded durations in seconds of the method's panels, of all panels if none is of the method."""
+    from modules.eta import split_log_name
+
+    durations, own = [], []
+    with open(path) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) < 2 or not parts[1].isdigit():
+                continue
+            try:
+                seconds = (datetime.fromisoformat(parts[3]) - datetime.fromisoformat(parts[2])).total_seconds()
+            except (IndexError, ValueError):
+                seconds = int(parts[1]) * 60
+            durations.append(seconds)
+            if split_log_name(parts[0])[1] == method:
+                own.append(seconds)
+    return own or durations
+
+
+def sample_duration(config: dict, method: str) -> float:
+    scale = float(config.get("fake_migration_time_scale", 1))
+    if config.get("fake_migration_durations"):
+        durations = load_durations(config["fake_migration_durations"], method)
+        if durations:
+            return random.choice(durations) * scale
+    median = float(config.get("fake_migration_median_sec", DEFAULT_MEDIAN_SEC))
+    return random.lognormvariate(0, float(config.get("fake_migration_sigma", DEFAULT_SIGMA))) * median * scale
+
+
+def handle_sigterm(signum, frame):
+    global stopping
+    stopping = True
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) < 2:
+        print("usage: fake_mongo_migration.py <method> <panel> [<start_uid> <end_uid>] [<custom_property_file>]")
+        sys.exit(1)
+    method, panel_name = args[0], args[1]
+    uids = [int(arg) for arg in args[2:] if arg.isdigit()]
+    custom_property_file = next((arg for arg in args[2:] if not arg.isdigit()), None)
+    config = read_properties(custom_property_file or PROPERTY_FILE)
+
+    r = redis.Redis(host=config['redis_uri'], port=int(config['redis_port']), db=int(config.get('redis_db', 0)))
+    read_method = consumer_producer_methods_map.get(method, method)
+    topic_name = f"{panel_name}_{read_method}"
+    group_name = f"{topic_name}_grp"
+    offsets_key = REDIS_OFFSETS_KEY_PREFIX + group_name
+    is_producer = method.startswith("read")
+    status_key = ("producer_" if is_producer else "consumer_") + panel_name
+
+    status = {
+        "pid": os.getpid(), "status": "running", "topic_name": topic_name, "group_name": group_name,
+        "env": config.get("env", "local"), "start_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+        "update_time": None, "current_producer_offset": 0, "current_consumer_offset": 0, "prev_lag": 0, "current_lag": 0,
+    }
+
+    def update(state: str = None):
+        if state:
+            status["status"] = state
+        current, end = get_redis_offsets(r, offsets_key)
+        status["update_time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        status["prev_lag"] = status["current_lag"]
+        status["current_producer_offset"] = sum(end.values())
+        status["current_consumer_offset"] = sum(current.values())
+        status["current_lag"] = status["current_producer_offset"] - status["current_consumer_offset"]
+        if is_producer and len(uids) == 2:
+            # every uid of the range becomes one message, the progress a checkpoint resumes from
+            status["last_uid"] = min(uids[0] + status["current_producer_offset"], uids[1] + 1) - 1
+        r.hset(status_key, method, encode_status(status))
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    update()
+
+    if is_producer:
+        duration = sample_duration(config, method)
+        messages = uids[1] - uids[0] + 1 if len(uids) == 2 else DEFAULT_MESSAGES
+        per_partition = max(messages // PARTITIONS, 1)
+        started = time.monotonic()
+        produced = 0
+        while not stopping:
+            elapsed = time.monotonic() - started
+            target = per_partition if elapsed >= duration else int(per_partition * elapsed / duration)
+            if target > produced:
+                r.hset(offsets_key, mapping={f"end:{partition}": target for partition in range(PARTITIONS)})
+                produced = target
+            if elapsed >= duration:
+                break
+            update()
+            time.sleep(min(UPDATE_INTERVAL_SEC, duration - elapsed))
+        update("killed" if stopping else "completed")
+        sys.exit(143 if stopping else 0)
+
+    # the consumer catches up with the end offsets one interval late, kill_consumer.py stops it
+    while not stopping:
+        _, end = get_redis_offsets(r, offsets_key)
+        if end:
+            r.hset(offsets_key, mapping={f"current:{partition}": offset for partition, offset in end.items()})
+        update()
+        time.sleep(UPDATE_INTERVAL_SEC)
+
+
+if __name__ == "__main__":
+    main()
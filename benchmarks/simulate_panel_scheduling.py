@@ -0,0 +1,109 @@
+"""
+Simulates the makespan of one method's queue under the old FIFO order and
+under longest-job-first with and without the small-panel express lane.
+
+Panel sizes come from a `panel,max_uid` file, one line per panel with the
+max uid modules.uid_ranges.get_max_uid() finds for it (what
+push_panels_to_redis.py looks up through get_max_uids()), so the real
+distribution of a wave can be replayed:
+
+    python3 benchmarks/simulate_panel_scheduling.py --panels max_uids.csv --slots 4 --express 1
+
+Without --panels a heavy-tailed (lognormal) distribution is generated. The
+run time of a panel is modelled as a fixed startup cost plus its uid range
+at a constant rate, which is what estimate_work() assumes as well.
+"""
+import argparse
+import heapq
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.work_queue import estimate_work
+
+
+def load_panels(path: str) -> list:
+    panels = []
+    with open(path) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) == 2 and parts[1].isdigit():
+                # same uid range get_panel_items() of push_panels_to_redis.py queues for a max uid
+                panels.append((parts[0], {"start_uid": 1, "end_uid": int(int(parts[1]) * 1.1)}))
+    return panels
+
+
+def generate_panels(count: int, median_uids: float, sigma: float, seed: int) -> list:
+    rng = random.Random(seed)
+    return [(f"panel{i}", {"start_uid": 1, "end_uid": int(rng.lognormvariate(0, sigma) * median_uids) + 1}) for i in range(count)]
+
+
+def simulate(panels: list, slots: int, express_slots: int, express_max_work: float, order: str, startup_sec: float, uids_per_sec: float) -> dict:
+    """
+    Runs the queue on `slots` regular slots and `express_slots` express
+    slots, returns the makespan and the completion time of every panel.
+    """
+    queue = [(name, estimate_work(data)) for name, data in panels]
+    if order == "longest":
+        queue.sort(key=lambda panel: -panel[1])
+
+    # (time the slot is free, slot id, is express)
+    workers = [(0.0, n, False) for n in range(slots)] + [(0.0, slots + n, True) for n in range(express_slots)]
+    heapq.heapify(workers)
+    completions = {}
+    while queue and workers:
+        free_at, slot, express = heapq.heappop(workers)
+        if express:
+            eligible = [i for i, (_, work) in enumerate(queue) if express_max_work is None or work <= express_max_work]
+            if not eligible:
+                # nothing small is left, the express slot stays idle
+                continue
+            index = min(eligible, key=lambda i: queue[i][1])
+        else:
+            index = 0
+        name, work = queue.pop(index)
+        done_at = free_at + startup_sec + work / uids_per_sec
+        completions[name] = (work, done_at)
+        heapq.heappush(workers, (done_at, slot, express))
+
+    return {"makespan": max(done_at for _, done_at in completions.values()), "completions": completions}
+
+
+def summarize(label: str, result: dict, small_work: float):
+    done = [done_at for _, done_at in result["completions"].values()]
+    small = sorted(done_at for work, done_at in result["completions"].values() if work <= small_work)
+    small_p95 = small[int(len(small) * 0.95) - 1] if small else 0
+    print(f"{label:<34} makespan={result['makespan'] / 3600:8.2f}h  mean_done={statistics.mean(done) / 3600:8.2f}h  "
+          f"small_p50={statistics.median(small) / 3600 if small else 0:8.2f}h  small_p95={small_p95 / 3600:8.2f}h")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Makespan of FIFO vs longest-job-first panel scheduling.")
+    parser.add_argument("--panels", help="File of panel,max_uid lines", default=None)
+    parser.add_argument("--count", type=int, default=500, help="Number of generated panels without --panels")
+    parser.add_argument("--median-uids", type=float, default=2_000_000)
+    parser.add_argument("--sigma", type=float, default=1.6, help="Spread of the generated lognormal sizes")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--slots", type=int, default=4, help="Slots of the method")
+    parser.add_argument("--express", type=int, default=1, help="Express slots on top of --slots")
+    parser.add_argument("--express-max-work", type=float, default=None, help="Biggest panel (uids) for the express lane, default is the median panel")
+    parser.add_argument("--startup-sec", type=float, default=30, help="Fixed cost of one migration process")
+    parser.add_argument("--uids-per-sec", type=float, default=5000)
+    args = parser.parse_args()
+
+    panels = load_panels(args.panels) if args.panels else generate_panels(args.count, args.median_uids, args.sigma, args.seed)
+    works = sorted(estimate_work(data) for _, data in panels)
+    express_max_work = args.express_max_work or statistics.median(works)
+    total_slots = args.slots + args.express
+    print(f"{len(panels)} panels, median {statistics.median(works):.0f} uids, max {works[-1]:.0f} uids, "
+          f"biggest panel alone takes {(args.startup_sec + works[-1] / args.uids_per_sec) / 3600:.2f}h")
+    print(f"small panels: <= {express_max_work:.0f} uids\n")
+
+    common = (args.startup_sec, args.uids_per_sec)
+    summarize(f"fifo, {total_slots} slots", simulate(panels, total_slots, 0, None, "fifo", *common), express_max_work)
+    summarize(f"longest first, {total_slots} slots", simulate(panels, total_slots, 0, None, "longest", *common), express_max_work)
+    if args.express:
+        summarize(f"longest first, {args.slots}+{args.express} express", simulate(panels, args.slots, args.express, express_max_work, "longest", *common), express_max_work)
@@ -1,44 +1,76 @@
-import os
 import sys
-from datetime import datetime
+import redis
+from modules.eta import get_log_durations, split_log_name, add_observation
 
-def get_timestamp(line):
+PROPERTY_FILE = "/etc/mongoremodel.properties"
+config_dict = {}
+
+def read_property_file() -> tuple[bool, dict]:
+    """
+    Reads the property file and returns its contents as a dictionary.
+
+    Returns:
+        tuple: (success: bool, result: dict)
+            - success: True if file was read successfully, False otherwise
+            - result: Dictionary containing property file contents or error message
+    """
     try:
-        ts_str = " ".join(line.strip().split()[:2])
-        return datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-    except Exception:
-        return None
+        global config_dict
+        config_dict = {}
+
+        with open(PROPERTY_FILE, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    if '=' in line:
+                        key, value = line.split('=', 1)
+                        config_dict[key.strip()] = value.strip()
+        return True, config_dict
+    except Exception as e:
+        return False, f"Failed to read property file: {str(e)}"
+
+def read_max_uids(csv_file_name):
+    """panel -> max uid, from a <panel>,<max uid> csv of the max uids modules.uid_ranges.get_max_uid() looks up."""
+    max_uids = {}
+    with open(csv_file_name, "r") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) == 2 and parts[1].isdigit():
+                max_uids[parts[0]] = int(parts[1])
+    return max_uids
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python3 get_execution_time_mins_from_log_files.py <source_folder> <output_file>")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python3 get_execution_time_mins_from_log_files.py <source_folder> <output_file> [<panels_max_uid_csv>]")
+        print("       with the csv, the durations also seed the ETA model of every method in redis")
         sys.exit(1)
 
     source_folder = sys.argv[1]
     output_file = sys.argv[2]
 
-    with open(output_file, "w") as out_file:
-        for fname in os.listdir(source_folder):
-            if not fname.startswith("debug-") or not fname.endswith(".log"):
-                continue
-
-            file_path = os.path.join(source_folder, fname)
-            with open(file_path, "r") as f:
-                lines = f.readlines()
-
-            if not lines:
-                continue
-
-            first_ts = get_timestamp(lines[0])
-            last_ts = get_timestamp(lines[-1])
-
-            name_part = fname.replace("debug-", "").replace(".log", "")
+    redis_client = None
+    max_uids = {}
+    if len(sys.argv) == 4:
+        max_uids = read_max_uids(sys.argv[3])
+        read_property_file()
+        redis_client = redis.Redis(host=config_dict['redis_uri'], port=int(config_dict['redis_port']), db=int(config_dict.get('redis_db', 0)))
 
+    seeded = 0
+    with open(output_file, "w") as out_file:
+        for name_part, first_ts, last_ts in get_log_durations(source_folder):
             if first_ts and last_ts:
                 diff_minutes = int((last_ts - first_ts).total_seconds() / 60)
                 out_file.write(f"{name_part},{diff_minutes},{first_ts},{last_ts}\n")
+
+                panel, method = split_log_name(name_part)
+                if redis_client is not None and method and panel in max_uids:
+                    add_observation(redis_client, method, max_uids[panel], (last_ts - first_ts).total_seconds())
+                    seeded += 1
             else:
                 out_file.write(f"{name_part},ERROR,,\n")
 
+    if redis_client is not None:
+        print(f"seeded the ETA models with {seeded} panel durations")
+
 if __name__ == "__main__":
     main()
@@ -1,16 +1,23 @@
 import redis
-import json
+import os
 import time
-import subprocess
-import re
-import logging
-from datetime import datetime
 import sys
-import psutil
+import socket
+
+from modules.migration_methods import consumer_producer_methods_map
+from modules.codec import decode_status
+from modules.uid_ranges import get_chunks_key
+from modules.orchestrator import get_running_slots
+from modules.phase_timer import PhaseTimer
+from modules.kafka_offsets import KafkaOffsetReader
+from modules.offset_history import OffsetHistory, SOURCE_STATUS, SOURCE_KAFKA
+from modules.termination_tracker import TerminationTracker, DEFAULT_GRACE_SEC
+from modules.status_events import StatusEvents, enable_keyspace_events, get_panel_name
+from modules.log_utils import setup_logger, log_message, get_log_settings
 
 TIME_GAP_BETWEEN_CHECKS_SECS = 2 # 5*60
 
-PROPERTY_FILE = "/etc/mongoremodel.properties"
+PROPERTY_FILE = os.getenv("PROPERTY_FILE", "/etc/mongoremodel.properties")
 config_dict = {}
 
 def read_property_file() -> tuple[bool, dict]:
@@ -46,288 +53,320 @@ redis_config = {
 }
 
 KAFKA_BROKER = config_dict['kafka_bootstrap_servers']
+# draining consumers are checked between these intervals, see get_next_check_interval()
+MIN_CHECK_INTERVAL_SEC = float(config_dict.get('kill_consumer_min_check_interval_sec', TIME_GAP_BETWEEN_CHECKS_SECS))
+MAX_CHECK_INTERVAL_SEC = float(config_dict.get('kill_consumer_max_check_interval_sec', 60))
+# every consumer is looked at this often anyway, keyspace events get lost while disconnected
+SWEEP_INTERVAL_SEC = float(config_dict.get('kill_consumer_sweep_interval_sec', 300))
+
+# one pooled client for the whole process, every cycle reads and writes through pipelines
+redis_client = redis.Redis(host=redis_config['redis_host'], port=redis_config['redis_port'], db=redis_config['redis_db'], decode_responses=True)
+
+offset_reader = None
+# creates what get_offsets_snapshot() reads the offsets with, benchmarks/fake_kill_consumer.py swaps in its own
+offset_reader_factory = lambda: KafkaOffsetReader(KAFKA_BROKER)
+offset_history = OffsetHistory.from_properties(config_dict)
+termination_tracker = TerminationTracker(redis_client, float(config_dict.get('kill_consumer_termination_grace_sec', DEFAULT_GRACE_SEC)))
+
+def get_offsets_snapshot(topic_groups):
+    """
+    {group: (current offsets, log end offsets)} of all (topic, group) pairs of
+    the consumers whose producer is done, read once per cycle in a few
+    batched requests for their produced == consumed check and their offset
+    history.
+    """
+    global offset_reader
+    if not topic_groups:
+        return {}
 
-def setup_logger(log_file_path):
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(message)s",
-        handlers=[
-            logging.FileHandler(log_file_path, mode="a")
-        ]
-    )
-
-def log_message(level: str, data: dict):
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    log_level = level.upper()
-    log_details = " ".join([f"[{key}:{val}]" for key, val in data.items()])
-    message = f"{timestamp} {log_level} {log_details}"
-    
-    if log_level == "DEBUG":
-        logging.debug(message)
-    elif log_level == "INFO":
-        logging.info(message)
-    elif log_level == "WARNING":
-        logging.warning(message)
-    elif log_level == "ERROR":
-        logging.error(message)
-    elif log_level == "CRITICAL":
-        logging.critical(message)
-    else:
-        logging.info(message)
-
-def get_kafka_offsets(group_name, bootstrap_server="172.31.23.48:9092"):
     try:
-        cmd = f"/usr/local/kafka_2.13-2.6.2/bin/kafka-consumer-groups.sh --bootstrap-server {bootstrap_server} --group {group_name} --describe"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            log_message('ERROR', {'msg': 'Failed to run command', 'command': result.stderr.strip()})
-            return None, None
-
-        lines = result.stdout.split("\n")
-        current_offsets = {}
-        log_end_offsets = {}
-
-        regex_pattern = re.compile(rf"{group_name}\s+(\S+)\s+(\d+)\s+(\d+)\s+(\d+)\s+\d+")
+        if offset_reader is None:
+            offset_reader = offset_reader_factory()
+        offsets = offset_reader.get_offsets(topic_groups)
+    except Exception as e:
+        log_message('ERROR', {'msg': 'Error occurred while getting kafka offsets', 'err': str(e), 'groups': len(topic_groups)})
+        if offset_reader is not None:
+            offset_reader.close()
+            offset_reader = None
+        return {}
+    return {group_name: (data["current"], data["end"]) for (_, group_name), data in offsets.items() if data["end"]}
+
+def get_is_status_completed(producer_entries, key, field, chunks):
+    """
+    Whether the producer `field` of the `key` hash is done, from the hash as
+    read this cycle (`producer_entries`) and the panel's migration_chunks hash.
+    """
+    try:
+        value = producer_entries.get(field)
+        if not value:
+            log_message('ERROR', {'msg': f'No data found for key: {key}', 'field': field})
+            return False
 
-        for line in lines:
-            match = regex_pattern.search(line)
-            if match:
-                topic, partition, current_offset, log_end_offset = match.groups()
-                partition = int(partition)
-                current_offsets[partition] = int(current_offset)
-                log_end_offsets[partition] = int(log_end_offset)
+        data = decode_status(value)
 
-        if not current_offsets or not log_end_offsets:
-            log_message('WARNING', {'msg': 'No offsets found.', 'group_name': group_name})
-            return None, None
+        # a panel split into uid ranges is completed only once all of its ranges are
+        remaining_chunks = max(int(chunks.get(field) or 0), 0)
+        if remaining_chunks:
+            log_message('INFO', {'msg': 'producer still has uid ranges to migrate', 'key': key, 'field': field, 'remaining_chunks': remaining_chunks})
+            return False
 
-        return current_offsets, log_end_offsets
+        return (data.get("status") == "completed" or data.get("status") == "killed")
 
     except Exception as e:
-        log_message('ERROR', {'msg': 'Error occurred while getting kafka offsets', 'err': str(e)})
-        return None, None
-
-def get_is_logend_current_offsets_same(end_offsets, consumer_offsets):
-    if end_offsets == consumer_offsets:
-        return True
-    return False
+        log_message('ERROR', {'msg': 'Error while checking the producer status', 'key': key, 'field': field, 'err': e})
+        return False
 
 
-def check_consumer_movement(topic_name):
-    consumer_group = f"{topic_name}_grp"
-    redis_client = redis.Redis(host=redis_config['redis_host'], port=redis_config['redis_port'], db=redis_config['redis_db'])
-    
-    redis_key = f"kafka_offset_tracking:{topic_name}"
-    
-    end_offsets, consumer_offsets = get_kafka_offsets(consumer_group, KAFKA_BROKER)
-    if end_offsets is None or consumer_offsets is None:
-        log_message('WARNING', {'msg': 'Unable to retrieve offsets, skipping...', 'topic': topic_name})
-        return True
+def check_produced_eq_conumed(group_name, offsets_snapshot):
+    consumer_offsets, end_offsets = offsets_snapshot.get(group_name, (None, None))
+    if consumer_offsets is None or end_offsets is None:
+        log_message('WARNING', {'msg': 'No offsets found.', 'group_name': group_name})
+        return False
+    consumed, produced = sum(consumer_offsets.values()), sum(end_offsets.values())
+    log_message('Info', {'msg': f"produced: {produced} consumed: {consumed}", "group": group_name})
+    return consumed == produced
 
-    prev_data = redis_client.get(redis_key)
-    
-    if prev_data is None:
-        redis_client.set(redis_key, json.dumps({"end": end_offsets, "consumer": consumer_offsets}))
-        log_message("INFO", {'msg': 'First-time tracking and considered as moving.', 'topic': topic_name})
-        return True
-
-    prev_data = json.loads(prev_data)
-    prev_data["end"] = {int(k): int(v) for k, v in prev_data["end"].items()}
-    prev_data["consumer"] = {int(k): int(v) for k, v in prev_data["consumer"].items()}
-    
-    if prev_data["end"] != end_offsets or prev_data["consumer"] != consumer_offsets:
-        log_message('INFO', {'msg': 'Consumer is moving, updating Redis', 'topic': topic_name})
-        redis_client.set(redis_key, json.dumps({"end": end_offsets, "consumer": consumer_offsets}))
-        return True
-    else:
-        is_logend_current_offsets_same = get_is_logend_current_offsets_same(end_offsets, consumer_offsets)
-        if is_logend_current_offsets_same:
-            log_message('INFO', {'msg':'current offset reached log end offset', 'topic': topic_name})
-            return False
-        else:
-            log_message('INFO', {'msg': 'logend offset not moving, but consumer offset is moving', 'topic':topic_name})
-            return True
 
+def read_panels(keys):
+    """
+    {consumer key: (consumer hash, producer hash, migration_chunks hash)} of
+    every panel, read with one pipelined HGETALL each.
+    """
+    keys = list(keys)
+    pipe = redis_client.pipeline(transaction=False)
+    for consumer_redis_key in keys:
+        client = consumer_redis_key.removeprefix("consumer_")
+        pipe.hgetall(consumer_redis_key)
+        pipe.hgetall("producer_" + client)
+        pipe.hgetall(get_chunks_key(client))
+    results = pipe.execute()
+    return {consumer_redis_key: tuple(results[i * 3:i * 3 + 3]) for i, consumer_redis_key in enumerate(keys)}
 
-def get_is_status_completed(redis_host, redis_port, redis_db, key, field):
-    try:
-        redis_client = redis.Redis(host=redis_host, port=redis_port, db=redis_db, decode_responses=True)
 
-        value = redis_client.hget(key, field)
-        if not value:
-            log_message('ERROR', {'msg': f'No data found for key: {key}', field: {field}})
-            return False
+def list_consumer_keys(panels):
+    """consumer_<panel> keys of the panels of the panels file, of every panel in redis without one."""
+    if panels is None:
+        return set(redis_client.scan_iter(match="consumer*", count=1000))
+    return {"consumer_" + panel for panel in panels}
 
-        data = json.loads(value)
 
-        if isinstance(data, list):
-            return (data[0].get("status") == "completed" or data[0].get("status") == "killed")
+def get_next_check_interval(stats, is_produced_eq_consumed=False):
+    """
+    Seconds until the drain of a group is checked again: half its time to
+    drain at the current rates (see OffsetHistory), the sample interval while
+    that isn't known and the longest interval once it stalled. A group that
+    consumed everything is checked again once its next sample is due.
+    """
+    if is_produced_eq_consumed and stats is not None:
+        interval = stats['last_sample_time'] + offset_history.interval_sec - time.time()
+    elif stats is None or stats['samples'] < 2:
+        interval = MIN_CHECK_INTERVAL_SEC
+    elif stats['stalled']:
+        interval = MAX_CHECK_INTERVAL_SEC
+    elif stats['time_to_drain_sec'] is None:
+        interval = offset_history.interval_sec
+    else:
+        interval = stats['time_to_drain_sec'] / 2
+    return min(max(interval, MIN_CHECK_INTERVAL_SEC), MAX_CHECK_INTERVAL_SEC)
 
-        return (data.get("status") == "completed" or data.get("status") == "killed")
 
+def check_consumers(keys, draining, known_consumers):
+    """
+    Checks the consumers of the `keys` hashes. Consumers whose producer is
+    done enter `draining` ({(key, field): when to check again}) until their
+    group consumed everything, in the offsets read now and over the last
+    samples of its offset history, and they are stopped. The offsets of the
+    others are not looked at. The offsets of every running consumer go into
+    its group's offset history tagged with their source, the ones it reports
+    in its status entry or the ones read from kafka for the drained consumers.
+    A consumer is stopped on the kafka offsets only.
+    """
+    try:
+        # consumers started by orchestrators on other hosts are stopped by the kill_consumer running there
+        consumer_hosts = {(entry["panel_name"], slot.rsplit(":", 1)[0]): entry["host"] for slots in get_running_slots(redis_client).values() for slot, entry in slots.items()}
     except Exception as e:
-        print(f"[ERROR] {e}")
-        return False
+        log_message('ERROR', {'msg': "error reading running slots of the orchestrators", 'err': e})
+        consumer_hosts = {}
 
-
-def check_if_process_exists(pid):
     try:
-        return psutil.pid_exists(int(pid))
+        panel_hashes = read_panels(keys)
     except Exception as e:
-        log_message('ERROR', {'err': e})
-        return False
-
-    
-producer_consumer_methods_map = {
-    "readUserAttributes": "writeUserAttributes",
-    "readAnonUserAttributes": "writeAnonUserAttributes",
-    "readDisableUserAttributes": "writeDisableUserAttributes",
-    "readEngagementEventsWithMetaKey": "writeEngagementEventsToUserEvents",
-    "readAnonEngagementEventsWithMetaKey": "writeAnonEngagementEventsToAnonUserEvents",
-    "readDisableEngagementEventsWithMetaKey": "writeDisableEngagementEventsToDisabledUserEvents",
-    "readUserDetailsWithMetaKey": "writeUserDetailsToUserEvents",
-    "readAnonUserDetailsWithMetaKey": "writeAnonUserDetailsToAnonUserEvents",
-    "readDisableUserDetailsWithMetaKey": "writeDisableUserDetailsToDisableUserEvents"
-}
-
-consumer_producer_methods_map = {
-    "writeUserAttributes": "readUserAttributes",
-    "writeAnonUserAttributes": "readAnonUserAttributes",
-    "writeDisableUserAttributes": "readDisableUserAttributes",
-    "writeEngagementEventsToUserEvents": "readEngagementEventsWithMetaKey",
-    "writeAnonEngagementEventsToAnonUserEvents": "readAnonEngagementEventsWithMetaKey",
-    "writeDisableEngagementEventsToDisabledUserEvents": "readDisableEngagementEventsWithMetaKey",
-    "writeUserDetailsToUserEvents": "readUserDetailsWithMetaKey",
-    "writeAnonUserDetailsToAnonUserEvents": "readAnonUserDetailsWithMetaKey",
-    "writeDisableUserDetailsToDisableUserEvents": "readDisableUserDetailsWithMetaKey"
-}
-
-def run_command(command):
+        log_message('ERROR', {'msg': "error getting the consumer and producer hashes", 'err': e})
+        return {'panels': 0, 'running_consumers': 0, 'draining': 0, 'stalled': 0, 'killed': 0, 'terminating': termination_tracker.pending()}
+
+    # consumers that don't drain anymore are dropped
+    was_draining = {entry for entry in draining if entry[0] in panel_hashes}
+    for entry in was_draining:
+        del draining[entry]
+
+    running_consumers = 0
+    drained_consumers = []
+    offset_samples = {}
+    for consumer_redis_key, (consumer_entries, producer_entries, chunks) in panel_hashes.items():
+        client = consumer_redis_key.removeprefix("consumer_")
+        known_consumers.discard(consumer_redis_key)
+        for consumer_field, value in consumer_entries.items():
+            try:
+                data = decode_status(value)
+            except Exception as e:
+                log_message('ERROR', {'msg': "error getting data from consumer", 'key':consumer_redis_key, 'field': consumer_field, 'err': e})
+                continue
+            # if data['env'] != current_env:
+            #     continue
+            
+            if data.get('status') != 'running':
+                continue
+
+            consumer_host = consumer_hosts.get((client, consumer_field))
+            if consumer_host and consumer_host != socket.gethostname():
+                continue
+
+            running_consumers += 1
+            known_consumers.add(consumer_redis_key)
+            consumed, produced = data.get('current_consumer_offset'), data.get('current_producer_offset')
+            if isinstance(consumed, int) and isinstance(produced, int) and consumed >= 0 and produced >= 0:
+                offset_samples[data['group_name']] = (consumed, produced, SOURCE_STATUS)
+            # stopped already, its status is marked once it exited
+            if termination_tracker.is_terminating(consumer_redis_key, consumer_field):
+                continue
+            status_check_started = time.monotonic()
+            is_status_completed = get_is_status_completed(producer_entries, "producer_" + client, consumer_producer_methods_map.get(consumer_field), chunks)
+            if is_status_completed:
+                drained_consumers.append((consumer_redis_key, consumer_field, data, time.monotonic() - status_check_started))
+
+    # offsets of the consumers whose producer is done, read after the producer statuses
+    # so a producer seen as completed has no offsets left that the snapshot misses
+    topic_groups = set()
+    for _, _, data, _ in drained_consumers:
+        topic_groups.add((data['topic_name'], data['group_name']))
+    offsets_snapshot = get_offsets_snapshot(topic_groups)
+
+    for _, _, data, _ in drained_consumers:
+        consumer_offsets, end_offsets = offsets_snapshot.get(data['group_name'], (None, None))
+        if consumer_offsets is not None and end_offsets is not None:
+            offset_samples[data['group_name']] = (sum(consumer_offsets.values()), sum(end_offsets.values()), SOURCE_KAFKA)
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        return result.stdout.strip()
+        offset_history.record(redis_client, offset_samples)
+        # the snapshot counts even where the history skipped it as too close to the last sample
+        drained_groups = {data['group_name'] for _, _, data, _ in drained_consumers}
+        offset_stats = offset_history.get_stats(redis_client, drained_groups, {group_name: offset_samples[group_name] for group_name in drained_groups if group_name in offset_samples}) if drained_consumers else {}
     except Exception as e:
-        return str(e)
-
-def parse_log_line(log_line):
+        log_message('ERROR', {'msg': "error updating the offset history", 'err': e})
+        offset_stats = {}
+
+    to_kill = []
+    stalled = 0
+    for consumer_redis_key, consumer_field, data, status_check_sec in drained_consumers:
+        timer = PhaseTimer(time.monotonic() - status_check_sec)
+        timer.add("kill_status_check", status_check_sec)
+
+        with timer.phase("kill_offsets_check"):
+            is_produced_eq_consumed = check_produced_eq_conumed(data['group_name'], offsets_snapshot)
+        stats = offset_stats.get(data['group_name'])
+        # stopped once nothing is left to consume in kafka, at once unless the earlier kafka samples
+        # of its window still saw the producer writing
+        if is_produced_eq_consumed and stats and stats['source'] == SOURCE_KAFKA and stats['drained']:
+            to_kill.append((consumer_redis_key, consumer_field, data, timer))
+            continue
+
+        if is_produced_eq_consumed:
+            log_message('INFO', {'msg': 'consumer caught up, waiting for the offset history to confirm', 'topic': data['topic_name'], 'group': data['group_name'], 'samples': stats['samples'] if stats else 0})
+        elif stats and stats['stalled']:
+            stalled += 1
+            log_message('WARNING', {'msg': 'consumer stalled, nothing consumed with lag left', 'topic': data['topic_name'], 'group': data['group_name'], 'lag': stats['lag'], 'samples': stats['samples']})
+        elif stats:
+            log_message('INFO', {'msg': 'consumer draining', 'topic': data['topic_name'], 'lag': stats['lag'], 'consume_rate': stats['consume_rate'], 'time_to_drain_sec': stats['time_to_drain_sec']})
+        draining[(consumer_redis_key, consumer_field)] = time.monotonic() + get_next_check_interval(stats, is_produced_eq_consumed)
+
+    for consumer_redis_key, consumer_field, data, timer in to_kill:
+        termination_tracker.terminate(consumer_redis_key, consumer_field, data, timer)
+
+    return {'panels': len(panel_hashes), 'running_consumers': running_consumers, 'draining': len(drained_consumers) - len(to_kill), 'stalled': stalled, 'killed': len(to_kill), 'terminating': termination_tracker.pending()}
+
+
+def subscribe_status_events():
+    """StatusEvents of the status hashes, None if redis doesn't publish them."""
     try:
-        match = re.search(r'Consumed:\s*(\d+)?\s*Produced:\s*(\d+)?', log_line)
-        if match:
-            consumed = int(match.group(1)) if match.group(1) else None
-            produced = int(match.group(2)) if match.group(2) else None
-            return consumed, produced
-        return None, None
+        if enable_keyspace_events(redis_client):
+            return StatusEvents(redis_client, redis_config['redis_db'])
     except Exception as e:
-        log_message('ERROR', {'msg': f"Error occurred while parsing log line: {log_line}", 'err': str(e)})
-        return None, None
-    
-def check_produced_eq_conumed(group_name):
-    command = """/usr/local/kafka_2.13-2.6.2/bin/kafka-consumer-groups.sh --describe --group """ + group_name + """ --bootstrap-server """ + KAFKA_BROKER + """ | awk -F " " '($4 != "-" && $4 >= 0 && $5 != "-" && $5 >= 0 && $6 != "-" && $6 >= 0){count1 += $4;count2 +=$5;count3 +=$6;d=strftime("%Y-%m-%d %H:%M:%S");} END {print d,"Consumed:",count1, "Produced:",count2,"Lag:",count3;}'"""
-    output = run_command(command)
-    produced, consumed = parse_log_line(output)
-    if produced is None or consumed is None:
-        log_message('Info', {'msg': f"produced: {produced} consumed: {consumed}", "group": group_name})
-        return False
-    elif produced is not None and consumed is not None:
-        log_message('Info', {'msg': f"produced: {produced} consumed: {consumed}", "group": group_name})
-        return consumed == produced
-    else:
-        log_message('ERROR', {'msg': "unable to parse log line", "group": group_name})
-        return False
-
-if __name__ == "__main__":   
-    if len(sys.argv) == 3:
-        log_file_name = sys.argv[1]
-        current_env = sys.argv[2]
-    elif len(sys.argv) == 4:
-        panels_file_path = sys.argv[1]
-        log_file_name = sys.argv[2]
-        current_env = sys.argv[3]
+        log_message('WARNING', {'msg': "error subscribing to the keyspace events, falling back to polling", 'err': e})
+    return None
+
+
+def main(argv):
+    if len(argv) == 3:
+        log_file_name = argv[1]
+        current_env = argv[2]
+    elif len(argv) == 4:
+        panels_file_path = argv[1]
+        log_file_name = argv[2]
+        current_env = argv[3]
     else:
         print('usage: python3 orchestrate.py [<panels_file_path>] <log_file_path> <current_env>')
         exit()
 
-    setup_logger(log_file_name)
-    
-    while True:
-        try:
-            redis_client = redis.Redis(host=redis_config['redis_host'], port=redis_config['redis_port'], db=redis_config['redis_db'])
-            if len(sys.argv) == 2:
-                keys = redis_client.scan_iter(match="consumer*")
-            else:
-                with open(panels_file_path, 'r') as f:
-                    panels = [panel.strip() for panel in f]
-                
-                keys = set()
-                for panel in panels:
-                    consumer_redis_key = "consumer_" + panel
-                    keys.add(consumer_redis_key)
-        except Exception as e:
-            log_message('ERROR', {'msg': "error scanning consumer", 'err': e})
-
-        for key in keys:
-            if isinstance(key, bytes):
-                consumer_redis_key = key.decode('utf-8')
-            else:
-                consumer_redis_key = key
-                
-            try:
-                fields = redis_client.hkeys(consumer_redis_key)
-            except Exception as e:
-                log_message('ERROR', {'msg': "error getting fields from consumer", 'key': consumer_redis_key, 'err': e})
+    setup_logger(log_file_name, **get_log_settings(config_dict))
 
-            consumer_fields = [field.decode('utf-8') for field in fields]
+    # consumers are looked at when the status hashes of their panel change, and once
+    # their producer is done at an interval following their lag. Without keyspace
+    # events every consumer is swept every TIME_GAP_BETWEEN_CHECKS_SECS as before.
+    status_events = subscribe_status_events()
+    draining = {}
+    known_consumers = set()
+    changed_keys = set()
+    panels = None
+    next_sweep = 0
+    last_check = -MIN_CHECK_INTERVAL_SEC
 
-            for consumer_field in consumer_fields:
+    while True:
+        now = time.monotonic()
+        keys = set()
+        if now - last_check >= MIN_CHECK_INTERVAL_SEC:
+            if now >= next_sweep:
                 try:
-                    data = redis_client.hget(consumer_redis_key, consumer_field).decode('utf-8')
+                    if len(argv) == 4:
+                        with open(panels_file_path, 'r') as f:
+                            panels = {panel.strip() for panel in f if panel.strip()}
+                    keys = list_consumer_keys(panels)
                 except Exception as e:
-                    log_message('ERROR', {'msg': "error getting data from consumer", 'key':consumer_redis_key, 'field': consumer_field, 'err': e})
-
-                data = json.loads(data)
-                # if data['env'] != current_env:
-                #     continue
-                
-                status = data['status']
-                consumer_pid = data['pid']
-                env = data['env']
-
-                if status == 'running':
-                    topic_name = data['topic_name']
-                    group_name = data['group_name']
-
-                    client = consumer_redis_key.removeprefix("consumer_")
-                    producer_redis_key = "producer_" + client
-                    
-                    producer_redis_field = consumer_producer_methods_map.get(consumer_field)
-
-                    is_consumer_moving = check_consumer_movement(topic_name)
-                    
-                    is_status_completed = get_is_status_completed(redis_config['redis_host'], redis_config['redis_port'], redis_config['redis_db'], producer_redis_key, producer_redis_field)
-                    if is_status_completed:
-                        if check_produced_eq_conumed(group_name): # not is_consumer_moving and
-                            if consumer_pid:
-                                log_message('INFO', {'msg': 'killing consumer', 'consumer_pid': consumer_pid, 'topic_name': topic_name})
-                                subprocess.run(f"kill -15 {consumer_pid}", shell=True)
-                                time_sec = 0
-                                while check_if_process_exists(consumer_pid):
-                                    time.sleep(2)
-                                    time_sec += 2
-                                    if time_sec >= 60: # TIME_SEC_BEFORE_KILL
-                                        log_message('ERROR', {'msg': 'consumer did not stop after 60 seconds after issuing the kill', 'consumer_pid': consumer_pid, 'topic_name': topic_name})
-                                        subprocess.run(f"kill -9 {consumer_pid}", shell=True)
-                                        break
-                                # update the status
-                            data_to_update = redis_client.hget("consumer_" + client, consumer_field)
-                            data_to_update = json.loads(data_to_update)
-                            if isinstance(data, list):
-                                data = data[0]
-                            data['status'] = 'completed'
-                            redis_client.hset(consumer_redis_key, consumer_field, json.dumps(data))
-                        else:
-                            continue 
-                    else:
-                        continue
-        
-        time.sleep(TIME_GAP_BETWEEN_CHECKS_SECS)
+                    log_message('ERROR', {'msg': "error scanning consumer", 'err': e})
+                next_sweep = now + (SWEEP_INTERVAL_SEC if status_events else TIME_GAP_BETWEEN_CHECKS_SECS)
+            keys |= changed_keys | {consumer_redis_key for (consumer_redis_key, _), due in draining.items() if due <= now}
+            changed_keys = set()
+
+        if keys:
+            cycle_started = time.monotonic()
+            cycle = check_consumers(keys, draining, known_consumers)
+            last_check = time.monotonic()
+            log_message('INFO', {'msg': 'kill_consumer cycle done', 'cycle_sec': round(last_check - cycle_started, 3), **cycle})
+
+        wake_at = min([next_sweep, *draining.values()])
+        if changed_keys:
+            wake_at = min(wake_at, last_check + MIN_CHECK_INTERVAL_SEC)
+        wait = max(wake_at, last_check + MIN_CHECK_INTERVAL_SEC) - time.monotonic()
+
+        if status_events is None:
+            time.sleep(max(wait, 0))
+            continue
+        try:
+            changed = status_events.changed_keys(wait)
+        except Exception as e:
+            log_message('WARNING', {'msg': "lost the keyspace events, sweeping all consumers", 'err': e})
+            status_events.close()
+            status_events = subscribe_status_events()
+            next_sweep = 0
+            continue
+        for key in changed:
+            panel = get_panel_name(key)
+            if panel is None or (panels is not None and panel not in panels):
+                continue
+            consumer_redis_key = "consumer_" + panel
+            # a running consumer only writes its own progress, what matters is its producer finishing
+            if key == consumer_redis_key and consumer_redis_key in known_consumers:
+                continue
+            changed_keys.add(consumer_redis_key)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,123 @@
+import os
+import resource
+import threading
+import time
+
+import psutil
+
+from modules.log_utils import log_message
+
+ADMISSION_CHECK_INTERVAL_SEC = 5
+SAMPLE_MAX_AGE_SEC = 1
+DATA_PATH = "/data"
+# property name -> default threshold, a threshold of 0 disables the check
+DEFAULT_THRESHOLDS = {
+    "admission_max_cpu_percent": 90,
+    "admission_max_memory_percent": 85,
+    "admission_max_load_per_cpu": 2.0,
+    "admission_max_disk_percent": 90,
+    "admission_min_free_fds": 1024,
+}
+
+
+def get_free_fds() -> int:
+    """
+    Descriptors left before either the system wide limit or our own
+    RLIMIT_NOFILE is hit, we hold a pidfd per child.
+    """
+    free = []
+    try:
+        with open("/proc/sys/fs/file-nr") as f:
+            allocated, _, maximum = (int(value) for value in f.read().split())
+        free.append(maximum - allocated)
+    except (OSError, ValueError):
+        pass
+    soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft_limit != resource.RLIM_INFINITY:
+        free.append(soft_limit - psutil.Process().num_fds())
+    return min(free) if free else None
+
+
+class AdmissionController:
+    """
+    Holds new migration launches while the host is overloaded: CPU, memory,
+    load average per CPU, usage of the /data disk and free descriptors are
+    sampled through psutil and compared with the thresholds. A held launch
+    is re-checked every ADMISSION_CHECK_INTERVAL_SEC and goes ahead as soon
+    as the host recovered, or gives up once the caller is stopping.
+    """
+
+    def __init__(self, thresholds: dict = None, disk_path: str = DATA_PATH, check_interval: float = ADMISSION_CHECK_INTERVAL_SEC):
+        self.thresholds = dict(DEFAULT_THRESHOLDS)
+        self.thresholds.update(thresholds or {})
+        # fall back to / on hosts without a separate data partition
+        self.disk_path = disk_path if os.path.exists(disk_path) else "/"
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._sample = None
+        self._sampled_at = 0
+        # the first cpu_percent() call only sets the baseline
+        psutil.cpu_percent(interval=None)
+
+    @classmethod
+    def from_properties(cls, config_dict: dict):
+        thresholds = {name: float(config_dict[name]) for name in DEFAULT_THRESHOLDS if config_dict.get(name)}
+        return cls(thresholds, config_dict.get("admission_disk_path", DATA_PATH))
+
+    def sample(self) -> dict:
+        """Current host usage, shared by all slots for up to SAMPLE_MAX_AGE_SEC."""
+        with self._lock:
+            if self._sample is None or time.monotonic() - self._sampled_at >= SAMPLE_MAX_AGE_SEC:
+                self._sample = {
+                    "cpu_percent": psutil.cpu_percent(interval=None),
+                    "memory_percent": psutil.virtual_memory().percent,
+                    "load_per_cpu": os.getloadavg()[0] / (psutil.cpu_count() or 1),
+                    "disk_percent": psutil.disk_usage(self.disk_path).percent,
+                    "free_fds": get_free_fds(),
+                }
+                self._sampled_at = time.monotonic()
+            return self._sample
+
+    def violations(self, sample: dict) -> list:
+        """The thresholds `sample` crosses, empty when a launch may go ahead."""
+        checks = [
+            ("cpu_percent", "admission_max_cpu_percent", max),
+            ("memory_percent", "admission_max_memory_percent", max),
+            ("load_per_cpu", "admission_max_load_per_cpu", max),
+            ("disk_percent", "admission_max_disk_percent", max),
+            ("free_fds", "admission_min_free_fds", min),
+        ]
+        violations = []
+        for metric, threshold_name, bound in checks:
+            threshold = self.thresholds.get(threshold_name)
+            value = sample.get(metric)
+            if not threshold or value is None:
+                continue
+            if (bound is max and value > threshold) or (bound is min and value < threshold):
+                violations.append(f"{metric}={round(value, 2)} ({'max' if bound is max else 'min'} {threshold})")
+        return violations
+
+    def wait_for_capacity(self, method: str, panel_name: str, stopping=None) -> float:
+        """
+        Blocks until the host can take another process or `stopping()` is
+        true, returns the seconds held.
+        """
+        held_since = time.monotonic()
+        holding = False
+        while not (stopping and stopping()):
+            try:
+                violations = self.violations(self.sample())
+            except Exception as e:
+                log_message('ERROR', {"msg": "Error while sampling host resources, not holding launch", "method": method, "client": panel_name, "error": e})
+                violations = []
+            if not violations:
+                break
+            if not holding:
+                log_message('WARNING', {"msg": "Host overloaded, holding launch", "method": method, "client": panel_name, "violations": ", ".join(violations)})
+                holding = True
+            time.sleep(self.check_interval)
+
+        held = time.monotonic() - held_since
+        if holding:
+            log_message('INFO', {"msg": "Host recovered, resuming launch", "method": method, "client": panel_name, "held_sec": round(held, 1)})
+        return held
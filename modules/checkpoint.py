@@ -0,0 +1,105 @@
+import time
+
+from modules.codec import encode_item, decode_item, decode_json, decode_status, encode_status
+from modules.log_utils import log_message
+from modules.work_queue import get_queue_key, get_signal_key, estimate_work, get_live_orchestrators, SIGNAL_MAX_LEN
+
+# hash of <item> -> checkpoint of the panel, per method, see checkpoint_item()
+CHECKPOINT_KEY_PREFIX = "migration_checkpoint:"
+# fields of a status hash entry a migration script may report its progress in, the last uid it finished
+PROGRESS_FIELDS = ("last_uid", "current_uid")
+
+# moves the item from the processing list into the checkpoint hash, unless it already left it
+CHECKPOINT_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# enqueues the resumed item and drops the checkpoint, unless another orchestrator resumed it first
+RESUME_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('TYPE', KEYS[2]).ok == 'list' then
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+else
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+end
+redis.call('LPUSH', KEYS[3], 1)
+redis.call('LTRIM', KEYS[3], 0, tonumber(ARGV[4]) - 1)
+return 1
+"""
+
+
+def get_checkpoint_key(method: str) -> str:
+    return CHECKPOINT_KEY_PREFIX + method
+
+
+def get_progress_uid(redis_client, status_key: str, method: str):
+    """Last uid the migration of the panel reported as done, None if it doesn't report one."""
+    value = redis_client.hget(status_key, method)
+    if not value:
+        return None
+    try:
+        status = decode_status(value)
+    except ValueError:
+        return None
+    for field in PROGRESS_FIELDS:
+        if isinstance(status.get(field), int):
+            return status[field]
+    return None
+
+
+def checkpoint_item(redis_client, method: str, processing_key: str, item, orchestrator_id: str, progress_uid: int = None) -> bool:
+    """
+    Moves an interrupted item out of its processing list into the method's
+    checkpoint, with its uid range cut down to what is left when the
+    migration reported how far it got.
+    """
+    panel_data = decode_item(item)
+    resume_data = dict(panel_data)
+    start_uid, end_uid = panel_data.get("start_uid"), panel_data.get("end_uid")
+    if progress_uid is not None and start_uid is not None and end_uid is not None and start_uid <= progress_uid < end_uid:
+        resume_data["start_uid"] = progress_uid + 1
+    checkpoint = {
+        "item": encode_item(resume_data),
+        "panel_name": panel_data.get("panel_name"),
+        "start_uid": start_uid,
+        "resume_uid": resume_data.get("start_uid"),
+        "end_uid": end_uid,
+        "orchestrator": orchestrator_id,
+        "checkpointed_at": int(time.time()),
+    }
+    script = redis_client.register_script(CHECKPOINT_SCRIPT)
+    return script(keys=[processing_key, get_checkpoint_key(method)], args=[item, encode_status(checkpoint)]) == 1
+
+
+def get_checkpoints(redis_client, method: str) -> dict:
+    checkpoints = {}
+    for item, value in redis_client.hgetall(get_checkpoint_key(method)).items():
+        checkpoints[item.decode() if isinstance(item, bytes) else item] = decode_json(value)
+    return checkpoints
+
+
+def resume_checkpoints(redis_client, methods: list) -> int:
+    """
+    Puts the checkpointed items of orchestrators that are gone back on their
+    queues, resuming from their checkpointed uid.
+    """
+    live = get_live_orchestrators(redis_client)
+    script = redis_client.register_script(RESUME_SCRIPT)
+    resumed = 0
+    for method in methods:
+        queue_key = get_queue_key(method)
+        for item, checkpoint in get_checkpoints(redis_client, method).items():
+            if checkpoint.get("orchestrator") in live:
+                continue
+            resume_item = checkpoint["item"]
+            score = estimate_work(decode_item(resume_item))
+            if script(keys=[get_checkpoint_key(method), queue_key, get_signal_key(queue_key)], args=[item, resume_item, score, SIGNAL_MAX_LEN]) == 1:
+                resumed += 1
+                log_message('INFO', {"msg": "Resuming checkpointed panel", "method": method, "client": checkpoint.get("panel_name"), "resume_uid": checkpoint.get("resume_uid"), "end_uid": checkpoint.get("end_uid")})
+    return resumed
@@ -0,0 +1,63 @@
+import ast
+
+import orjson
+
+# version 0 is the str(dict) python literal push_panels_to_redis.py used to enqueue
+ITEM_VERSION = 1
+VERSION_FIELD = "v"
+# payload field -> short key stored in redis
+ITEM_FIELDS = {
+    "panel_name": "p",
+    "start_uid": "s",
+    "end_uid": "e",
+    "chunk_id": "c",
+    "chunk_count": "n",
+    "work": "w",
+}
+ITEM_FIELDS_BY_KEY = {short: field for field, short in ITEM_FIELDS.items()}
+
+
+def encode_item(panel_data: dict) -> str:
+    """
+    Work item stored in the queues: compact JSON with short keys and a
+    version field. The same payload always encodes to the same string, the
+    queues rely on that to find an item again.
+    """
+    item = {VERSION_FIELD: ITEM_VERSION}
+    for field, value in panel_data.items():
+        item[ITEM_FIELDS.get(field, field)] = value
+    return orjson.dumps(item).decode()
+
+
+def decode_item(item) -> dict:
+    """Payload of a work item, of any version."""
+    if isinstance(item, bytes):
+        item = item.decode()
+    if not item.startswith('{"'):
+        return ast.literal_eval(item)
+
+    data = orjson.loads(item)
+    version = data.pop(VERSION_FIELD, None)
+    if version != ITEM_VERSION:
+        raise ValueError(f"Unsupported work item version: {version}")
+    return {ITEM_FIELDS_BY_KEY.get(key, key): value for key, value in data.items()}
+
+
+def legacy_items(panel_data: dict) -> list:
+    """Encodings older producers may have used for the same payload."""
+    return [str(panel_data)]
+
+
+def decode_json(value):
+    """Parses a JSON value from redis, e.g. a status hash entry as written by the migration script."""
+    return orjson.loads(value)
+
+
+def decode_status(value) -> dict:
+    """Entry of a producer_<panel> / consumer_<panel> hash, the first one when it holds a list."""
+    data = orjson.loads(value)
+    return data[0] if isinstance(data, list) else data
+
+
+def encode_status(data) -> str:
+    return orjson.dumps(data).decode()
@@ -0,0 +1,201 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from modules.codec import decode_item
+from modules.migration_methods import PRODUCER_METHODS, CONSUMER_METHODS, producer_consumer_methods_map, consumer_producer_methods_map
+from modules.work_queue import get_queue_key, estimate_work, parse_processing_key, get_live_orchestrators, PROCESSING_KEY_PREFIX
+
+# hash of the sufficient statistics of the duration fit of a method, see add_observation()
+ETA_MODEL_KEY_PREFIX = "migration_eta_model:"
+MODEL_FIELDS = ("n", "sx", "sy", "sxx", "sxy")
+# below this many panels the fit is a plain seconds-per-uid rate
+MIN_FIT_OBSERVATIONS = 3
+ALL_METHODS = PRODUCER_METHODS + CONSUMER_METHODS
+
+
+def get_eta_model_key(method: str) -> str:
+    return ETA_MODEL_KEY_PREFIX + method
+
+
+def add_observation(redis_client, method: str, work: float, duration_sec: float):
+    """
+    Adds a finished panel to the method's least squares fit of duration on
+    work (uids). Only the sums are kept, so updating the fit is O(1) and any
+    number of orchestrators can add to it.
+    """
+    pipe = redis_client.pipeline(transaction=True)
+    key = get_eta_model_key(method)
+    pipe.hincrbyfloat(key, "n", 1)
+    pipe.hincrbyfloat(key, "sx", work)
+    pipe.hincrbyfloat(key, "sy", duration_sec)
+    pipe.hincrbyfloat(key, "sxx", work * work)
+    pipe.hincrbyfloat(key, "sxy", work * duration_sec)
+    pipe.execute()
+
+
+class DurationModel:
+    """duration_sec = intercept + slope * work, fitted from the sums of add_observation()."""
+
+    def __init__(self, n: float, sx: float, sy: float, sxx: float, sxy: float):
+        self.n = int(n)
+        variance = n * sxx - sx * sx
+        slope = (n * sxy - sx * sy) / variance if n >= MIN_FIT_OBSERVATIONS and variance > 0 else None
+        if slope is not None and slope >= 0 and sy - slope * sx >= 0:
+            self.slope = slope
+            self.intercept = (sy - slope * sx) / n
+        elif sx > 0:
+            # too few or too similar panels for a line, or a line through negative durations
+            self.slope = sy / sx
+            self.intercept = 0.0
+        else:
+            self.slope = 0.0
+            self.intercept = sy / n
+
+    @classmethod
+    def load(cls, redis_client, method: str):
+        """The method's model, None while no panel of it finished."""
+        values = redis_client.hmget(get_eta_model_key(method), *MODEL_FIELDS)
+        if not values[0] or float(values[0]) <= 0:
+            return None
+        return cls(*(float(value or 0) for value in values))
+
+    def predict(self, work: float) -> float:
+        return max(self.intercept + self.slope * work, 0.0)
+
+    def to_dict(self) -> dict:
+        return {"panels": self.n, "intercept_sec": round(self.intercept, 3), "sec_per_million_uids": round(self.slope * 1_000_000, 3)}
+
+
+def get_queued_work(redis_client, method: str) -> list:
+    """Estimated work of every panel queued for `method`."""
+    queue_key = get_queue_key(method)
+    key_type = redis_client.type(queue_key)
+    if isinstance(key_type, bytes):
+        key_type = key_type.decode()
+    if key_type == "zset":
+        return [score for _, score in redis_client.zrange(queue_key, 0, -1, withscores=True)]
+    if key_type == "list":
+        return [estimate_work(decode_item(item)) for item in redis_client.lrange(queue_key, 0, -1)]
+    return []
+
+
+def get_running_work(redis_client, running_slots: dict) -> dict:
+    """
+    {method: [(work, seconds running), ...]} of the panels the live
+    orchestrators are migrating, from their processing lists and the
+    `running_slots` of orchestrator.get_running_slots().
+    """
+    keys = [key.decode() if isinstance(key, bytes) else key for key in redis_client.scan_iter(match=PROCESSING_KEY_PREFIX + "*", count=1000)]
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.lrange(key, 0, -1)
+
+    now = time.time()
+    running = {}
+    for key, items in zip(keys, pipe.execute()):
+        queue_key, orchestrator_id, slot = parse_processing_key(key)
+        if orchestrator_id not in running_slots:
+            continue
+        method = queue_key.removesuffix("_queue")
+        entry = running_slots[orchestrator_id].get(f"{method}:{slot}", {})
+        started_at = entry.get("started_at")
+        for item in items:
+            running.setdefault(method, []).append((estimate_work(decode_item(item)), now - started_at if started_at else 0.0))
+    return running
+
+
+def get_slots(orchestrators: dict) -> tuple[dict, set]:
+    """
+    Slots per method across the live orchestrators, and the write methods
+    run by the slots of their read method.
+    """
+    slots = {}
+    paired = set()
+    for status in orchestrators.values():
+        methods = set(filter(None, status.get("methods", "").split(",")))
+        for method, count in json.loads(status.get("slots") or "{}").items():
+            slots[method] = slots.get(method, 0) + count
+        paired.update(write for read, write in producer_consumer_methods_map.items() if read in methods and write in methods)
+    return slots, paired
+
+
+def get_eta(redis_client, running_slots: dict) -> dict:
+    """
+    Time left per method and overall. Every queued and running panel is
+    predicted from the duration fit of its method (of the paired method if
+    the method has none yet), running panels minus the time they already
+    ran. The method's time left is its predicted work spread over its slots,
+    but never less than its longest panel.
+    """
+    slots, paired = get_slots(get_live_orchestrators(redis_client))
+    running = get_running_work(redis_client, running_slots)
+    models = {method: DurationModel.load(redis_client, method) for method in ALL_METHODS}
+    now = time.time()
+
+    methods = {}
+    unknown = []
+    for method in ALL_METHODS:
+        queued = get_queued_work(redis_client, method)
+        running_panels = running.get(method, [])
+        if not queued and not running_panels:
+            continue
+        partner = producer_consumer_methods_map.get(method) or consumer_producer_methods_map.get(method)
+        model = models[method] or models.get(partner)
+        result = {"queued": len(queued), "running": len(running_panels), "slots": slots.get(method, 0), "model": model.to_dict() if model else None}
+        if method in paired:
+            # started and waited for by the read slots, done when the read method is
+            result["paired_with"] = partner
+        elif model is None:
+            unknown.append(method)
+            result["eta_sec"] = None
+        else:
+            durations = [model.predict(work) for work in queued] + [max(model.predict(work) - elapsed, 0.0) for work, elapsed in running_panels]
+            result["eta_sec"] = round(max(sum(durations) / max(slots.get(method, 0), 1), max(durations)))
+            result["eta_at"] = datetime.fromtimestamp(now + result["eta_sec"]).strftime('%Y-%m-%d %H:%M:%S')
+        methods[method] = result
+
+    for method, result in methods.items():
+        if "paired_with" in result:
+            read_result = methods.get(result["paired_with"], {})
+            result["eta_sec"] = read_result.get("eta_sec")
+            result["eta_at"] = read_result.get("eta_at")
+
+    etas = [result["eta_sec"] for result in methods.values() if result.get("eta_sec") is not None]
+    overall = max(etas) if etas else (0 if not methods else None)
+    return {
+        "eta_sec": overall,
+        "eta_at": datetime.fromtimestamp(now + overall).strftime('%Y-%m-%d %H:%M:%S') if overall is not None else None,
+        "methods": methods,
+        "methods_without_history": unknown,
+    }
+
+
+def get_timestamp(line):
+    try:
+        ts_str = " ".join(line.strip().split()[:2])
+        return datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
+    except Exception:
+        return None
+
+
+def get_log_durations(source_folder: str):
+    """Yields (name, first timestamp, last timestamp) of every debug-<name>.log of the migration script."""
+    for fname in os.listdir(source_folder):
+        if not fname.startswith("debug-") or not fname.endswith(".log"):
+            continue
+
+        with open(os.path.join(source_folder, fname), "r") as f:
+            lines = f.readlines()
+        if not lines:
+            continue
+        yield fname.replace("debug-", "").replace(".log", ""), get_timestamp(lines[0]), get_timestamp(lines[-1])
+
+
+def split_log_name(name: str) -> tuple:
+    """(panel, method) of a debug log name holding both, (None, None) if it names no known method."""
+    for method in sorted(ALL_METHODS, key=len, reverse=True):
+        if method in name:
+            return name.replace(method, "").strip("_-") or None, method
+    return None, None
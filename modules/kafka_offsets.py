@@ -0,0 +1,283 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kafka import KafkaAdminClient, KafkaConsumer, TopicPartition
+
+from modules.codec import decode_status
+from modules.log_utils import log_message
+
+LAG_SAMPLE_INTERVAL_SEC = 30
+# a held producer looks at least this often whether its orchestrator is stopping
+STOP_CHECK_INTERVAL_SEC = 5
+KAFKA_REQUEST_TIMEOUT_MS = 10000
+# committed offsets are fetched with one admin request per group, this many at once
+OFFSET_FETCH_THREADS = 8
+# hash with the last lag sample and the throttling state, for the status APIs
+BACKPRESSURE_KEY = "migration_backpressure"
+STATUS_KEY_PATTERNS = ["producer_*", "consumer_*"]
+
+
+class KafkaOffsetReader:
+    """
+    Reads committed and log end offsets straight from the brokers, without
+    forking kafka-consumer-groups.sh for every group. The log end offsets of
+    all requested topics are fetched in one batched request, the committed
+    offsets with one request per group through the public admin API, sent
+    concurrently from a bounded pool where every thread has its own admin
+    client.
+
+    Not thread safe, every thread needs its own reader.
+    """
+
+    def __init__(self, bootstrap_servers, request_timeout_ms: int = KAFKA_REQUEST_TIMEOUT_MS, fetch_threads: int = OFFSET_FETCH_THREADS):
+        if isinstance(bootstrap_servers, str):
+            bootstrap_servers = bootstrap_servers.split(",")
+        self.bootstrap_servers = bootstrap_servers
+        self.request_timeout_ms = request_timeout_ms
+        self._local = threading.local()
+        self._admin_clients = []
+        self._admin_clients_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=fetch_threads, thread_name_prefix="kafka-offsets")
+        self.consumer = self._create_consumer()
+
+    def _create_consumer(self):
+        return KafkaConsumer(bootstrap_servers=self.bootstrap_servers, client_id="smart-migration-offsets", enable_auto_commit=False, request_timeout_ms=self.request_timeout_ms)
+
+    def _create_admin_client(self):
+        return KafkaAdminClient(bootstrap_servers=self.bootstrap_servers, client_id="smart-migration-offsets", request_timeout_ms=self.request_timeout_ms)
+
+    def _get_admin_client(self):
+        """The admin client of the calling thread, the admin client is not thread safe."""
+        admin_client = getattr(self._local, "admin_client", None)
+        if admin_client is None:
+            admin_client = self._local.admin_client = self._create_admin_client()
+            with self._admin_clients_lock:
+                self._admin_clients.append(admin_client)
+        return admin_client
+
+    def get_partitions(self, topics) -> list:
+        partitions = []
+        for topic in topics:
+            for partition in self.consumer.partitions_for_topic(topic) or []:
+                partitions.append(TopicPartition(topic, partition))
+        return partitions
+
+    def get_end_offsets(self, topics) -> dict:
+        """{topic: {partition: log end offset}} for all `topics` at once."""
+        end_offsets = {}
+        partitions = self.get_partitions(topics)
+        if partitions:
+            for tp, offset in self.consumer.end_offsets(partitions).items():
+                end_offsets.setdefault(tp.topic, {})[tp.partition] = offset
+        return end_offsets
+
+    def get_committed_offsets(self, group_id: str) -> dict:
+        """{topic: {partition: committed offset}} of a consumer group."""
+        return to_committed(self._get_admin_client().list_consumer_group_offsets(group_id))
+
+    def get_committed_offsets_batch(self, group_ids) -> dict:
+        """{group: {topic: {partition: committed offset}}} of all `group_ids`, one admin request each, sent concurrently."""
+        futures = {group: self._executor.submit(self.get_committed_offsets, group) for group in group_ids}
+        return {group: future.result() for group, future in futures.items()}
+
+    def get_offsets(self, topic_groups) -> dict:
+        """
+        Offsets of every (topic, group) pair: {(topic, group): {"current":
+        {partition: offset}, "end": {partition: offset}, "lag": total lag}}.
+        Partitions the group never committed count from the beginning of
+        the partition.
+        """
+        topic_groups = list(topic_groups)
+        end_offsets = self.get_end_offsets({topic for topic, _ in topic_groups})
+        committed_by_group = self.get_committed_offsets_batch({group for _, group in topic_groups})
+
+        missing = [TopicPartition(topic, partition)
+                   for topic, group in topic_groups
+                   for partition in end_offsets.get(topic, {})
+                   if partition not in committed_by_group[group].get(topic, {})]
+        beginning_offsets = self.consumer.beginning_offsets(missing) if missing else {}
+
+        offsets = {}
+        for topic, group in topic_groups:
+            end = end_offsets.get(topic, {})
+            committed = committed_by_group[group].get(topic, {})
+            current = {partition: committed.get(partition, beginning_offsets.get(TopicPartition(topic, partition), 0)) for partition in end}
+            offsets[(topic, group)] = {
+                "current": current,
+                "end": end,
+                "lag": sum(max(end[partition] - current[partition], 0) for partition in end)
+            }
+        return offsets
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._admin_clients_lock:
+            clients = [self.consumer] + self._admin_clients
+            self._admin_clients = []
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                log_message('WARNING', {"msg": "Error while closing kafka client", "error": e})
+
+
+def to_committed(offsets: dict) -> dict:
+    """{topic: {partition: offset}} of an admin client {TopicPartition: OffsetAndMetadata}, without the uncommitted ones."""
+    committed = {}
+    for tp, offset_metadata in offsets.items():
+        if offset_metadata.offset >= 0:
+            committed.setdefault(tp.topic, {})[tp.partition] = offset_metadata.offset
+    return committed
+
+
+def get_running_topic_groups(redis_client) -> dict:
+    """
+    {panel: {(topic, group), ...}} for every producer or consumer whose status
+    is running, read from the producer_<panel> / consumer_<panel> hashes.
+    """
+    keys = []
+    for pattern in STATUS_KEY_PATTERNS:
+        keys += list(redis_client.scan_iter(match=pattern, count=1000))
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+
+    topic_groups = {}
+    for key, entries in zip(keys, pipe.execute()):
+        if isinstance(key, bytes):
+            key = key.decode()
+        panel_name = key.split("_", 1)[1]
+        for value in entries.values():
+            try:
+                data = decode_status(value)
+            except ValueError:
+                continue
+            if data.get("status") != "running" or not data.get("topic_name"):
+                continue
+            group_name = data.get("group_name") or f"{data['topic_name']}_grp"
+            topic_groups.setdefault(panel_name, set()).add((data["topic_name"], group_name))
+    return topic_groups
+
+
+class LagMonitor:
+    """
+    Samples the kafka lag of every running migration at a fixed interval and
+    turns it into a back-pressure signal with hysteresis: throttling starts
+    when the total lag or the lag of a panel goes over its high watermark and
+    stops once it is back under the low watermark.
+
+    Producer slots call wait_until_clear() before starting a read method,
+    `on_change` is called with (throttled, throttled_panels) whenever the
+    state changes so running producers can be paused as well.
+    """
+
+    def __init__(self, redis_client, bootstrap_servers, high_watermark: int = None, low_watermark: int = None,
+                 panel_high_watermark: int = None, panel_low_watermark: int = None, interval: float = LAG_SAMPLE_INTERVAL_SEC):
+        self.redis_client = redis_client
+        self.bootstrap_servers = bootstrap_servers
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark if low_watermark is not None else (high_watermark // 2 if high_watermark else None)
+        self.panel_high_watermark = panel_high_watermark
+        self.panel_low_watermark = panel_low_watermark if panel_low_watermark is not None else (panel_high_watermark // 2 if panel_high_watermark else None)
+        self.interval = interval
+        self.throttled = False
+        self.throttled_panels = set()
+        self.total_lag = None
+        self.panel_lags = {}
+        self.on_change = None
+        self._cond = threading.Condition()
+        self._reader = None
+
+    @classmethod
+    def from_properties(cls, redis_client, config_dict: dict):
+        """A monitor configured by the lag_* properties, None when no watermark is set."""
+        def get_int(name):
+            return int(config_dict[name]) if config_dict.get(name) else None
+
+        high_watermark = get_int('lag_high_watermark')
+        panel_high_watermark = get_int('panel_lag_high_watermark')
+        if not high_watermark and not panel_high_watermark:
+            return None
+        return cls(redis_client, config_dict['kafka_bootstrap_servers'], high_watermark, get_int('lag_low_watermark'),
+                   panel_high_watermark, get_int('panel_lag_low_watermark'), float(config_dict.get('lag_sample_interval_sec', LAG_SAMPLE_INTERVAL_SEC)))
+
+    def start(self, on_change=None):
+        self.on_change = on_change
+        threading.Thread(target=self._run, name="lag-monitor", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                log_message('ERROR', {"msg": "Error while sampling kafka lag, keeping previous state", "error": e})
+                if self._reader:
+                    self._reader.close()
+                    self._reader = None
+            time.sleep(self.interval)
+
+    def sample(self):
+        topic_groups = get_running_topic_groups(self.redis_client)
+        panel_lags = {}
+        if topic_groups:
+            if self._reader is None:
+                self._reader = KafkaOffsetReader(self.bootstrap_servers)
+            offsets = self._reader.get_offsets({pair for pairs in topic_groups.values() for pair in pairs})
+            panel_lags = {panel: sum(offsets[pair]["lag"] for pair in pairs) for panel, pairs in topic_groups.items()}
+        self.update(panel_lags)
+
+    def update(self, panel_lags: dict):
+        """Applies a lag sample of {panel: lag} to the throttling state."""
+        total_lag = sum(panel_lags.values())
+        throttled = self.throttled
+        if self.high_watermark:
+            if total_lag > self.high_watermark:
+                throttled = True
+            elif total_lag < self.low_watermark:
+                throttled = False
+
+        throttled_panels = set()
+        if self.panel_high_watermark:
+            for panel, lag in panel_lags.items():
+                if lag > self.panel_high_watermark or (panel in self.throttled_panels and lag >= self.panel_low_watermark):
+                    throttled_panels.add(panel)
+
+        changed = (throttled, throttled_panels) != (self.throttled, self.throttled_panels)
+        with self._cond:
+            self.total_lag = total_lag
+            self.panel_lags = panel_lags
+            self.throttled = throttled
+            self.throttled_panels = throttled_panels
+            self._cond.notify_all()
+
+        self.redis_client.hset(BACKPRESSURE_KEY, mapping={
+            "total_lag": total_lag,
+            "throttled": int(throttled),
+            "throttled_panels": json.dumps(sorted(throttled_panels)),
+            "sampled_at": int(time.time())
+        })
+        if changed:
+            log_message('WARNING' if throttled or throttled_panels else 'INFO', {"msg": "Kafka back-pressure changed", "total_lag": total_lag, "throttled": throttled, "throttled_panels": sorted(throttled_panels)})
+            if self.on_change:
+                self.on_change(throttled, set(throttled_panels))
+
+    def is_clear(self, panel_name: str) -> bool:
+        return not self.throttled and panel_name not in self.throttled_panels
+
+    def wait_until_clear(self, method: str, panel_name: str, stopping=None) -> float:
+        """
+        Blocks a read launch while the total or the panel's lag is too high,
+        until `stopping()` is true at the latest, returns the seconds held.
+        """
+        held_since = time.monotonic()
+        with self._cond:
+            if self.is_clear(panel_name):
+                return 0
+            log_message('INFO', {"msg": "Kafka lag too high, holding producer", "method": method, "client": panel_name, "total_lag": self.total_lag, "panel_lag": self.panel_lags.get(panel_name)})
+            while not self.is_clear(panel_name) and not (stopping and stopping()):
+                self._cond.wait(min(self.interval, STOP_CHECK_INTERVAL_SEC))
+        held = time.monotonic() - held_since
+        log_message('INFO', {"msg": "Kafka lag back under the low watermark, starting producer", "method": method, "client": panel_name, "held_sec": round(held, 1)})
+        return held
@@ -0,0 +1,120 @@
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from datetime import datetime
+
+import orjson
+
+LOGGER_NAME = "smart_migration"
+DEFAULT_LOG_LEVEL = "DEBUG"
+DEFAULT_LOG_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_LOG_BACKUP_COUNT = 10
+# third party libraries (kafka, pymongo) only get their warnings into our files
+LIBRARY_LOG_LEVEL = logging.WARNING
+LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+logger = logging.getLogger(LOGGER_NAME)
+_listener = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per line: {"ts": ..., "level": ..., <fields of the log_message() call>}.
+    Runs on the listener thread, the hot loops only hand over the dict.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "ts": datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            "level": record.levelname,
+        }
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            line.update(fields)
+        else:
+            line["msg"] = record.getMessage()
+            line["logger"] = record.name
+        if record.exc_info:
+            line["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(line, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # the queue never leaves the process, the record goes as is and is
+        # formatted by the listener instead of the logging thread
+        return record
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def get_log_settings(config_dict: dict) -> dict:
+    """setup_logger() keyword arguments from the log_* properties."""
+    return {
+        "level": config_dict.get("log_level", DEFAULT_LOG_LEVEL),
+        "max_bytes": int(config_dict.get("log_max_bytes", DEFAULT_LOG_MAX_BYTES)),
+        "backup_count": int(config_dict.get("log_backup_count", DEFAULT_LOG_BACKUP_COUNT)),
+    }
+
+
+def setup_logger(log_file_path, level: str = DEFAULT_LOG_LEVEL, max_bytes: int = DEFAULT_LOG_MAX_BYTES,
+                 backup_count: int = DEFAULT_LOG_BACKUP_COUNT):
+    """
+    Writes the log as JSON lines from a background thread. The file is rotated
+    at `max_bytes`, rotated files are gzipped and the last `backup_count` kept.
+    A max_bytes of 0 disables rotation.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    file_handler = logging.handlers.RotatingFileHandler(log_file_path, mode="a", maxBytes=max_bytes, backupCount=backup_count)
+    file_handler.namer = lambda name: name + ".gz"
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(LIBRARY_LOG_LEVEL)
+    logger.setLevel(LEVELS.get(str(level).upper(), logging.DEBUG))
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+
+
+def stop_logger():
+    """Flushes the queued lines, called at exit. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logger)
+
+
+def log_message(level: str, data: dict):
+    """
+    Logs the fields of `data` at `level`. Nothing is formatted here, messages
+    under the configured level are dropped before any work is done.
+    """
+    log_level = LEVELS.get(level.upper(), logging.INFO)
+    if logger.isEnabledFor(log_level):
+        logger.log(log_level, "", extra={"fields": data})
@@ -0,0 +1,27 @@
+PRODUCER_METHODS = [
+    "readUserAttributes",
+    "readAnonUserAttributes",
+    "readDisableUserAttributes",
+    "readEngagementEventsWithMetaKey",
+    "readAnonEngagementEventsWithMetaKey",
+    "readDisableEngagementEventsWithMetaKey",
+    "readUserDetailsWithMetaKey",
+    "readAnonUserDetailsWithMetaKey",
+    "readDisableUserDetailsWithMetaKey"
+]
+
+CONSUMER_METHODS = [
+    "writeUserAttributes",
+    "writeAnonUserAttributes",
+    "writeDisableUserAttributes",
+    "writeEngagementEventsToUserEvents",
+    "writeAnonEngagementEventsToAnonUserEvents",
+    "writeDisableEngagementEventsToDisabledUserEvents",
+    "writeUserDetailsToUserEvents",
+    "writeAnonUserDetailsToAnonUserEvents",
+    "writeDisableUserDetailsToDisableUserEvents"
+]
+
+# every read method produces into the kafka topic its write method consumes from
+producer_consumer_methods_map = dict(zip(PRODUCER_METHODS, CONSUMER_METHODS))
+consumer_producer_methods_map = dict(zip(CONSUMER_METHODS, PRODUCER_METHODS))
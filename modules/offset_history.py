@@ -0,0 +1,163 @@
+import time
+
+# stream of the consumed / produced totals of a consumer group, one entry per sample
+OFFSET_HISTORY_KEY_PREFIX = "offset_history:"
+# where the totals of a sample come from: the status entry of the consumer or kafka
+SOURCE_STATUS = "status"
+SOURCE_KAFKA = "kafka"
+DEFAULT_INTERVAL_SEC = 10
+DEFAULT_MAX_LEN = 60
+DEFAULT_TTL_SEC = 24 * 3600
+DEFAULT_RATE_WINDOWS = 6
+DEFAULT_STALL_WINDOWS = 6
+DEFAULT_DRAINED_WINDOWS = 1
+
+# appends a sample unless the last one is of the same source and younger than
+# the interval, trims the stream to about MAXLEN entries and refreshes its TTL
+RECORD_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local last = redis.call('XREVRANGE', KEYS[1], '+', '-', 'COUNT', 1)
+if #last > 0 and now_ms - tonumber(string.match(last[1][1], '^(%d+)')) < tonumber(ARGV[1]) then
+    local fields = last[1][2]
+    for i = 1, #fields, 2 do
+        if fields[i] == 'source' and fields[i + 1] == ARGV[6] then
+            return 0
+        end
+    end
+end
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'consumed', ARGV[4], 'produced', ARGV[5], 'source', ARGV[6])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def get_offset_history_key(group_name: str) -> str:
+    return OFFSET_HISTORY_KEY_PREFIX + group_name
+
+
+def _to_str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class OffsetHistory:
+    """
+    Sliding window of the offsets of every consumer group, sampled at most
+    every interval_sec into a stream of about max_len entries that expires
+    ttl_sec after its last sample. Every sample records its source, the
+    stats only look at the samples of the source of the newest one. The
+    rates are taken over the last rate_windows samples, a group with lag
+    that consumed nothing over the last stall_windows samples is stalled,
+    one without lag that produced nothing over the last drained_windows
+    samples it has is drained.
+    """
+
+    def __init__(self, interval_sec: float = DEFAULT_INTERVAL_SEC, max_len: int = DEFAULT_MAX_LEN, ttl_sec: int = DEFAULT_TTL_SEC,
+                 rate_windows: int = DEFAULT_RATE_WINDOWS, stall_windows: int = DEFAULT_STALL_WINDOWS, drained_windows: int = DEFAULT_DRAINED_WINDOWS):
+        self.interval_sec = interval_sec
+        self.max_len = max_len
+        self.ttl_sec = ttl_sec
+        self.rate_windows = rate_windows
+        self.stall_windows = stall_windows
+        self.drained_windows = drained_windows
+
+    @classmethod
+    def from_properties(cls, config_dict: dict):
+        return cls(
+            float(config_dict.get('offset_history_interval_sec', DEFAULT_INTERVAL_SEC)),
+            int(config_dict.get('offset_history_max_len', DEFAULT_MAX_LEN)),
+            int(config_dict.get('offset_history_ttl_sec', DEFAULT_TTL_SEC)),
+            int(config_dict.get('offset_history_rate_windows', DEFAULT_RATE_WINDOWS)),
+            int(config_dict.get('offset_history_stall_windows', DEFAULT_STALL_WINDOWS)),
+            int(config_dict.get('offset_history_drained_windows', DEFAULT_DRAINED_WINDOWS)),
+        )
+
+    def record(self, redis_client, samples: dict) -> int:
+        """Appends {group: (consumed, produced, source)} to the groups' histories in one pipeline, returns the samples taken."""
+        if not samples:
+            return 0
+        script = redis_client.register_script(RECORD_SCRIPT)
+        pipe = redis_client.pipeline(transaction=False)
+        for group_name, (consumed, produced, source) in samples.items():
+            script(keys=[get_offset_history_key(group_name)], args=[int(self.interval_sec * 1000), self.max_len, self.ttl_sec, consumed, produced, source], client=pipe)
+        return sum(pipe.execute())
+
+    def get_samples(self, redis_client, group_names) -> dict:
+        """{group: [(time_sec, consumed, produced, source)]}, oldest first, of the groups with a history."""
+        group_names = list(group_names)
+        pipe = redis_client.pipeline(transaction=False)
+        for group_name in group_names:
+            pipe.xrange(get_offset_history_key(group_name))
+        history = {}
+        for group_name, entries in zip(group_names, pipe.execute()):
+            samples = []
+            for entry_id, fields in entries:
+                fields = {_to_str(field): _to_str(value) for field, value in fields.items()}
+                samples.append((int(_to_str(entry_id).split("-", 1)[0]) / 1000, int(fields["consumed"]), int(fields["produced"]), fields.get("source", SOURCE_STATUS)))
+            if samples:
+                history[group_name] = samples
+        return history
+
+    def get_stats(self, redis_client, group_names, latest: dict = None) -> dict:
+        """
+        {group: stats of get_progress()} of the groups with samples. The
+        {group: (consumed, produced, source)} read now in `latest` count as
+        the newest sample of their group where record() skipped them.
+        """
+        history = self.get_samples(redis_client, group_names)
+        for group_name, (consumed, produced, source) in (latest or {}).items():
+            samples = history.setdefault(group_name, [])
+            if not samples or samples[-1][1:] != (consumed, produced, source):
+                samples.append((time.time(), consumed, produced, source))
+        return {group_name: self.get_progress(samples) for group_name, samples in history.items()}
+
+    def get_progress(self, samples: list) -> dict:
+        """
+        Lag, consume and produce rates per second, seconds until the lag is
+        gone at these rates (None while it doesn't shrink), whether the group
+        stalled and whether it drained, from its samples of the source of
+        the newest one.
+        """
+        source = samples[-1][3]
+        first = len(samples) - 1
+        while first > 0 and samples[first - 1][3] == source:
+            first -= 1
+        samples = samples[first:]
+        last_time, consumed, produced, _ = samples[-1]
+        lag = max(produced - consumed, 0)
+        window = samples[-(self.rate_windows + 1):]
+        first_time, first_consumed, first_produced, _ = window[0]
+        elapsed = last_time - first_time
+        consume_rate = (consumed - first_consumed) / elapsed if elapsed > 0 else None
+        produce_rate = (produced - first_produced) / elapsed if elapsed > 0 else None
+
+        if lag == 0:
+            time_to_drain_sec = 0
+        elif consume_rate is not None and consume_rate - produce_rate > 0:
+            time_to_drain_sec = round(lag / (consume_rate - produce_rate))
+        else:
+            time_to_drain_sec = None
+
+        stall_window = samples[-(self.stall_windows + 1):]
+        stalled = lag > 0 and len(stall_window) > self.stall_windows and stall_window[0][1] == consumed
+        drained_window = samples[-(self.drained_windows + 1):]
+        drained = lag == 0 and all(sample[2] == produced for sample in drained_window)
+        return {
+            "consumed": consumed,
+            "produced": produced,
+            "lag": lag,
+            "consume_rate": round(consume_rate, 2) if consume_rate is not None else None,
+            "produce_rate": round(produce_rate, 2) if produce_rate is not None else None,
+            "time_to_drain_sec": time_to_drain_sec,
+            "stalled": stalled,
+            "drained": drained,
+            "samples": len(samples),
+            "source": source,
+            "last_sample_time": last_time,
+        }
+
+
+def get_group_names(redis_client) -> list:
+    """Consumer groups with an offset history."""
+    return sorted(_to_str(key).removeprefix(OFFSET_HISTORY_KEY_PREFIX) for key in redis_client.scan_iter(match=OFFSET_HISTORY_KEY_PREFIX + "*", count=1000))
+
@@ -0,0 +1,682 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from modules.admission import AdmissionController
+from modules.checkpoint import checkpoint_item, get_progress_uid, resume_checkpoints
+from modules.codec import encode_item, decode_item, decode_status, legacy_items
+from modules.eta import add_observation
+from modules.kafka_offsets import LagMonitor
+from modules.log_utils import log_message
+from modules.migration_methods import producer_consumer_methods_map
+from modules.phase_timer import PhaseTimer, MIGRATION_PHASE, HELD_PHASE
+from modules.pid_registry import PidRegistry, PID_REGISTRATION_TIMEOUT_SEC
+from modules.process_watcher import ProcessWatcher, find_descendant, terminate_tree
+from modules.retry_queue import RetryPolicy, MigrationFailed, fail_item, clear_attempts, promote_due_retries, COMPLETED_STATUS
+from modules.uid_ranges import complete_chunk, get_remaining_chunks
+from modules.work_queue import ReliableQueue, get_queue_key, queue_length, estimate_work, send_heartbeat, get_live_orchestrators, reap_orphaned_items, CLAIM_TIMEOUT_SEC, HEARTBEAT_TTL_SEC, HEARTBEAT_KEY_PREFIX, SHORTEST_FIRST
+
+MIGRATION_SCRIPT = "/home/smartechro/mongo_migration.sh"
+CUSTOM_PROPERTY_FILE_MIGRATION_SCRIPT = "/home/smartechro/mongo_migration_custom_propertyfile.sh"
+# the process the wrapper scripts start, tracked directly instead of waiting for its pid in redis
+MIGRATION_PROCESS_NAME = "java"
+
+# hash of <method> -> slots, plus the "default", "global" and express lane fields, editable at runtime
+CONCURRENCY_CONTROL_KEY = "migration_concurrency"
+DEFAULT_SLOTS_FIELD = "default"
+GLOBAL_CAP_FIELD = "global"
+# extra slots per method taking the smallest panels, up to EXPRESS_MAX_WORK_FIELD (uids) when set
+EXPRESS_SLOTS_FIELD = "express"
+EXPRESS_MAX_WORK_FIELD = "express_max_work"
+EXPRESS_SLOT_PREFIX = "express"
+# migration_slots:<orchestrator_id>, hash of <method>:<slot> -> running process (the lease of
+# the slot's item), so status checks don't need ps/grep and see every host
+SLOT_REGISTRY_KEY_PREFIX = "migration_slots:"
+# hash of "all" or <orchestrator_id> -> time of the stop request, orchestrators started before it stop
+ORCHESTRATOR_STOP_KEY = "orchestrator_stop"
+STOP_ALL_FIELD = "all"
+STOP_REQUEST_TTL_SEC = 3600
+CONCURRENCY_REFRESH_SEC = 5
+REAPER_INTERVAL_SEC = 30
+# launches of the same (status key, method) share one of this many locks
+LAUNCH_LOCK_STRIPES = 64
+
+
+def get_status_key(method: str, panel_name: str) -> str:
+    """Hash the migration script registers its pid/status in for this method."""
+    prefix = "producer_" if method.startswith("read") else "consumer_"
+    return prefix + panel_name
+
+
+def get_role(method: str) -> str:
+    return "producer" if method.startswith("read") else "consumer"
+
+
+def get_slot_registry_key(orchestrator_id: str) -> str:
+    return SLOT_REGISTRY_KEY_PREFIX + orchestrator_id
+
+
+def get_running_slots(redis_client, orchestrators: dict = None) -> dict:
+    """
+    {orchestrator_id: {"<method>:<slot>": {"pid", "panel_name", "host", ...}}}
+    for every live orchestrator, on any host. Callers that read
+    get_live_orchestrators() themselves pass it as `orchestrators`, so both
+    cover the same orchestrators.
+    """
+    orchestrators = list(get_live_orchestrators(redis_client) if orchestrators is None else orchestrators)
+    pipe = redis_client.pipeline(transaction=False)
+    for orchestrator_id in orchestrators:
+        pipe.hgetall(get_slot_registry_key(orchestrator_id))
+    running_slots = {}
+    for orchestrator_id, slots in zip(orchestrators, pipe.execute()):
+        running_slots[orchestrator_id] = {
+            (field.decode() if isinstance(field, bytes) else field): json.loads(value)
+            for field, value in slots.items()
+        }
+    return running_slots
+
+
+def request_stop(redis_client, orchestrator_id: str = None):
+    """Asks one orchestrator, or all of them on every host, to shut down as on SIGTERM."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(ORCHESTRATOR_STOP_KEY, orchestrator_id or STOP_ALL_FIELD, time.time())
+    pipe.expire(ORCHESTRATOR_STOP_KEY, STOP_REQUEST_TTL_SEC)
+    pipe.execute()
+
+
+def build_command(method: str, panel_data: dict, custom_property_file: str = None, migration_script: str = None) -> str:
+    command = migration_script or (CUSTOM_PROPERTY_FILE_MIGRATION_SCRIPT if custom_property_file else MIGRATION_SCRIPT)
+    command += f" {method} {panel_data.get('panel_name')}"
+    if method.startswith("read"):
+        if panel_data.get("start_uid"):
+            command += f" {panel_data['start_uid']}"
+        if panel_data.get("end_uid"):
+            command += f" {panel_data['end_uid']}"
+    if custom_property_file:
+        command += " " + custom_property_file
+    return command
+
+
+class ConcurrencyLimits:
+    """
+    Slots per method, express slots per method and the global cap on running
+    processes, read from the CONCURRENCY_CONTROL_KEY hash so they can be
+    changed without a restart.
+    """
+
+    def __init__(self, redis_client, default_slots: int = 1, global_cap: int = None, express_slots: int = 0, express_max_work: int = None):
+        self.redis_client = redis_client
+        self.default_slots = default_slots
+        self.global_cap = global_cap
+        self.express_slots = express_slots
+        self.express_max_work = express_max_work
+        self.method_slots = {}
+
+    def refresh(self):
+        try:
+            values = self.redis_client.hgetall(CONCURRENCY_CONTROL_KEY)
+        except Exception as e:
+            log_message('ERROR', {"msg": "Error while reading concurrency limits, keeping previous ones", "error": e})
+            return
+
+        method_slots = {}
+        default_slots = self.default_slots
+        global_cap = self.global_cap
+        express_slots = self.express_slots
+        express_max_work = self.express_max_work
+        for field, value in values.items():
+            try:
+                value = int(value)
+            except ValueError:
+                log_message('WARNING', {"msg": "Ignoring invalid concurrency value", "field": field, "value": value})
+                continue
+            if field == DEFAULT_SLOTS_FIELD:
+                default_slots = value
+            elif field == GLOBAL_CAP_FIELD:
+                global_cap = value if value > 0 else None
+            elif field == EXPRESS_SLOTS_FIELD:
+                express_slots = max(value, 0)
+            elif field == EXPRESS_MAX_WORK_FIELD:
+                express_max_work = value if value > 0 else None
+            else:
+                method_slots[field] = value
+
+        new_limits = (method_slots, default_slots, global_cap, express_slots, express_max_work)
+        if new_limits != (self.method_slots, self.default_slots, self.global_cap, self.express_slots, self.express_max_work):
+            log_message('INFO', {"msg": "Concurrency limits updated", "default": default_slots, "global": global_cap, "methods": method_slots, "express": express_slots, "express_max_work": express_max_work})
+        self.method_slots = method_slots
+        self.default_slots = default_slots
+        self.global_cap = global_cap
+        self.express_slots = express_slots
+        self.express_max_work = express_max_work
+
+    def slots_for(self, method: str) -> int:
+        return max(self.method_slots.get(method, self.default_slots), 0)
+
+    def slot_ids_for(self, method: str) -> list:
+        """Ids of the slots allowed for `method`: 0..n-1, then express0..expressN-1."""
+        slots = list(range(self.slots_for(method)))
+        if slots:
+            slots += [f"{EXPRESS_SLOT_PREFIX}{n}" for n in range(self.express_slots)]
+        return slots
+
+
+class MigrationOrchestrator:
+    """
+    Runs the migration script for every panel in the `<method>_queue` queues
+    with a pool of slots per method. Any number of orchestrators, on any
+    number of hosts, can share the queues: every claimed item is leased to
+    its orchestrator's heartbeat and returned to the queue by the others
+    when that expires. Every slot blocks on its queue and
+    handles one panel at a time, biggest panel first, while the express
+    slots take the smallest ones. The number of slots per method and the
+    global cap follow ConcurrencyLimits.
+
+    When a read method and its write method are scheduled by the same
+    orchestrator, the read slot also claims the panel's item from the write
+    queue and starts the consumer right before the producer, so consumers
+    never wait on producers that haven't started and producers don't build
+    up a backlog nobody consumes. Write slots of such pairs only pick up the
+    leftovers once the read queue is empty.
+
+    On SIGTERM nothing new is claimed and the running migrations get up to
+    `drain_timeout` seconds to finish. The ones still running then are
+    killed and checkpointed with the uid they got to, the next orchestrator
+    to start (or any live one, once we are gone) resumes them from there.
+    """
+
+    def __init__(self, redis_client, methods: list, custom_property_file: str = None, default_slots: int = 1, global_cap: int = None, express_slots: int = 0, express_max_work: int = None, admission: AdmissionController = None, lag_monitor: LagMonitor = None, pause_producers: bool = False, drain_timeout: float = 0, migration_script: str = None, retry_policy: RetryPolicy = None):
+        self.redis_client = redis_client
+        self.methods = methods
+        self.custom_property_file = custom_property_file
+        # overrides MIGRATION_SCRIPT / CUSTOM_PROPERTY_FILE_MIGRATION_SCRIPT, e.g. with a stand-in for benchmarks
+        self.migration_script = migration_script
+        self.hostname = socket.gethostname()
+        self.orchestrator_id = f"{self.hostname}:{os.getpid()}"
+        self.slot_registry_key = get_slot_registry_key(self.orchestrator_id)
+        self.started_at = time.time()
+        # on SIGTERM wait up to drain_timeout seconds for the running migrations before killing them
+        self.drain_timeout = drain_timeout
+        self._drain_deadline = None
+        # nothing new is claimed once stopping, items of children killed by the shutdown are checkpointed
+        self._stopping = False
+        self._killed = False
+        self.limits = ConcurrencyLimits(redis_client, default_slots, global_cap, express_slots, express_max_work)
+        self.admission = admission or AdmissionController()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.lag_monitor = lag_monitor
+        # SIGSTOP running producers while kafka back-pressure is on, instead of only holding new ones
+        self.pause_producers = pause_producers
+        self._paused_pids = set()
+        self.process_watcher = ProcessWatcher()
+        self.pid_registry = PidRegistry(redis_client)
+        self.consumer_pairs = {read: write for read, write in producer_consumer_methods_map.items() if read in methods and write in methods}
+        self.producer_pairs = {write: read for read, write in self.consumer_pairs.items()}
+        # (method, slot) -> {"pid": ..., "panel_name": ...} for every running child
+        self.slot_registry = {}
+        # (method, slot) -> Popen of the wrapper script, reaped once the migration finished
+        self._wrappers = {}
+        self._registry_lock = threading.Lock()
+        # chunks of one panel launch one at a time, so each pid is matched to its own launch
+        self._launch_locks = [threading.Lock() for _ in range(LAUNCH_LOCK_STRIPES)]
+        self._queues = {}
+        self._running = 0
+        # launches among _running still held by the lag or admission checks, the drain doesn't wait for them
+        self._held = 0
+        self._running_cond = threading.Condition()
+
+    def run(self):
+        """Keeps the slot threads in line with the limits, runs until terminated."""
+        self.limits.refresh()
+        self.send_heartbeat()
+        try:
+            resume_checkpoints(self.redis_client, self.methods)
+        except Exception as e:
+            log_message('ERROR', {"msg": "Error while resuming checkpointed panels", "error": e})
+        threading.Thread(target=self.run_housekeeping, daemon=True).start()
+        if self.lag_monitor:
+            self.lag_monitor.start(on_change=self._apply_backpressure)
+        threads = {}
+        while True:
+            self.limits.refresh()
+            with self._running_cond:
+                self._running_cond.notify_all()
+
+            for method in self.methods:
+                for slot in self.limits.slot_ids_for(method):
+                    thread = threads.get((method, slot))
+                    if thread is None or not thread.is_alive():
+                        thread = threading.Thread(target=self.run_slot, args=(method, slot), daemon=True)
+                        thread.start()
+                        threads[(method, slot)] = thread
+            time.sleep(CONCURRENCY_REFRESH_SEC)
+
+    def send_heartbeat(self):
+        with self._registry_lock:
+            running = len(self.slot_registry)
+        status = {
+            "host": self.hostname,
+            "pid": os.getpid(),
+            "methods": ",".join(self.methods),
+            "started_at": int(self.started_at),
+            "running": running,
+            "slots": json.dumps({method: len(self.limits.slot_ids_for(method)) for method in self.methods}),
+        }
+        send_heartbeat(self.redis_client, self.orchestrator_id, status=status)
+        self.redis_client.expire(self.slot_registry_key, HEARTBEAT_TTL_SEC)
+
+    def stop_requested(self) -> bool:
+        requests = self.redis_client.hmget(ORCHESTRATOR_STOP_KEY, STOP_ALL_FIELD, self.orchestrator_id)
+        return any(requested and float(requested) >= self.started_at for requested in requests)
+
+    def run_housekeeping(self):
+        """
+        Refreshes our heartbeat, returns items and checkpoints of dead
+        orchestrators and failed items due for a retry to their queues and
+        shuts down when a stop was requested through Redis.
+        """
+        last_reap = 0
+        while True:
+            try:
+                self.send_heartbeat()
+                promote_due_retries(self.redis_client, self.methods)
+                if not self._stopping and self.stop_requested():
+                    log_message('INFO', {"msg": "Stop requested through redis, shutting down", "orchestrator": self.orchestrator_id})
+                    self._stopping = True
+                    # the shutdown exits the process, so it has to run in the main thread
+                    os.kill(os.getpid(), signal.SIGTERM)
+                if time.monotonic() - last_reap >= REAPER_INTERVAL_SEC:
+                    reap_orphaned_items(self.redis_client)
+                    resume_checkpoints(self.redis_client, self.methods)
+                    last_reap = time.monotonic()
+            except Exception as e:
+                log_message('ERROR', {"msg": "Error while sending heartbeat or reaping items", "error": e})
+            time.sleep(HEARTBEAT_TTL_SEC / 3)
+
+    def run_slot(self, method: str, slot):
+        queue = self._get_queue(method, slot)
+        producer_method = self.producer_pairs.get(method)
+        while not self._stopping:
+            if slot not in self.limits.slot_ids_for(method):
+                log_message('INFO', {"msg": "Slot no longer allowed, stopping it", "method": method, "slot": slot})
+                return
+
+            try:
+                if producer_method and queue_length(self.redis_client, get_queue_key(producer_method)) > 0:
+                    # the read slots start these consumers together with their producers
+                    time.sleep(CLAIM_TIMEOUT_SEC)
+                    continue
+                if queue.order == SHORTEST_FIRST:
+                    queue.max_work = self.limits.express_max_work
+                item = queue.claim()
+            except Exception as e:
+                log_message('ERROR', {"msg": "Error while claiming from queue", "redis_key": queue.queue_key, "slot": slot, "error": e})
+                time.sleep(CONCURRENCY_REFRESH_SEC)
+                continue
+            if item is None:
+                continue
+
+            timer = PhaseTimer(time.monotonic() - queue.last_claim_sec)
+            timer.add("claim", queue.last_claim_sec)
+            paired = None
+            try:
+                panel_data = decode_item(item)
+                with timer.phase("claim_pair"):
+                    paired = self._claim_paired_consumer(method, slot, item, panel_data)
+            except Exception as e:
+                log_message('ERROR', {"msg": "Error while preparing panel", "method": method, "slot": slot, "error": e})
+                self._fail(queue, method, item, f"invalid item: {e}")
+                continue
+
+            self._acquire_global_slot(2 if paired else 1)
+            try:
+                if self.run_migration(method, slot, panel_data, paired, timer) and not self._killed:
+                    with timer.phase("ack"):
+                        queue.ack(item)
+                        clear_attempts(self.redis_client, method, item)
+                    self._record_timings(method, panel_data, timer)
+                elif not self._killed:
+                    queue.requeue(item)
+                # killed by the shutdown, handle_sigterm checkpoints the item
+            except MigrationFailed as e:
+                if not self._killed:
+                    self._fail(queue, method, item, str(e))
+            except Exception as e:
+                log_message('ERROR', {"msg": "Error while running migration", "method": method, "slot": slot, "error": e})
+                if not self._killed:
+                    self._fail(queue, method, item, f"error: {e}")
+            finally:
+                self._release_global_slot(2 if paired else 1)
+
+    def run_migration(self, method: str, slot, panel_data: dict, paired: tuple = None, timer: PhaseTimer = None) -> bool:
+        """
+        Runs the migration of one panel for `method` and waits for it. With
+        `paired` = (consumer method, slot, queue, item) the consumer is started
+        first and waited for after the producer, whose chunk is counted down
+        as soon as it completed. Nothing is started while the host is
+        overloaded, producers not while kafka lag is too high. Returns False if
+        stopped before anything was started, raises MigrationFailed if the pid
+        of the (producer) process never showed up or the producer exited
+        without completing. The time of every phase is added to `timer`.
+        """
+        timer = timer or PhaseTimer()
+        panel_name = panel_data.get('panel_name')
+        held = 2 if paired else 1
+        with self._running_cond:
+            self._held += held
+        try:
+            with timer.phase(HELD_PHASE):
+                if self.lag_monitor and get_role(method) == "producer":
+                    self.lag_monitor.wait_until_clear(method, panel_name, stopping=lambda: self._stopping)
+                self.admission.wait_for_capacity(method, panel_name, stopping=lambda: self._stopping)
+        finally:
+            with self._running_cond:
+                self._held -= held
+                self._running_cond.notify_all()
+        if self._stopping:
+            if paired:
+                paired[2].requeue(paired[3])
+            return False
+        consumer_pid = None
+        if paired:
+            consumer_method, consumer_slot, consumer_queue, consumer_item = paired
+            consumer_pid = self.launch(consumer_method, consumer_slot, panel_data, timer)
+            if consumer_pid is None:
+                self._fail(consumer_queue, consumer_method, consumer_item, "pid of the consumer never registered")
+                paired = None
+
+        pid = self.launch(method, slot, panel_data, timer)
+        if pid is None:
+            if paired:
+                log_message('WARNING', {"msg": "Producer did not start, stopping its consumer", "client": panel_name, "method": consumer_method, "pid": consumer_pid})
+                subprocess.run(["kill", "-15", str(consumer_pid)])
+                self.wait_for_completion(consumer_method, consumer_slot, consumer_pid, panel_name)
+                self._fail(consumer_queue, consumer_method, consumer_item, "its producer did not start")
+            raise MigrationFailed("pid of the process never registered")
+
+        failure = None
+        with timer.phase(MIGRATION_PHASE):
+            exit_code = self.wait_for_completion(method, slot, pid, panel_name)
+            if not self._killed:
+                failure = self.get_exit_failure(method, panel_name, pid, exit_code)
+                if not failure:
+                    # kill_consumer.py stops the consumer of a chunked panel once no chunk is left,
+                    # this one has to be counted down before waiting for its paired consumer
+                    complete_chunk(self.redis_client, method, panel_data)
+            if paired:
+                if failure:
+                    log_message('WARNING', {"msg": "Producer failed, stopping its consumer", "client": panel_name, "method": consumer_method, "pid": consumer_pid})
+                    subprocess.run(["kill", "-15", str(consumer_pid)])
+                self.wait_for_completion(consumer_method, consumer_slot, consumer_pid, panel_name)
+        if self._killed:
+            return True
+        if paired:
+            if failure:
+                # retried together with its producer
+                self._fail(consumer_queue, consumer_method, consumer_item, f"its producer failed: {failure}")
+            else:
+                consumer_queue.ack(consumer_item)
+        if failure:
+            raise MigrationFailed(failure)
+        return True
+
+    def get_exit_failure(self, method: str, panel_name: str, pid, exit_code: int = None):
+        """
+        Why the producer that just exited failed, None if it finished. Only
+        producers report their own end, consumers are marked completed by
+        kill_consumer.py after they exited. `exit_code` is the one of the
+        script that ran the producer, a non-zero one is always a failure.
+        """
+        if get_role(method) != "producer":
+            return None
+        if exit_code not in (None, 0):
+            return f"process {pid} exited with code {exit_code}"
+        value = self.redis_client.hget(get_status_key(method, panel_name), method)
+        entry = decode_status(value) if value else {}
+        if str(entry.get("pid")) != str(pid):
+            # gone or already taken over by another chunk of the panel, only a clean exit tells it finished
+            return None if exit_code == 0 else f"process {pid} exited without a status entry"
+        if entry.get("status") == COMPLETED_STATUS:
+            return None
+        return f"process {pid} exited with status {entry.get('status')}"
+
+    def _fail(self, queue: ReliableQueue, method: str, item, reason: str):
+        """Hands a failed item to the retry set or the dead letter queue, back to the queue if that fails."""
+        try:
+            fail_item(self.redis_client, method, queue.processing_key, item, reason, self.retry_policy, self.orchestrator_id)
+        except Exception as e:
+            log_message('ERROR', {"msg": "Error while retrying failed panel, requeueing", "method": method, "reason": reason, "error": e})
+            queue.requeue(item)
+
+    def launch(self, method: str, slot, panel_data: dict, timer: PhaseTimer = None):
+        """
+        Starts the migration script and returns the pid of the migration
+        process, found in the script's process tree or, when it doesn't show
+        up there, as registered by it in redis. Returns None if neither
+        happened, after killing whatever the script left running.
+        """
+        timer = timer or PhaseTimer()
+        panel_name = panel_data.get('panel_name')
+        search_key = get_status_key(method, panel_name)
+        with self._launch_locks[hash((search_key, method)) % LAUNCH_LOCK_STRIPES]:
+            # an earlier run of this panel may have left its entry behind and other chunks
+            # of it may be running, only an entry with a new pid counts
+            previous = self.redis_client.hget(search_key, method)
+            with self._registry_lock:
+                running_pids = {entry["pid"] for key, entry in self.slot_registry.items() if key[0] == method and entry["panel_name"] == panel_name}
+
+            command = build_command(method, panel_data, self.custom_property_file, self.migration_script)
+            log_message('INFO', {'msg': "starting command", "command": command, "slot": slot})
+            with timer.phase("spawn"):
+                wrapper = subprocess.Popen(command, shell=True)
+            log_message("INFO", {"msg": "Process started successfully", "command": command, "wrapper_pid": wrapper.pid})
+
+            with timer.phase("registration"):
+                data = self.pid_registry.wait_for_registration(
+                    search_key, method, previous, ignore_pids=running_pids,
+                    find_process=lambda: find_descendant(wrapper.pid, MIGRATION_PROCESS_NAME),
+                    # a script that backgrounds the migration process exits 0 right away
+                    exited=lambda: wrapper.poll() not in (None, 0)
+                )
+            pid = data["pid"] if data else None
+            if pid is None:
+                log_message('ERROR', {"msg": "failed to get data, requeueing panel", "redis_key": search_key, "search_field": method, "timeout": PID_REGISTRATION_TIMEOUT_SEC, "wrapper_exit_code": wrapper.poll()})
+                terminate_tree(wrapper.pid)
+                wrapper.wait()
+                return None
+            with self._registry_lock:
+                self._wrappers[(method, slot)] = wrapper
+            self._register(method, slot, pid, panel_name)
+        return pid
+
+    def wait_for_completion(self, method: str, slot, pid, panel_name: str):
+        """Waits for the process to exit, returns the exit code of its script (None if there is none)."""
+        try:
+            log_message('INFO', {"msg": "Waiting for process to complete", 'pid': pid, "client": panel_name, "method": method, "slot": slot})
+            self.process_watcher.wait(pid)
+            with self._registry_lock:
+                wrapper = self._wrappers.pop((method, slot), None)
+            if wrapper is not None:
+                # the script may still clean up after the migration process, and must not stay a zombie
+                wrapper.wait()
+            exit_code = wrapper.returncode if wrapper else None
+            log_message('INFO', {"msg": "process completed", 'pid': pid, "client": panel_name, "method": method, "slot": slot, "exit_code": exit_code})
+            return exit_code
+        finally:
+            self._unregister(method, slot)
+
+    def _record_timings(self, method: str, panel_data: dict, timer: PhaseTimer):
+        try:
+            phases = timer.record(self.redis_client, method)
+            if MIGRATION_PHASE in phases:
+                add_observation(self.redis_client, method, estimate_work(panel_data), phases[MIGRATION_PHASE])
+            log_message('DEBUG', {"msg": "Phase timings", "method": method, "client": panel_data.get('panel_name'), **{name: round(seconds, 3) for name, seconds in phases.items()}})
+        except Exception as e:
+            log_message('WARNING', {"msg": "Error while recording phase timings", "method": method, "error": e})
+
+    def _get_queue(self, method: str, slot) -> ReliableQueue:
+        queue = self._queues.get((method, slot))
+        if queue is None:
+            if str(slot).startswith(EXPRESS_SLOT_PREFIX):
+                queue = ReliableQueue(self.redis_client, method, self.orchestrator_id, slot, SHORTEST_FIRST, self.limits.express_max_work)
+            else:
+                queue = ReliableQueue(self.redis_client, method, self.orchestrator_id, slot)
+            self._queues[(method, slot)] = queue
+        return queue
+
+    def _claim_paired_consumer(self, method: str, slot, item, panel_data: dict):
+        """
+        Claims the panel from the write queue paired with `method`, if it is
+        scheduled here. A chunk of a chunked panel only gets the consumer once
+        no other chunk of it is left queued: kill_consumer.py stops the
+        consumer after the last chunk, which could otherwise be waiting for
+        the very slot that waits for the consumer. A panel none of whose chunks
+        got it has its consumer started by a write slot.
+        """
+        consumer_method = self.consumer_pairs.get(method)
+        if consumer_method is None:
+            return None
+        panel_name = panel_data['panel_name']
+        if panel_data.get("chunk_count") and self._has_queued_chunks(method, panel_name):
+            return None
+        consumer_slot = f"pair{slot}"
+        consumer_queue = self._get_queue(consumer_method, consumer_slot)
+        consumer_data = {"panel_name": panel_name}
+        # push_panels_to_redis.py used to push the read payload to the write queues as well
+        for consumer_item in (encode_item(consumer_data), *legacy_items(consumer_data), item):
+            if consumer_queue.claim_item(consumer_item):
+                return consumer_method, consumer_slot, consumer_queue, consumer_item
+        return None
+
+    def _has_queued_chunks(self, method: str, panel_name: str) -> bool:
+        """
+        Whether chunks of the panel other than the one just claimed may still
+        be queued: unfinished chunks besides those running in our slots.
+        Chunks running elsewhere count as queued, so this errs towards True.
+        """
+        remaining = get_remaining_chunks(self.redis_client, panel_name, method)
+        with self._registry_lock:
+            running = sum(1 for key, entry in self.slot_registry.items() if key[0] == method and entry["panel_name"] == panel_name)
+        return remaining - running > 1
+
+    def handle_sigterm(self, signum, frame):
+        if self._drain_deadline is not None:
+            log_message("INFO", {"msg": "Received another SIGTERM while draining, stopping the drain"})
+            self._drain_deadline = 0
+            return
+        log_message("INFO", {"msg": "Received SIGTERM, Killing children and orchestration itself.", "drain_timeout": self.drain_timeout})
+        # slots stop claiming, items finishing while draining are still acked
+        self._stopping = True
+        self._apply_backpressure(False, set())
+        if self.drain_timeout > 0:
+            self.drain(self.drain_timeout)
+
+        self._killed = True
+        with self._registry_lock:
+            registry = dict(self.slot_registry)
+        for (method, slot), entry in registry.items():
+            try:
+                subprocess.run(["kill", "-15", str(entry["pid"])])
+                log_message('INFO', {"msg": f"Killed {get_role(method)} for method: {method}", "method": method, "slot": slot, "pid": entry["pid"]})
+            except Exception as e:
+                log_message('ERROR', {"msg": f"Error while killing {get_role(method)} for method: {method}", "method": method, "slot": slot, "pid": entry["pid"], "error": e})
+            self._unregister(method, slot)
+        for method in self.methods:
+            if not any(key[0] == method for key in registry):
+                log_message('WARNING', {"msg": f"No PID found for method: {method}"})
+        self.checkpoint_in_flight()
+        for (method, slot), queue in list(self._queues.items()):
+            moved = queue.release_all()
+            if moved:
+                log_message('INFO', {"msg": "Returned in-flight items to the queue", "method": method, "slot": slot, "items": moved})
+        self.redis_client.delete(HEARTBEAT_KEY_PREFIX + self.orchestrator_id, self.slot_registry_key)
+        sys.exit(0)
+
+    def drain(self, timeout: float):
+        """
+        Waits up to `timeout` seconds for the running migrations to finish, a
+        second SIGTERM cuts it short. Launches still held are not waited for,
+        they give up without starting anything.
+        """
+        self._drain_deadline = time.monotonic() + timeout
+        log_message('INFO', {"msg": "Draining, waiting for running migrations", "running": self._running - self._held, "held": self._held, "timeout": timeout})
+        with self._running_cond:
+            while self._running - self._held > 0 and time.monotonic() < self._drain_deadline:
+                self._running_cond.wait(min(self._drain_deadline - time.monotonic(), 1))
+            running = self._running - self._held
+        log_message('INFO' if not running else 'WARNING', {"msg": "Drained" if not running else "Drain deadline reached, checkpointing the running migrations", "running": running})
+
+    def checkpoint_in_flight(self):
+        """
+        Moves the items of the killed migrations to their method's checkpoint,
+        from where the next orchestrator resumes them at the uid they got to.
+        """
+        for (method, slot), queue in list(self._queues.items()):
+            for item in self.redis_client.lrange(queue.processing_key, 0, -1):
+                panel_name = None
+                try:
+                    panel_name = decode_item(item).get("panel_name")
+                    progress_uid = get_progress_uid(self.redis_client, get_status_key(method, panel_name), method)
+                    if checkpoint_item(self.redis_client, method, queue.processing_key, item, self.orchestrator_id, progress_uid):
+                        log_message('INFO', {"msg": "Checkpointed in-flight panel", "method": method, "slot": slot, "client": panel_name, "progress_uid": progress_uid})
+                except Exception as e:
+                    log_message('ERROR', {"msg": "Error while checkpointing in-flight panel, returning it to the queue", "method": method, "slot": slot, "client": panel_name, "error": e})
+
+    def _apply_backpressure(self, throttled: bool, throttled_panels: set):
+        """Pauses the running producers affected by kafka back-pressure and resumes the others."""
+        if not self.pause_producers:
+            return
+        with self._registry_lock:
+            producers = [(method, entry) for (method, _), entry in self.slot_registry.items() if get_role(method) == "producer"]
+        for method, entry in producers:
+            pid = entry["pid"]
+            pause = throttled or entry["panel_name"] in throttled_panels
+            if pause == (pid in self._paused_pids):
+                continue
+            try:
+                os.kill(pid, signal.SIGSTOP if pause else signal.SIGCONT)
+                log_message('INFO', {"msg": "Paused producer" if pause else "Resumed producer", "method": method, "client": entry["panel_name"], "pid": pid})
+            except ProcessLookupError:
+                pass
+            if pause:
+                self._paused_pids.add(pid)
+            else:
+                self._paused_pids.discard(pid)
+
+    def _register(self, method: str, slot, pid, panel_name: str):
+        entry = {"pid": pid, "panel_name": panel_name, "host": self.hostname, "started_at": int(time.time())}
+        with self._registry_lock:
+            self.slot_registry[(method, slot)] = entry
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.hset(self.slot_registry_key, f"{method}:{slot}", json.dumps(entry))
+            pipe.expire(self.slot_registry_key, HEARTBEAT_TTL_SEC)
+            pipe.execute()
+        except Exception as e:
+            log_message('WARNING', {"msg": "Error while publishing slot", "method": method, "slot": slot, "error": e})
+
+    def _unregister(self, method: str, slot):
+        with self._registry_lock:
+            entry = self.slot_registry.pop((method, slot), None)
+        if entry:
+            self._paused_pids.discard(entry["pid"])
+        try:
+            self.redis_client.hdel(self.slot_registry_key, f"{method}:{slot}")
+        except Exception as e:
+            log_message('WARNING', {"msg": "Error while removing slot", "method": method, "slot": slot, "error": e})
+
+    def _acquire_global_slot(self, count: int = 1):
+        with self._running_cond:
+            while self.limits.global_cap is not None and self._running + count > max(self.limits.global_cap, count):
+                self._running_cond.wait(CONCURRENCY_REFRESH_SEC)
+            self._running += count
+
+    def _release_global_slot(self, count: int = 1):
+        with self._running_cond:
+            self._running -= count
+            self._running_cond.notify_all()
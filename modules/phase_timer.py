@@ -0,0 +1,128 @@
+import time
+from contextlib import contextmanager
+
+# hash of <phase>:count, <phase>:sum and <phase>:le:<bucket> -> runs, per method
+TIMING_KEY_PREFIX = "orchestration_timing:"
+# upper bounds in seconds of the histogram buckets, the last one takes everything longer
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600, 14400)
+OVERFLOW_BUCKET = "inf"
+
+# phases of a run_migration() in the orchestrators
+TOTAL_PHASE = "total"
+MIGRATION_PHASE = "migration"
+# deliberate holds (admission control, kafka back-pressure), not counted as overhead
+HELD_PHASE = "held"
+# phases of the kill path of kill_consumer.py
+KILL_TOTAL_PHASE = "kill_total"
+
+
+def get_timing_key(method: str) -> str:
+    return TIMING_KEY_PREFIX + method
+
+
+def get_bucket(seconds: float) -> str:
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return str(bound)
+    return OVERFLOW_BUCKET
+
+
+class PhaseTimer:
+    """
+    Wall time per phase of one run, measured with the monotonic clock. A
+    phase entered more than once adds up, e.g. the launches of a producer
+    and its paired consumer.
+    """
+
+    def __init__(self, started: float = None):
+        self.started = time.monotonic() if started is None else started
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def record(self, redis_client, method: str, total_phase: str = TOTAL_PHASE):
+        """Adds the phases and the time since the timer started (as `total_phase`) to the method's histograms."""
+        phases = dict(self.phases)
+        phases[total_phase] = self.elapsed()
+        key = get_timing_key(method)
+        pipe = redis_client.pipeline(transaction=False)
+        for name, seconds in phases.items():
+            pipe.hincrby(key, f"{name}:count", 1)
+            pipe.hincrbyfloat(key, f"{name}:sum", round(seconds, 6))
+            pipe.hincrby(key, f"{name}:le:{get_bucket(seconds)}", 1)
+        pipe.execute()
+        return phases
+
+
+def percentile(buckets: dict, count: int, q: float):
+    """Upper bound of the bucket holding the q-th quantile, None for the overflow bucket."""
+    seen = 0
+    for bound in BUCKETS:
+        seen += buckets.get(str(bound), 0)
+        if seen >= q * count:
+            return bound
+    return None
+
+
+def get_timings(redis_client, method: str) -> dict:
+    """{phase: {"count", "sum", "avg", "p50", "p95", "buckets"}} of a method."""
+    phases = {}
+    for field, value in redis_client.hgetall(get_timing_key(method)).items():
+        if isinstance(field, bytes):
+            field, value = field.decode(), value.decode()
+        name, stat = field.split(":", 1)
+        phase = phases.setdefault(name, {"count": 0, "sum": 0.0, "buckets": {}})
+        if stat == "count":
+            phase["count"] = int(value)
+        elif stat == "sum":
+            phase["sum"] = float(value)
+        else:
+            phase["buckets"][stat.split(":", 1)[1]] = int(value)
+
+    for phase in phases.values():
+        count = phase["count"]
+        phase["sum"] = round(phase["sum"], 3)
+        phase["avg"] = round(phase["sum"] / count, 3) if count else None
+        phase["p50"] = percentile(phase["buckets"], count, 0.5) if count else None
+        phase["p95"] = percentile(phase["buckets"], count, 0.95) if count else None
+    return phases
+
+
+def get_overhead_summary(redis_client, methods: list) -> dict:
+    """
+    Orchestration overhead per method: the share of the total run time that
+    was neither the migration process itself nor a deliberate hold, plus the
+    per phase timings and the time kill_consumer.py spent stopping consumers.
+    """
+    summary = {}
+    for method in methods:
+        timings = get_timings(redis_client, method)
+        if not timings:
+            continue
+        total = timings.get(TOTAL_PHASE, {}).get("sum", 0)
+        migration = timings.get(MIGRATION_PHASE, {}).get("sum", 0)
+        held = timings.get(HELD_PHASE, {}).get("sum", 0)
+        overhead = max(total - migration - held, 0)
+        summary[method] = {
+            "runs": timings.get(TOTAL_PHASE, {}).get("count", 0),
+            "total_sec": round(total, 3),
+            "migration_sec": round(migration, 3),
+            "held_sec": round(held, 3),
+            "overhead_sec": round(overhead, 3),
+            "overhead_percent": round(overhead * 100 / total, 2) if total else None,
+            "kill_sec": timings.get(KILL_TOTAL_PHASE, {}).get("sum"),
+            "phases": {name: {stat: value for stat, value in phase.items() if stat != "buckets"} for name, phase in timings.items()},
+        }
+    return summary
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from modules.codec import decode_status
+from modules.log_utils import log_message
+from modules.status_events import enable_keyspace_events
+
+PID_REGISTRATION_TIMEOUT_SEC = 60
+INITIAL_POLL_INTERVAL_SEC = 0.1
+MAX_POLL_INTERVAL_SEC = 5
+# while the launched process tree is searched as well
+PROCESS_POLL_INTERVAL_SEC = 0.2
+STATUS_KEY_PATTERNS = ["producer_*", "consumer_*"]
+
+
+class PidRegistry:
+    """
+    Waits for the migration script to register its pid in the
+    `producer_<panel>` / `consumer_<panel>` hashes.
+
+    One pubsub connection follows the keyspace notifications of those hashes
+    and wakes the slots waiting on the key that changed, so a slot moves on
+    as soon as the pid is written. Every waiter still re-reads the hash with
+    exponential backoff, which covers missed notifications and servers where
+    notifications cannot be enabled.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.db = redis_client.connection_pool.connection_kwargs.get("db", 0)
+        self._lock = threading.Lock()
+        self._waiters: dict[str, list[threading.Event]] = {}
+        # K: keyspace events, h: the HSET of the pid
+        self.notifications_enabled = enable_keyspace_events(redis_client, "Kh")
+        if self.notifications_enabled:
+            threading.Thread(target=self._listen, name="pid-registry", daemon=True).start()
+
+    def _listen(self):
+        channel_prefix = f"__keyspace@{self.db}__:"
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(*[channel_prefix + pattern for pattern in STATUS_KEY_PATTERNS])
+                for message in pubsub.listen():
+                    key = message["channel"]
+                    if isinstance(key, bytes):
+                        key = key.decode()
+                    with self._lock:
+                        events = list(self._waiters.get(key.removeprefix(channel_prefix), []))
+                    for event in events:
+                        event.set()
+            except Exception as e:
+                log_message('ERROR', {"msg": "Keyspace notification listener failed, reconnecting", "error": e})
+                time.sleep(1)
+
+    def wait_for_registration(self, key: str, field: str, previous=None, timeout: float = PID_REGISTRATION_TIMEOUT_SEC, ignore_pids=(), find_process=None, exited=None):
+        """
+        Returns the decoded entry of `field` in `key` once it holds a value
+        other than `previous` (what the field held before the launch), or
+        None if nothing was registered within `timeout` seconds. Entries of
+        `ignore_pids`, other running chunks of the same panel, don't count.
+
+        `find_process()` is asked for the pid first on every round, an entry
+        of {"pid": pid} is returned as soon as it finds it. The wait gives up
+        early once `exited()` says the launched process is gone.
+        """
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(key, []).append(event)
+        try:
+            deadline = time.monotonic() + timeout
+            delay = INITIAL_POLL_INTERVAL_SEC
+            max_delay = PROCESS_POLL_INTERVAL_SEC if find_process else MAX_POLL_INTERVAL_SEC
+            while True:
+                if find_process is not None:
+                    pid = find_process()
+                    if pid is not None:
+                        return {"pid": pid}
+                # checked before the read, so a pid written right before the exit is still seen
+                gone = exited is not None and exited()
+                value = self.redis_client.hget(key, field)
+                if value is not None and value != previous:
+                    data = decode_status(value)
+                    if data.get("pid") not in ignore_pids:
+                        return data
+                    previous = value
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or gone:
+                    return None
+                event.wait(min(delay, remaining))
+                event.clear()
+                delay = min(delay * 2, max_delay)
+        finally:
+            with self._lock:
+                self._waiters[key].remove(event)
+                if not self._waiters[key]:
+                    del self._waiters[key]
@@ -0,0 +1,143 @@
+import os
+import select
+import threading
+
+import psutil
+
+
+class ProcessWatcher:
+    """
+    Tracks exits of processes we did not necessarily spawn (e.g. the java
+    process started by mongo_migration.sh) from one background thread.
+
+    On Linux >= 5.3 every watched PID gets a pidfd which becomes readable when
+    the process exits, so the thread sleeps in poll() until something actually
+    happens. Where pidfd_open is unavailable the thread falls back to checking
+    the watched PIDs through psutil every `fallback_interval` seconds.
+    Neither path forks.
+    """
+
+    def __init__(self, fallback_interval: float = 1.0):
+        self._fallback_interval = fallback_interval
+        self._lock = threading.Lock()
+        self._events: dict[int, threading.Event] = {}
+        self._pending: list[int] = []
+        self._fd_pids: dict[int, int] = {}
+        self._fallback: dict[int, psutil.Process] = {}
+        self._poller = select.poll()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._poller.register(self._wake_r, select.POLLIN)
+        self._thread = threading.Thread(target=self._run, name="process-watcher", daemon=True)
+        self._thread.start()
+
+    def watch(self, pid) -> threading.Event:
+        """Returns an event that is set once `pid` has exited."""
+        pid = int(pid)
+        with self._lock:
+            event = self._events.get(pid)
+            if event is None:
+                event = threading.Event()
+                self._events[pid] = event
+                self._pending.append(pid)
+        os.write(self._wake_w, b"\0")
+        return event
+
+    def wait(self, pid, timeout: float = None) -> bool:
+        """Blocks until `pid` exits. Returns False if `timeout` expired first."""
+        return self.watch(pid).wait(timeout)
+
+    def watched_pids(self) -> list[int]:
+        with self._lock:
+            return list(self._events)
+
+    def _finish(self, pid: int):
+        with self._lock:
+            event = self._events.pop(pid, None)
+        if event is not None:
+            event.set()
+
+    def _register_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for pid in pending:
+            try:
+                fd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                self._finish(pid)
+                continue
+            except (AttributeError, OSError):
+                try:
+                    self._fallback[pid] = psutil.Process(pid)
+                except psutil.NoSuchProcess:
+                    self._finish(pid)
+                continue
+            self._fd_pids[fd] = pid
+            self._poller.register(fd, select.POLLIN)
+
+    def _check_fallback(self):
+        for pid, process in list(self._fallback.items()):
+            try:
+                alive = process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+            except psutil.NoSuchProcess:
+                alive = False
+            if not alive:
+                del self._fallback[pid]
+                self._finish(pid)
+
+    def _run(self):
+        while True:
+            timeout_ms = int(self._fallback_interval * 1000) if self._fallback else None
+            for fd, _ in self._poller.poll(timeout_ms):
+                if fd == self._wake_r:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                self._poller.unregister(fd)
+                os.close(fd)
+                self._finish(self._fd_pids.pop(fd))
+            self._register_pending()
+            if self._fallback:
+                self._check_fallback()
+
+
+def find_descendant(pid: int, name: str):
+    """
+    Pid of the process called `name` (e.g. the java process the wrapper
+    script starts) in the tree under `pid`, `pid` itself included in case
+    the wrapper exec'd it. None if it isn't running (yet).
+    """
+    try:
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return None
+    for process in processes:
+        try:
+            if process.name() == name and process.status() != psutil.STATUS_ZOMBIE:
+                return process.pid
+        except psutil.NoSuchProcess:
+            continue
+    return None
+
+
+def terminate_tree(pid: int, timeout: float = 10):
+    """SIGTERM to `pid` and all its descendants, SIGKILL to what is left after `timeout` seconds."""
+    try:
+        root = psutil.Process(pid)
+        processes = root.children(recursive=True) + [root]
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
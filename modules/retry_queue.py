@@ -0,0 +1,189 @@
+import time
+
+from modules.codec import decode_item, decode_json, encode_status
+from modules.log_utils import log_message
+from modules.work_queue import get_queue_key, get_signal_key, estimate_work, SIGNAL_MAX_LEN
+
+# retry:<method>, sorted set of failed items waiting for their next attempt, scored by when
+# it is due. Like processing:, kept outside the read*/write* key space of the queues
+RETRY_KEY_PREFIX = "retry:"
+# dlq:<method>, hash of item -> failure of the items that used up their attempts
+DLQ_KEY_PREFIX = "dlq:"
+# hash of item -> failed attempts so far, per method
+ATTEMPTS_KEY_PREFIX = "migration_attempts:"
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY_SEC = 60
+DEFAULT_MAX_DELAY_SEC = 3600
+# status of a producer that finished. One killed by anything but the orchestrator itself is
+# retried, only kill_consumer.py takes "killed" as done, for the consumers it stops
+COMPLETED_STATUS = "completed"
+
+# moves the item from the processing list into the retry set, unless it already left it
+RETRY_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return 1
+"""
+
+# moves the item from the processing list into the dead letter queue, unless it already left it
+DEAD_LETTER_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('HDEL', KEYS[3], ARGV[1])
+return 1
+"""
+
+# puts a due item back on its queue and wakes one waiting slot, unless another orchestrator did already
+PROMOTE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('TYPE', KEYS[2]).ok == 'list' then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+else
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+end
+redis.call('LPUSH', KEYS[3], 1)
+redis.call('LTRIM', KEYS[3], 0, tonumber(ARGV[3]) - 1)
+return 1
+"""
+
+
+class MigrationFailed(Exception):
+    """The migration of a panel did not start or did not finish, the message says why."""
+
+
+def get_retry_key(method: str) -> str:
+    return RETRY_KEY_PREFIX + method
+
+
+def get_dlq_key(method: str) -> str:
+    return DLQ_KEY_PREFIX + method
+
+
+def get_attempts_key(method: str) -> str:
+    return ATTEMPTS_KEY_PREFIX + method
+
+
+class RetryPolicy:
+    """
+    Failed items are retried after base_delay, doubling with every attempt
+    up to max_delay, and go to the method's dead letter queue once they
+    failed max_attempts times.
+    """
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS, base_delay: float = DEFAULT_BASE_DELAY_SEC, max_delay: float = DEFAULT_MAX_DELAY_SEC):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_properties(cls, config_dict: dict):
+        return cls(
+            int(config_dict.get('retry_max_attempts', DEFAULT_MAX_ATTEMPTS)),
+            float(config_dict.get('retry_base_delay_sec', DEFAULT_BASE_DELAY_SEC)),
+            float(config_dict.get('retry_max_delay_sec', DEFAULT_MAX_DELAY_SEC)),
+        )
+
+    def get_delay(self, attempt: int) -> float:
+        return min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+
+
+def fail_item(redis_client, method: str, processing_key: str, item, reason: str, policy: RetryPolicy, orchestrator_id: str = None) -> bool:
+    """
+    Moves a failed item out of its processing list, into the retry set if it
+    has attempts left, into the dead letter queue otherwise. Returns True if
+    it was dead lettered.
+    """
+    attempt = redis_client.hincrby(get_attempts_key(method), item, 1)
+    try:
+        panel_name = decode_item(item).get("panel_name")
+    except (ValueError, SyntaxError):
+        panel_name = None
+
+    if attempt < policy.max_attempts:
+        delay = policy.get_delay(attempt)
+        script = redis_client.register_script(RETRY_SCRIPT)
+        script(keys=[processing_key, get_retry_key(method)], args=[item, time.time() + delay])
+        log_message('WARNING', {"msg": "Panel failed, retrying later", "method": method, "client": panel_name, "attempt": attempt, "retry_in_sec": delay, "reason": reason})
+        return False
+
+    failure = {
+        "panel_name": panel_name,
+        "reason": reason,
+        "attempts": attempt,
+        "orchestrator": orchestrator_id,
+        "failed_at": int(time.time()),
+    }
+    script = redis_client.register_script(DEAD_LETTER_SCRIPT)
+    script(keys=[processing_key, get_dlq_key(method), get_attempts_key(method)], args=[item, encode_status(failure)])
+    log_message('ERROR', {"msg": "Panel failed too often, moved to the dead letter queue", "method": method, "client": panel_name, "attempts": attempt, "reason": reason, "redis_key": get_dlq_key(method)})
+    return True
+
+
+def clear_attempts(redis_client, method: str, item):
+    redis_client.hdel(get_attempts_key(method), item)
+
+
+def promote_due_retries(redis_client, methods: list) -> int:
+    """Puts the failed items whose backoff is over back on their queues."""
+    script = redis_client.register_script(PROMOTE_SCRIPT)
+    now = time.time()
+    promoted = 0
+    for method in methods:
+        queue_key = get_queue_key(method)
+        for item in redis_client.zrangebyscore(get_retry_key(method), "-inf", now):
+            score = estimate_work(decode_item(item))
+            if script(keys=[get_retry_key(method), queue_key, get_signal_key(queue_key)], args=[item, score, SIGNAL_MAX_LEN]) == 1:
+                promoted += 1
+    return promoted
+
+
+def get_dead_letters(redis_client, methods: list) -> dict:
+    """{method: {item: failure}} of every method with dead lettered items."""
+    pipe = redis_client.pipeline(transaction=False)
+    for method in methods:
+        pipe.hgetall(get_dlq_key(method))
+    dead_letters = {}
+    for method, entries in zip(methods, pipe.execute()):
+        if entries:
+            dead_letters[method] = {(item.decode() if isinstance(item, bytes) else item): decode_json(failure) for item, failure in entries.items()}
+    return dead_letters
+
+
+def requeue_dead_letters(redis_client, methods: list, panels: list = None) -> dict:
+    """
+    Puts the dead lettered items of `methods`, only those of `panels` if
+    given, back on their queues with fresh attempts, in one pipeline.
+    Returns {method: items requeued}.
+    """
+    panels = set(panels) if panels else None
+    dead_letters = get_dead_letters(redis_client, methods)
+    pipe = redis_client.pipeline(transaction=False)
+    for method in dead_letters:
+        pipe.type(get_queue_key(method))
+    queue_types = dict(zip(dead_letters, pipe.execute()))
+
+    requeued = {}
+    pipe = redis_client.pipeline(transaction=True)
+    for method, failures in dead_letters.items():
+        items = [item for item, failure in failures.items() if panels is None or failure.get("panel_name") in panels]
+        if not items:
+            continue
+        queue_key = get_queue_key(method)
+        pipe.hdel(get_dlq_key(method), *items)
+        pipe.hdel(get_attempts_key(method), *items)
+        if queue_types[method] in ("list", b"list"):
+            pipe.rpush(queue_key, *items)
+        else:
+            pipe.zadd(queue_key, {item: estimate_work(decode_item(item)) for item in items})
+        pipe.lpush(get_signal_key(queue_key), *[1] * min(len(items), SIGNAL_MAX_LEN))
+        pipe.ltrim(get_signal_key(queue_key), 0, SIGNAL_MAX_LEN - 1)
+        requeued[method] = len(items)
+    if requeued:
+        pipe.execute()
+    return requeued
@@ -0,0 +1,72 @@
+from modules.log_utils import log_message
+from modules.uid_ranges import CHUNKS_KEY_PREFIX
+
+# hashes a migration reports its status in, see modules.orchestrator
+STATUS_KEY_PREFIXES = ("producer_", "consumer_", CHUNKS_KEY_PREFIX)
+# K: keyspace events, h: hash commands, g: DEL / EXPIRE and the like
+REQUIRED_EVENT_FLAGS = "Khg"
+# event classes the "A" flag stands for
+ALL_EVENT_CLASSES = "g$lshzxetd"
+
+
+def enable_keyspace_events(redis_client, required_flags: str = REQUIRED_EVENT_FLAGS) -> bool:
+    """
+    Makes redis publish the keyspace events of `required_flags`, merged into
+    the flags that are already set. Returns False where CONFIG is not allowed
+    (managed redis) and the flags are not set already, the caller then has to
+    poll.
+    """
+    try:
+        flags = redis_client.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+        if isinstance(flags, bytes):
+            flags = flags.decode()
+        enabled = set(flags) | (set(ALL_EVENT_CLASSES) if "A" in flags else set())
+        missing = set(required_flags) - enabled
+        if missing:
+            redis_client.config_set("notify-keyspace-events", "".join(sorted(set(flags) | missing)))
+        return True
+    except Exception as e:
+        log_message('WARNING', {"msg": "Keyspace events of redis can't be enabled, falling back to polling", "flags": required_flags, "err": str(e)})
+        return False
+
+
+class StatusEvents:
+    """
+    Names of the status hashes (producer_<panel>, consumer_<panel>,
+    migration_chunks:<panel>) written since the last call of changed_keys(),
+    from the keyspace events of redis.
+
+    Events are fire and forget, whatever happens while the connection is down
+    is lost: callers still sweep every key now and then.
+    """
+
+    def __init__(self, redis_client, db: int):
+        self._channel_prefix = f"__keyspace@{db}__:"
+        self._pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(*[self._channel_prefix + prefix + "*" for prefix in STATUS_KEY_PREFIXES])
+
+    def changed_keys(self, timeout: float) -> set:
+        """
+        Blocks up to `timeout` seconds for the first event, then takes whatever
+        else is already waiting. Returns the keys that changed, empty on timeout.
+        """
+        keys = set()
+        message = self._pubsub.get_message(timeout=max(timeout, 0))
+        while message is not None:
+            if message.get("type") == "pmessage":
+                channel = message["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                keys.add(channel.removeprefix(self._channel_prefix))
+            message = self._pubsub.get_message(timeout=0)
+        return keys
+
+    def close(self):
+        self._pubsub.close()
+
+
+def get_panel_name(key: str) -> str:
+    for prefix in STATUS_KEY_PREFIXES:
+        if key.startswith(prefix):
+            return key.removeprefix(prefix)
+    return None
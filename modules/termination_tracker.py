@@ -0,0 +1,83 @@
+import os
+import signal
+import threading
+
+from modules.codec import encode_status
+from modules.log_utils import log_message
+from modules.phase_timer import KILL_TOTAL_PHASE
+from modules.process_watcher import ProcessWatcher
+
+# seconds a consumer gets to stop after SIGTERM before it is sent SIGKILL
+DEFAULT_GRACE_SEC = 60
+# seconds to wait for the exit after SIGKILL, the status is marked either way
+KILL_WAIT_SEC = 5
+
+
+class TerminationTracker:
+    """
+    Stops consumers in the background: SIGTERM, SIGKILL once `grace_sec`
+    passed without the process exiting, then `status: completed` in its
+    consumer_<panel> entry. Each termination gets a thread that sleeps until
+    the process exits (see ProcessWatcher) or its deadline passes, so the
+    caller goes on checking the other consumers meanwhile.
+    """
+
+    def __init__(self, redis_client, grace_sec: float = DEFAULT_GRACE_SEC, watcher: ProcessWatcher = None):
+        self._redis_client = redis_client
+        self._grace_sec = grace_sec
+        self._watcher = watcher or ProcessWatcher()
+        self._lock = threading.Lock()
+        self._terminating = set()
+
+    def terminate(self, key: str, field: str, data: dict, timer) -> bool:
+        """
+        Starts stopping the consumer of the `field` entry of `key`, whose
+        status is `data`. Returns False if it is being stopped already.
+        """
+        with self._lock:
+            if (key, field) in self._terminating:
+                return False
+            self._terminating.add((key, field))
+        threading.Thread(target=self._run, args=(key, field, data, timer), name=f"terminate-{field}", daemon=True).start()
+        return True
+
+    def is_terminating(self, key: str, field: str) -> bool:
+        with self._lock:
+            return (key, field) in self._terminating
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._terminating)
+
+    def _run(self, key: str, field: str, data: dict, timer):
+        consumer_pid = data.get('pid')
+        topic_name = data.get('topic_name')
+        try:
+            if consumer_pid:
+                log_message('INFO', {'msg': 'killing consumer', 'consumer_pid': consumer_pid, 'topic_name': topic_name})
+                with timer.phase("kill_wait"):
+                    self._signal(consumer_pid, signal.SIGTERM)
+                    if not self._watcher.wait(consumer_pid, self._grace_sec):
+                        log_message('ERROR', {'msg': f'consumer did not stop after {self._grace_sec} seconds after issuing the kill', 'consumer_pid': consumer_pid, 'topic_name': topic_name})
+                        self._signal(consumer_pid, signal.SIGKILL)
+                        self._watcher.wait(consumer_pid, KILL_WAIT_SEC)
+
+            with timer.phase("kill_status_update"):
+                data['status'] = 'completed'
+                self._redis_client.hset(key, field, encode_status(data))
+            try:
+                timer.record(self._redis_client, field, KILL_TOTAL_PHASE)
+            except Exception as e:
+                log_message('WARNING', {'msg': "error recording kill timings", 'key': key, 'field': field, 'err': e})
+        except Exception as e:
+            log_message('ERROR', {'msg': "error stopping the consumer", 'key': key, 'field': field, 'consumer_pid': consumer_pid, 'err': e})
+        finally:
+            with self._lock:
+                self._terminating.discard((key, field))
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(int(pid), signum)
+        except ProcessLookupError:
+            pass
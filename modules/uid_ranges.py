@@ -0,0 +1,125 @@
+from pymongo.errors import OperationFailure
+
+from modules.log_utils import log_message
+
+# hash of <read method> -> chunks of the panel still to be migrated
+CHUNKS_KEY_PREFIX = "migration_chunks:"
+
+
+def get_chunks_key(panel_name: str) -> str:
+    return CHUNKS_KEY_PREFIX + panel_name
+
+
+def get_max_uid(client, db_name: str, coll_name: str):
+    """
+    Biggest uid of the collection, None if it has no documents with an int
+    uid. Walks the uid index backwards for one key, without it (hint fails)
+    the same query is left to the planner.
+    """
+    query = {"filter": {}, "projection": {"uid": 1, "_id": 0}, "sort": [("uid", -1)]}
+    collection = client[db_name][coll_name]
+    try:
+        document = collection.find_one(**query, hint=[("uid", 1)])
+    except OperationFailure:
+        document = collection.find_one(**query)
+    uid = document.get("uid") if document else None
+    return uid if isinstance(uid, int) else None
+
+
+def get_shard_chunk_boundaries(client, db_name: str, coll_name: str) -> list:
+    """
+    Lower uid bounds of the chunks of a collection range-sharded on uid, from
+    config.chunks. Returns an empty list for unsharded and hashed collections,
+    their chunk bounds say nothing about uids.
+    """
+    ns = f"{db_name}.{coll_name}"
+    collection_meta = client["config"]["collections"].find_one({"_id": ns})
+    if not collection_meta or collection_meta.get("dropped"):
+        return []
+    shard_key = list(collection_meta.get("key", {}).items())
+    if not shard_key or shard_key[0] != ("uid", 1):
+        return []
+
+    # mongo 5+ references chunks by collection uuid, older versions by ns
+    chunk_filter = {"uuid": collection_meta["uuid"]} if "uuid" in collection_meta else {"ns": ns}
+    boundaries = []
+    for chunk in client["config"]["chunks"].find(chunk_filter, {"min": 1, "_id": 0}):
+        uid = chunk["min"].get("uid")
+        if isinstance(uid, int):
+            boundaries.append(uid)
+    return sorted(boundaries)
+
+
+def get_bucket_boundaries(client, db_name: str, coll_name: str, buckets: int) -> list:
+    """Lower uid bounds of `buckets` buckets holding about the same number of documents."""
+    pipeline = [
+        {"$project": {"uid": 1, "_id": 0}},
+        {"$bucketAuto": {"groupBy": "$uid", "buckets": buckets}}
+    ]
+    result = client[db_name][coll_name].aggregate(pipeline, allowDiskUse=True)
+    return sorted(bucket["_id"]["min"] for bucket in result if isinstance(bucket["_id"]["min"], int))
+
+
+def split_uid_range(start_uid: int, end_uid: int, count: int, boundaries: list = None) -> list:
+    """
+    Splits [start_uid, end_uid] into at most `count` contiguous inclusive
+    ranges. With `boundaries` the cuts are spread evenly over them, so every
+    range gets about the same number of chunks/buckets, otherwise the uid
+    space is split into equal widths.
+    """
+    cuts = sorted(set(uid for uid in (boundaries or []) if start_uid < uid <= end_uid))
+    if cuts:
+        step = len(cuts) / count
+        cuts = sorted(set(cuts[int(step * i)] for i in range(1, count) if int(step * i) < len(cuts)))
+    else:
+        width = (end_uid - start_uid + 1) / count
+        cuts = sorted(set(start_uid + int(width * i) for i in range(1, count)) - {start_uid})
+
+    ranges = []
+    range_start = start_uid
+    for cut in cuts:
+        ranges.append((range_start, cut - 1))
+        range_start = cut
+    ranges.append((range_start, end_uid))
+    return ranges
+
+
+def get_uid_ranges(client, panel_name: str, coll_name: str, start_uid: int, end_uid: int, count: int) -> list:
+    """
+    Splits the panel's uid space into `count` balanced ranges, using the shard
+    chunks of `coll_name` when it is range-sharded on uid and $bucketAuto on
+    uid otherwise. Falls back to equal widths if neither is available.
+    """
+    if count <= 1:
+        return [(start_uid, end_uid)]
+
+    boundaries = []
+    try:
+        boundaries = get_shard_chunk_boundaries(client, panel_name, coll_name)
+        source = "config.chunks"
+        if len(boundaries) < count:
+            boundaries = get_bucket_boundaries(client, panel_name, coll_name, count)
+            source = "bucketAuto"
+    except Exception as e:
+        log_message('WARNING', {"msg": "Error while reading uid boundaries, splitting in equal widths", "client": panel_name, "coll": coll_name, "error": e})
+        source = "equal widths"
+
+    ranges = split_uid_range(start_uid, end_uid, count, boundaries)
+    log_message('INFO', {"msg": "Split uid range", "client": panel_name, "coll": coll_name, "source": source, "ranges": len(ranges)})
+    return ranges
+
+
+def set_remaining_chunks(redis_client, panel_name: str, methods: list, count: int):
+    redis_client.hset(get_chunks_key(panel_name), mapping={method: count for method in methods})
+
+
+def complete_chunk(redis_client, method: str, panel_data: dict):
+    """Counts down the chunks of a chunked panel once one of them finished."""
+    if panel_data.get("chunk_count"):
+        redis_client.hincrby(get_chunks_key(panel_data["panel_name"]), method, -1)
+
+
+def get_remaining_chunks(redis_client, panel_name: str, method: str) -> int:
+    """Chunks of the panel still to be migrated for `method`, 0 for panels that were not chunked."""
+    remaining = redis_client.hget(get_chunks_key(panel_name), method)
+    return max(int(remaining), 0) if remaining is not None else 0
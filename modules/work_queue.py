@@ -0,0 +1,392 @@
+import time
+
+from modules.codec import decode_item
+from modules.log_utils import log_message
+from modules.uid_ranges import get_chunks_key
+
+# processing:<method>_queue:<orchestrator_id>:<slot>, kept outside the read*/write* key space
+PROCESSING_KEY_PREFIX = "processing:"
+HEARTBEAT_KEY_PREFIX = "orchestrator_heartbeat:"
+HEARTBEAT_TTL_SEC = 30
+CLAIM_TIMEOUT_SEC = 5
+
+
+def get_queue_key(method: str) -> str:
+    return method + "_queue"
+
+
+def get_processing_key(method: str, worker_id: str) -> str:
+    return f"{PROCESSING_KEY_PREFIX}{get_queue_key(method)}:{worker_id}"
+
+
+def parse_processing_key(processing_key: str) -> tuple[str, str, str]:
+    """Returns (queue_key, orchestrator_id, slot) for a processing list key."""
+    queue_key, worker_id = processing_key.removeprefix(PROCESSING_KEY_PREFIX).split(":", 1)
+    orchestrator_id, slot = worker_id.rsplit(":", 1)
+    return queue_key, orchestrator_id, slot
+
+
+# wakes slots blocked on an empty queue, see ReliableQueue.claim()
+SIGNAL_KEY_PREFIX = "queue_signal:"
+SIGNAL_MAX_LEN = 1000
+# score = estimated work, the biggest panel is claimed first
+LONGEST_FIRST = "longest"
+SHORTEST_FIRST = "shortest"
+
+
+def get_signal_key(queue_key: str) -> str:
+    return SIGNAL_KEY_PREFIX + queue_key
+
+
+def estimate_work(panel_data: dict) -> float:
+    """
+    Estimated size of a panel, used as its score in the queue. Items carry
+    an explicit "work" estimate or are sized by their uid range, write
+    items without either all score 0.
+    """
+    if panel_data.get("work") is not None:
+        return float(panel_data["work"])
+    if panel_data.get("end_uid") is not None:
+        return float(panel_data["end_uid"]) - float(panel_data.get("start_uid") or 0)
+    return 0.0
+
+
+def queue_length(redis_client, queue_key: str) -> int:
+    """Number of queued items, for both sorted set and (legacy) list queues."""
+    key_type = redis_client.type(queue_key)
+    if isinstance(key_type, bytes):
+        key_type = key_type.decode()
+    if key_type == "zset":
+        return redis_client.zcard(queue_key)
+    if key_type == "list":
+        return redis_client.llen(queue_key)
+    return 0
+
+
+# Queues are sorted sets scored by estimate_work(). Lists pushed by older
+# versions of push_panels_to_redis.py are still served, in FIFO order.
+
+# pops the next item into a processing list: the highest score, or the lowest
+# one up to ARGV[2] for the express lane
+CLAIM_SCRIPT = """
+local key_type = redis.call('TYPE', KEYS[1]).ok
+local item = false
+if key_type == 'list' then
+    item = redis.call('LPOP', KEYS[1])
+elseif key_type == 'zset' then
+    local found
+    if ARGV[1] == 'shortest' then
+        found = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[2], 'LIMIT', 0, 1)
+    else
+        found = redis.call('ZREVRANGE', KEYS[1], 0, 0)
+    end
+    item = found[1] or false
+    if item then
+        redis.call('ZREM', KEYS[1], item)
+    end
+end
+if item then
+    redis.call('RPUSH', KEYS[2], item)
+end
+return item
+"""
+
+# moves one given item from the queue into a processing list, if it is still queued
+CLAIM_ITEM_SCRIPT = """
+local removed = 0
+if redis.call('TYPE', KEYS[1]).ok == 'list' then
+    removed = redis.call('LREM', KEYS[1], 1, ARGV[1])
+else
+    removed = redis.call('ZREM', KEYS[1], ARGV[1])
+end
+if removed == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# moves an item from a processing list back to the queue with score ARGV[2]
+# and wakes one waiting slot
+RETURN_ITEM_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('TYPE', KEYS[2]).ok == 'list' then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+else
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+end
+redis.call('LPUSH', KEYS[3], 1)
+redis.call('LTRIM', KEYS[3], 0, tonumber(ARGV[3]) - 1)
+return 1
+"""
+
+
+def enqueue(redis_client, method: str, items: list) -> int:
+    """
+    Adds the (item, panel_data) pairs to the method's queue, scored by
+    estimate_work(), and wakes the slots waiting on it. Returns the number
+    of items added.
+    """
+    if not items:
+        return 0
+    queue_key = get_queue_key(method)
+    signal_key = get_signal_key(queue_key)
+    pipe = redis_client.pipeline(transaction=False)
+    if redis_client.type(queue_key) in ("list", b"list"):
+        # a wave pushed by an older version is still queued, keep adding to it
+        pipe.rpush(queue_key, *[item for item, _ in items])
+    else:
+        pipe.zadd(queue_key, {item: estimate_work(panel_data) for item, panel_data in items})
+    pipe.lpush(signal_key, *[1] * min(len(items), SIGNAL_MAX_LEN))
+    pipe.ltrim(signal_key, 0, SIGNAL_MAX_LEN - 1)
+    pipe.execute()
+    return len(items)
+
+
+# set of the "<panel>|<method>" pairs a wave already queued, see WaveEnqueuer
+ENQUEUED_KEY_PREFIX = "enqueued:"
+ENQUEUED_TTL_SEC = 7 * 24 * 3600
+ENQUEUE_BATCH_SIZE = 500
+
+# queues the items of every pair not yet in the wave's set (KEYS[1]) and wakes
+# the slots once. A chunked pair sets its remaining chunks in its panel's
+# migration_chunks hash (KEYS[3 + n] of the nth pair) together with its items.
+# ARGV: signal max len, set ttl, method, then per pair the pair, its chunk
+# count (0 if not chunked), its item count and (item, score) of each item.
+# Returns the pairs it queued.
+ENQUEUE_WAVE_SCRIPT = """
+local is_list = redis.call('TYPE', KEYS[2]).ok == 'list'
+local pushed = {}
+local items = 0
+local pair = 0
+local i = 4
+while i <= #ARGV do
+    pair = pair + 1
+    local chunks = tonumber(ARGV[i + 1])
+    local count = tonumber(ARGV[i + 2])
+    if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+        if chunks > 0 then
+            redis.call('HSET', KEYS[3 + pair], ARGV[3], chunks)
+        end
+        for j = i + 3, i + 1 + 2 * count, 2 do
+            if is_list then
+                redis.call('RPUSH', KEYS[2], ARGV[j])
+            else
+                redis.call('ZADD', KEYS[2], ARGV[j + 1], ARGV[j])
+            end
+        end
+        pushed[#pushed + 1] = ARGV[i]
+        items = items + count
+    end
+    i = i + 3 + 2 * count
+end
+for _ = 1, math.min(items, tonumber(ARGV[1])) do
+    redis.call('LPUSH', KEYS[3], 1)
+end
+redis.call('LTRIM', KEYS[3], 0, tonumber(ARGV[1]) - 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return pushed
+"""
+
+
+def get_enqueued_key(wave: str) -> str:
+    return ENQUEUED_KEY_PREFIX + wave
+
+
+def get_pair(panel_name: str, method: str) -> str:
+    return f"{panel_name}|{method}"
+
+
+class WaveEnqueuer:
+    """
+    Queues the items of a wave of panels idempotently: every (panel, method)
+    pair is added to the wave's enqueued:<wave> set together with its items,
+    a pair already in it is skipped. Running the same wave again or adding
+    panels to it only queues what is missing. The remaining chunks of a
+    panel split into uid ranges are set in the same script as its items, so
+    no slot can claim a chunk before its panel's counter exists.
+
+    Pairs are buffered and queued `batch_size` at a time, one script call
+    per method in a single pipeline.
+    """
+
+    def __init__(self, redis_client, wave: str, batch_size: int = ENQUEUE_BATCH_SIZE, ttl_sec: int = ENQUEUED_TTL_SEC):
+        self.redis_client = redis_client
+        self.enqueued_key = get_enqueued_key(wave)
+        self.batch_size = batch_size
+        self.ttl_sec = ttl_sec
+        self._script = redis_client.register_script(ENQUEUE_WAVE_SCRIPT)
+        self._pending = {}
+        self._pending_pairs = 0
+        self.failed_pairs = set()
+
+    def add(self, panel_name: str, method: str, items: list) -> list:
+        """
+        Buffers the (item, panel_data) pairs of the panel's `method` and
+        queues the buffer once it is full. Returns the pairs queued by it.
+        """
+        self._pending.setdefault(method, []).append((panel_name, items))
+        self._pending_pairs += 1
+        if self._pending_pairs >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self) -> list:
+        """
+        Queues the buffered pairs, returns those that were not queued before.
+        The pairs of a batch redis failed on are kept in failed_pairs.
+        """
+        pending, self._pending, self._pending_pairs = self._pending, {}, 0
+        if not pending:
+            return []
+        methods = list(pending)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for method in methods:
+            queue_key = get_queue_key(method)
+            keys = [self.enqueued_key, queue_key, get_signal_key(queue_key)]
+            args = [SIGNAL_MAX_LEN, self.ttl_sec, method]
+            for panel_name, items in pending[method]:
+                keys.append(get_chunks_key(panel_name))
+                args += [get_pair(panel_name, method), items[0][1].get("chunk_count", 0) if items else 0, len(items)]
+                for item, panel_data in items:
+                    args += [item, estimate_work(panel_data)]
+            self._script(keys=keys, args=args, client=pipe)
+        try:
+            results = pipe.execute()
+        except Exception as e:
+            batch = [get_pair(panel_name, method) for method in methods for panel_name, _ in pending[method]]
+            log_message('ERROR', {"msg": "Error while queueing a batch of the wave", "redis_key": self.enqueued_key, "pairs": len(batch), "err": e})
+            self.failed_pairs.update(batch)
+            return []
+        pushed = []
+        for pairs in results:
+            pushed += [pair.decode() if isinstance(pair, bytes) else pair for pair in pairs]
+        return pushed
+
+
+class ReliableQueue:
+    """
+    Claims work items from `<method>_queue` for one orchestrator slot.
+
+    A claim atomically moves the item into the slot's own processing list,
+    so an item is always either queued or owned by a slot. It leaves the
+    processing list only when acked after the migration finished or when
+    it is requeued. Items of a dead orchestrator are returned to the queue
+    by reap_orphaned_items().
+
+    Slots claim the biggest panel first so the largest ones don't end up
+    setting the total run time, express slots (`order` = SHORTEST_FIRST)
+    take the smallest panel up to `max_work` so small panels are not stuck
+    behind the big ones.
+    """
+
+    def __init__(self, redis_client, method: str, orchestrator_id: str, slot, order: str = LONGEST_FIRST, max_work: float = None):
+        self.redis_client = redis_client
+        self.queue_key = get_queue_key(method)
+        self.signal_key = get_signal_key(self.queue_key)
+        self.processing_key = get_processing_key(method, f"{orchestrator_id}:{slot}")
+        self.order = order
+        self.max_work = max_work
+        # round trip of the claim that returned the last item
+        self.last_claim_sec = 0
+        self._claim = redis_client.register_script(CLAIM_SCRIPT)
+        self._claim_item = redis_client.register_script(CLAIM_ITEM_SCRIPT)
+        self._return_item = redis_client.register_script(RETURN_ITEM_SCRIPT)
+
+    def claim(self, timeout: float = CLAIM_TIMEOUT_SEC):
+        """
+        Claims the next item, blocking up to `timeout` seconds on the queue's
+        signal list while it is empty. Returns None if there was none.
+        """
+        deadline = time.monotonic() + timeout
+        max_work = "+inf" if self.max_work is None else self.max_work
+        while True:
+            started = time.monotonic()
+            item = self._claim(keys=[self.queue_key, self.processing_key], args=[self.order, max_work])
+            if item is not None:
+                self.last_claim_sec = time.monotonic() - started
+                return item
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # BLPOP takes whole seconds on older servers, fractions since 6.0
+            self.redis_client.blpop(self.signal_key, max(remaining, 0.01))
+
+    def claim_item(self, item) -> bool:
+        """Claims this exact item if it is still in the queue."""
+        return self._claim_item(keys=[self.queue_key, self.processing_key], args=[item]) == 1
+
+    def ack(self, item):
+        self.redis_client.lrem(self.processing_key, 1, item)
+
+    def requeue(self, item):
+        """Puts the item back on the queue with its original score."""
+        return_item(self.redis_client, self.processing_key, self.queue_key, item, self._return_item)
+
+    def release_all(self) -> int:
+        """Returns every item this slot still holds to the queue."""
+        return move_back(self.redis_client, self.processing_key, self.queue_key)
+
+
+def return_item(redis_client, processing_key: str, queue_key: str, item, script=None) -> bool:
+    try:
+        score = estimate_work(decode_item(item))
+    except (ValueError, SyntaxError):
+        score = 0
+    script = script or redis_client.register_script(RETURN_ITEM_SCRIPT)
+    return script(keys=[processing_key, queue_key, get_signal_key(queue_key)], args=[item, score, SIGNAL_MAX_LEN]) == 1
+
+
+def move_back(redis_client, processing_key: str, queue_key: str) -> int:
+    script = redis_client.register_script(RETURN_ITEM_SCRIPT)
+    moved = 0
+    for item in redis_client.lrange(processing_key, 0, -1):
+        if return_item(redis_client, processing_key, queue_key, item, script):
+            moved += 1
+    return moved
+
+
+def send_heartbeat(redis_client, orchestrator_id: str, ttl: int = HEARTBEAT_TTL_SEC, status: dict = None):
+    """
+    Refreshes the orchestrator's heartbeat hash, holding `status` for the
+    status APIs. Everything the orchestrator leases expires with it.
+    """
+    key = HEARTBEAT_KEY_PREFIX + orchestrator_id
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(key, mapping={**(status or {}), "heartbeat_at": int(time.time())})
+    pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def get_live_orchestrators(redis_client) -> dict:
+    """{orchestrator_id: status} of every orchestrator whose heartbeat has not expired, on any host."""
+    keys = [key.decode() if isinstance(key, bytes) else key for key in redis_client.scan_iter(match=HEARTBEAT_KEY_PREFIX + "*", count=1000)]
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+    orchestrators = {}
+    for key, status in zip(keys, pipe.execute(raise_on_error=False)):
+        if isinstance(status, dict) and status:
+            orchestrators[key.removeprefix(HEARTBEAT_KEY_PREFIX)] = {
+                (field.decode() if isinstance(field, bytes) else field): (value.decode() if isinstance(value, bytes) else value)
+                for field, value in status.items()
+            }
+    return orchestrators
+
+
+def reap_orphaned_items(redis_client) -> int:
+    """Moves items held by orchestrators whose heartbeat expired back to their queues."""
+    reaped = 0
+    for processing_key in redis_client.scan_iter(match=PROCESSING_KEY_PREFIX + "*", count=1000):
+        if isinstance(processing_key, bytes):
+            processing_key = processing_key.decode()
+        queue_key, orchestrator_id, slot = parse_processing_key(processing_key)
+        if redis_client.exists(HEARTBEAT_KEY_PREFIX + orchestrator_id):
+            continue
+        moved = move_back(redis_client, processing_key, queue_key)
+        if moved:
+            log_message('WARNING', {"msg": "Returned in-flight items of a dead orchestrator to the queue", "orchestrator": orchestrator_id, "slot": slot, "redis_key": queue_key, "items": moved})
+        reaped += moved
+    return reaped
@@ -1,11 +1,17 @@
 import redis
-import sys
-import ast
-import subprocess
-import logging
-from datetime import datetime
+import os
+import json
+import argparse
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pymongo import MongoClient
+from modules.work_queue import WaveEnqueuer, get_pair, ENQUEUE_BATCH_SIZE, ENQUEUED_TTL_SEC
+from modules.codec import encode_item, decode_item
+from modules.uid_ranges import get_uid_ranges, get_max_uid
+from modules.log_utils import setup_logger, log_message, get_log_settings
 
-PROPERTY_FILE = "/etc/mongoremodel.properties"
+PROPERTY_FILE = os.getenv("PROPERTY_FILE", "/etc/mongoremodel.properties")
 config_dict = {}
 
 def read_property_file() -> tuple[bool, dict]:
@@ -34,119 +40,12 @@ def read_property_file() -> tuple[bool, dict]:
 
 read_property_file()
 
-def parse_mongo_uri(uri: str) -> dict:
-    """
-    Converts a MongoDB URI into a dictionary with the specified format.
-    If fields are not present, they are set to None.
-    
-    Args:
-        uri (str): MongoDB URI to parse
-        
-    Returns:
-        dict: Dictionary containing parsed MongoDB configuration
-    """
-    try:
-        # Initialize with default values
-        config = {
-            "host": None,
-            "port": None,
-            "user": None,
-            "auth_source": "admin",
-            "passwd": None
-        }
-        
-        # Remove mongodb:// prefix if present
-        if uri.startswith("mongodb://"):
-            uri = uri[10:]
-        
-        # Split into parts
-        parts = uri.split("@")
-        
-        # Parse authentication if present
-        if len(parts) > 1:
-            auth_part = parts[0]
-            host_part = parts[1]
-            
-            # Parse username and password
-            auth_parts = auth_part.split(":")
-            if len(auth_parts) == 2:
-                config["user"] = auth_parts[0]
-                config["passwd"] = auth_parts[1]
-        else:
-            host_part = parts[0]
-        
-        # Parse host and port
-        host_parts = host_part.split("/")
-        host_port = host_parts[0].split(":")
-        
-        config["host"] = host_port[0]
-        if len(host_port) > 1:
-            config["port"] = int(host_port[1])
-        
-        # Parse auth source if present
-        if len(host_parts) > 1:
-            options = host_parts[1].split("&")
-            for option in options:
-                if option.startswith("authSource="):
-                    config["auth_source"] = option[11:]
-        
-        return config
-    except Exception as e:
-        return {
-            "host": None,
-            "port": None,
-            "user": None,
-            "auth_source": None,
-            "passwd": None
-        }
-
-#mongosh -u root -p icyiguana30  -host nc-mgin3-cfg2.netcore.in --port 27015 --authenticationDatabase admin
-# should be mogno5
-mongo_config = parse_mongo_uri(config_dict['src_mongo_uri'])
-
 redis_config = {
     "redis_host": config_dict['redis_uri'],
     "redis_port": int(config_dict['redis_port']),
     "redis_db": int(config_dict.get('redis_db', 0)) 
 }
 
-# get_latest_max_uids_commands="""perl -lne 'chomp; $cmd="mongosh -u root -p icyiguana30  -host nc-mgin3-cfg2.netcore.in --port 27015 --authenticationDatabase admin $_ --eval=\\047db.userDetails.find({},{uid:1,_id:0}).sort({uid:-1}).limit(1)\\047" if $_; $panel=$_ if $_; $out=`$cmd`; $uid = ($out =~ /uid: (\d+)/) ? $1 : ""; print "$panel,$uid"' """ + f"""{csv_file_path}"""
-# mongo_config = {
-#     "host": "nc-mgin3-cfg2.netcore.in",
-#     "port": 27015,
-#     "user": "root",
-#     "passwd": "icyiguana30"
-# }
-
-def setup_logger(log_file_path):
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(message)s",
-        handlers=[
-            logging.FileHandler(log_file_path, mode="a")
-        ]
-    )
-
-
-def log_message(level: str, data: dict):
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    log_level = level.upper()
-    log_details = " ".join([f"[{key}:{val}]" for key, val in data.items()])
-    message = f"{timestamp} {log_level} {log_details}"
-    
-    if log_level == "DEBUG":
-        logging.debug(message)
-    elif log_level == "INFO":
-        logging.info(message)
-    elif log_level == "WARNING":
-        logging.warning(message)
-    elif log_level == "ERROR":
-        logging.error(message)
-    elif log_level == "CRITICAL":
-        logging.critical(message)
-    else:
-        logging.info(message)
-
 try:
     r = redis.Redis(host=redis_config['redis_host'], port=redis_config['redis_port'], db=redis_config['redis_db'], decode_responses=True)
 except Exception as e:
@@ -159,102 +58,97 @@ disable_producer_methods = ["readDisableUserAttributes", "readDisableEngagementE
 consumer_methods = ["writeUserAttributes", "writeEngagementEventsToUserEvents", "writeUserDetailsToUserEvents"]
 anon_consumer_methods = ["writeAnonUserAttributes", "writeAnonEngagementEventsToAnonUserEvents", "writeAnonUserDetailsToAnonUserEvents"]
 disable_consumer_methods = ["writeDisableUserAttributes", "writeDisableEngagementEventsToDisabledUserEvents", "writeDisableUserDetailsToDisableUserEvents"]
+# collection the uid ranges of each panel type are computed on
+uid_collections = {"normal": "userDetails", "anon": "anonUserDetails", "disable": "disableUserDetails"}
+# number of uid ranges every read method of a panel is split into, 1 keeps one item per panel
+UID_RANGE_CHUNKS = int(config_dict.get('migration_uid_range_chunks', 1))
+# max uid lookups run concurrently, one pooled mongo connection each
+MAX_UID_PARALLELISM = int(config_dict.get('push_panels_parallelism', 16))
 
 # producer_methods = ["readAnonUserAttributes", "readDisableUserAttributes", "readAnonEngagementEventsWithMetaKey", "readDisableEngagementEventsWithMetaKey", "readAnonUserDetailsWithMetaKey", "readDisableUserDetailsWithMetaKey"]
 # consumer_methods = ["writeAnonUserAttributes", "writeDisableUserAttributes", "writeAnonEngagementEventsToAnonUserEvents", "writeDisableEngagementEventsToDisabledUserEvents", "writeAnonUserDetailsToAnonUserEvents", "writeDisableUserDetailsToDisableUserEvents"]
 
 
-def push_panel_to_redis(clients, is_both, panel_type):
-    try:
-        cnt = 0
-        for client, max_uid in clients:
+def get_producer_items(mongo_client, panel_data, panel_type, chunks):
+    """Read items of a panel, one per uid range when it is split into `chunks` ranges."""
+    if chunks <= 1:
+        return [(encode_item(panel_data), panel_data)]
+
+    ranges = get_uid_ranges(mongo_client, panel_data["panel_name"], uid_collections[panel_type], panel_data["start_uid"], panel_data["end_uid"], chunks)
+    items = []
+    for chunk_id, (start_uid, end_uid) in enumerate(ranges):
+        chunk_data = {
+            "panel_name": panel_data["panel_name"],
+            "start_uid": start_uid,
+            "end_uid": end_uid,
+            "chunk_id": chunk_id,
+            "chunk_count": len(ranges),
+            # the ranges hold about the same number of documents, not the same number of uids
+            "work": (panel_data["end_uid"] - panel_data["start_uid"]) / len(ranges)
+        }
+        items.append((encode_item(chunk_data), chunk_data))
+    return items
+
+
+def get_panel_items(client, max_uid, is_both, panel_type, chunks=1, mongo_client=None) -> list:
+    """(method, [(item, panel_data)]) of the read and/or write methods of one panel."""
+    panel_name = client
+    start_uid = 1
+    end_uid = int(max_uid + max_uid * 0.1)
+
+    panel_data = {"panel_name": panel_name, "start_uid": start_uid, "end_uid": end_uid}
+    # queues are sorted by the uid range, so the biggest panels start first
+    # consumers take no uid range, the scheduler pairs them with their producer by this payload
+    consumer_data = {"panel_name": panel_name}
+    type_producer_methods = anon_producer_methods if panel_type == "anon" else disable_producer_methods if panel_type == "disable" else producer_methods
+    type_consumer_methods = anon_consumer_methods if panel_type == "anon" else disable_consumer_methods if panel_type == "disable" else consumer_methods
+
+    method_items = []
+    if is_both in (1, 2):
+        producer_items = get_producer_items(mongo_client, panel_data, panel_type, chunks)
+        method_items += [(producer_method, producer_items) for producer_method in type_producer_methods]
+    if is_both != 2:
+        consumer_items = [(encode_item(consumer_data), consumer_data)]
+        method_items += [(consumer_method, consumer_items) for consumer_method in type_consumer_methods]
+    return method_items
+
+
+def get_max_uids(mongo_client, panels, parallelism):
+    """
+    Yields (panel_type, panel, max uid) of every panel and collection type as
+    the lookups finish, `parallelism` at a time over the pooled client. The
+    max uid is None where the collection has no uid (or the lookup failed).
+    """
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = {
+            executor.submit(get_max_uid, mongo_client, panel, coll_name): (panel_type, panel)
+            for panel in panels for panel_type, coll_name in uid_collections.items()
+        }
+        for future in as_completed(futures):
+            panel_type, panel = futures[future]
             try:
-                panel_name = client
-                start_uid = 1
-                end_uid = None
-                
-                if max_uid is None:
-                    continue
-                else:
-                    end_uid = int(max_uid + max_uid * 0.1)
-                    
-                # start_uid = int(start_uid) if start_uid.isdigit() else None
-                # end_uid = int(end_uid) if end_uid.isdigit() else None
-
-                panel_data = {"panel_name": panel_name}
-                if start_uid is not None:
-                    panel_data["start_uid"] = start_uid
-                if end_uid is not None:
-                    panel_data["end_uid"] = end_uid
-                
-                if is_both == 1:
-                    if panel_type == "anon":
-                        for producer_method in anon_producer_methods:
-                            # print(producer_method + "_queue", str(panel_data))
-                            r.rpush(producer_method + "_queue", str(panel_data))
-                    elif panel_type == "disable":
-                        for producer_method in disable_producer_methods:
-                            # print(producer_method + "_queue", str(panel_data))
-                            r.rpush(producer_method + "_queue", str(panel_data))
-                    else:
-                        for producer_method in producer_methods:
-                            # print(producer_method + "_queue", str(panel_data))
-                            r.rpush(producer_method + "_queue", str(panel_data))
-                    if panel_type == "anon":
-                        for consumer_method in anon_consumer_methods:
-                            # print(consumer_method + "_queue", str(panel_data))
-                            r.rpush(consumer_method + "_queue", str(panel_data))
-                    elif panel_type == "disable":
-                        for consumer_method in disable_consumer_methods:
-                            # print(consumer_method + "_queue", str(panel_data))
-                            r.rpush(consumer_method + "_queue", str(panel_data))
-                    else:
-                        for consumer_method in consumer_methods:
-                            # print(consumer_method + "_queue", str(panel_data))
-                            r.rpush(consumer_method + "_queue", str(panel_data))
-                    log_message("INFO", {"db": client, "msg": f"successfully pushed"})
-                elif is_both == 2:
-                    if panel_type == "anon":
-                        for producer_method in anon_producer_methods:
-                            # print(producer_method + "_queue", str(panel_data))
-                            r.rpush(producer_method + "_queue", str(panel_data))
-                    elif panel_type == "disable":
-                        for producer_method in disable_producer_methods:
-                            # print(producer_method + "_queue", str(panel_data))
-                            r.rpush(producer_method + "_queue", str(panel_data))
-                    else:
-                        for producer_method in producer_methods:
-                            # print(producer_method + "_queue", str(panel_data))
-                            r.rpush(producer_method + "_queue", str(panel_data))
-                else:
-                    if panel_type == "anon":
-                        for consumer_method in anon_consumer_methods:
-                            # print(consumer_method + "_queue", str(panel_data))
-                            r.rpush(consumer_method + "_queue", str(panel_data))
-                    elif panel_type == "disable":
-                        for consumer_method in disable_consumer_methods:
-                            # print(consumer_method + "_queue", str(panel_data))
-                            r.rpush(consumer_method + "_queue", str(panel_data))
-                    else:
-                        for consumer_method in consumer_methods:
-                            # print(consumer_method + "_queue", str(panel_data))
-                            r.rpush(consumer_method + "_queue", str(panel_data))
-                cnt += 1
+                max_uid = future.result()
             except Exception as e:
-                log_message("ERROR", {"db": client, "msg": "Error while pushing panel to redis", "err": e})
-                continue
+                log_message("ERROR", {"msg": "Error while getting the max uid", "client": panel, "coll_type": panel_type, "error": str(e)})
+                max_uid = None
+            yield panel_type, panel, max_uid
 
-        log_message("INFO", {"msg": f"pushed {cnt} panels to redis"})
-    except Exception as e:
-        print(f"Error while pusing panels info to redis : {e}")
-        log_message("ERROR", {"msg": "Error while pusing panels info to redis", "err": e})
+
+def get_default_wave(panels_file_path: str) -> str:
+    """
+    <panels file name>:<hash of its contents>, the same panels file is the
+    same wave, another list under the same name is a new one.
+    """
+    with open(panels_file_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    return f"{os.path.basename(panels_file_path)}:{digest}"
 
 
 def read_panel_from_redis(redis_client, redis_key):
     try:
         panel_data = redis_client.lpop(redis_key)
         if panel_data:
-            panel_data = ast.literal_eval(panel_data)  # Convert string back to dictionary
+            panel_data = decode_item(panel_data)  # Convert string back to dictionary
             # print(f"Retrieved: {panel_data}")
             return panel_data
         else:
@@ -265,56 +159,122 @@ def read_panel_from_redis(redis_client, redis_key):
         return None
 
 
-def run_shell_command(command):
-    try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return result.stdout.decode("utf-8")
-    except subprocess.CalledProcessError as e:
-        raise Exception(f"Shell command error: {e}")
-    except subprocess.SubprocessError as e:
-        raise Exception(f"Shell subprocess error: {e}")
+class WavePush:
+    """
+    Queues the panels of a wave through a WaveEnqueuer and counts, per panel
+    type, the panels it pushed, those the wave had queued already (skipped)
+    and those that failed.
+    """
+
+    def __init__(self, enqueuer):
+        self.enqueuer = enqueuer
+        self.pairs = {}
+        self.pushed_pairs = set()
+        self.failed_panels = set()
+
+    def add(self, panel_type, panel_name, method_items):
+        for method, items in method_items:
+            pair = get_pair(panel_name, method)
+            self.pairs[pair] = (panel_type, panel_name)
+            self._pushed(self.enqueuer.add(panel_name, method, items))
+
+    def flush(self):
+        self._pushed(self.enqueuer.flush())
+
+    def _pushed(self, pairs):
+        self.pushed_pairs.update(pairs)
+
+    def get_counts(self) -> dict:
+        failed = set(self.failed_panels)
+        pushed, skipped = set(), set()
+        for pair, panel in self.pairs.items():
+            if pair in self.enqueuer.failed_pairs:
+                failed.add(panel)
+            elif pair in self.pushed_pairs:
+                pushed.add(panel)
+            else:
+                skipped.add(panel)
+        # a panel with some pairs queued before and the others now counts as pushed,
+        # one with any pair that failed as failed only
+        skipped -= pushed | failed
+        pushed -= failed
+        failed_names = {panel_name for _, panel_name in failed}
+        pushed_names = {panel_name for _, panel_name in pushed} - failed_names
+        skipped_names = {panel_name for _, panel_name in skipped} - pushed_names - failed_names
+
+        def per_type(panels):
+            return {panel_type: sum(1 for type_, _ in panels if type_ == panel_type) for panel_type in uid_collections}
+
+        return {
+            "pushed": per_type(pushed),
+            "skipped": per_type(skipped),
+            "failed": per_type(failed),
+            "pairs_pushed": len(self.pushed_pairs),
+            "pairs_skipped": len(self.pairs) - len(self.pushed_pairs) - len(self.enqueuer.failed_pairs),
+            "pairs_failed": len(self.enqueuer.failed_pairs),
+            "panels_pushed": len(pushed_names),
+            "panels_skipped": len(skipped_names),
+            "panels_failed": len(failed_names),
+        }
 
 
 if __name__ == "__main__":
-    if len(sys.argv) == 4:
-        csv_file_name = sys.argv[1]
-        log_file_name = sys.argv[2]
-        is_both = int(sys.argv[3])
-
-        setup_logger(log_file_name)
-
-        get_latest_max_uids_commands="""perl -lne 'chomp; $cmd="mongosh -u """ + mongo_config['user'] + """ -p """ + mongo_config['passwd'] + """ -host """ + mongo_config["host"] + """ --port """ + str(mongo_config['port']) + """ --authenticationDatabase admin $_ --eval=\\047db.userDetails.find({},{uid:1,_id:0}).sort({uid:-1}).limit(1)\\047" if $_; $panel=$_ if $_; $out=`$cmd`; $uid = ($out =~ /uid: (\d+)/) ? $1 : ""; print "$panel,$uid"' """ + f"""{csv_file_name}"""
-        get_latest_max_uids_commands_anon="""perl -lne 'chomp; $cmd="mongosh -u """ + mongo_config['user'] + """ -p """ + mongo_config['passwd'] + """ -host """ + mongo_config["host"] + """ --port """ + str(mongo_config['port']) + """ --authenticationDatabase admin $_ --eval=\\047db.anonUserDetails.find({},{uid:1,_id:0}).sort({uid:-1}).limit(1)\\047" if $_; $panel=$_ if $_; $out=`$cmd`; $uid = ($out =~ /uid: (\d+)/) ? $1 : ""; print "$panel,$uid"' """ + f"""{csv_file_name}"""
-        get_latest_max_uids_commands_disable="""perl -lne 'chomp; $cmd="mongosh -u """ + mongo_config['user'] + """ -p """ + mongo_config['passwd'] + """ -host """ + mongo_config["host"] + """ --port """ + str(mongo_config['port']) + """ --authenticationDatabase admin $_ --eval=\\047db.disableUserDetails.find({},{uid:1,_id:0}).sort({uid:-1}).limit(1)\\047" if $_; $panel=$_ if $_; $out=`$cmd`; $uid = ($out =~ /uid: (\d+)/) ? $1 : ""; print "$panel,$uid"' """ + f"""{csv_file_name}"""
-        
-        for command in [(get_latest_max_uids_commands, 'normal'), (get_latest_max_uids_commands_anon, 'anon'), (get_latest_max_uids_commands_disable, 'disable')]:
-            try:
-                clients = run_shell_command(command[0])
-                clients = [line.strip().split(",") for line in clients.strip().split("\n")]
-            except Exception as e:
-                log_message("ERROR", {"mag": "Error executing shell command", "command": command[0], "error": str(e)})
-                exit()
-
-            clients = [[name, int(num) if num.isdigit() else None] for name, num in clients]
-            for name, num in clients:
-                if num is None:
-                    log_message("ERROR", {"mag": "client not found", "client": name, "coll_type": command[1]})
-                    clients.remove([name, num])
-                    continue
-
-            clients = [client for client in clients if client[1] is not None]
-            
-            log_message("INFO", {"msg": f"starting to push {len(clients)} panels to redis"})
-            
-            push_panel_to_redis(clients, is_both, command[1])
-
-            # for producer_method in producer_methods: # consumer_methods:
-            #     producer_method = producer_method + "_queue"
-            #     data = read_panel_from_redis(r, producer_method)            
-            #     while data:
-            #         print(data)
-            #         data = read_panel_from_redis(r, producer_method)
-            #     print()
-
-    else:
-        print("Please provide a CSV file path and redis key as an argument.")
+    parser = argparse.ArgumentParser(description="Push the read and/or write items of the panels of a panels file to their redis queues.")
+    parser.add_argument("panels_file_path", help="File with one panel per line")
+    parser.add_argument("log_file_name", help="Name of the log file")
+    parser.add_argument("is_both", type=int, help="1 for read and write items, 2 for read items only, anything else for write items only")
+    parser.add_argument("uid_range_chunks", type=int, nargs="?", default=UID_RANGE_CHUNKS, help="Number of uid ranges every read method of a panel is split into")
+    parser.add_argument("--parallelism", type=int, default=MAX_UID_PARALLELISM, help="Max uid lookups run concurrently against mongo")
+    parser.add_argument("--wave", default=None, help="Name of the wave, panel/method pairs it queued already are skipped (default: migration_wave property, else the panels file name and a hash of its contents)")
+    parser.add_argument("--batch-size", type=int, default=ENQUEUE_BATCH_SIZE, help="Panel/method pairs queued per pipeline")
+    args = parser.parse_args()
+
+    setup_logger(args.log_file_name, **get_log_settings(config_dict))
+    mongo_client = MongoClient(config_dict['src_mongo_uri'], maxPoolSize=args.parallelism)
+    wave = args.wave or config_dict.get('migration_wave') or get_default_wave(args.panels_file_path)
+    wave_push = WavePush(WaveEnqueuer(r, wave, args.batch_size, int(config_dict.get('migration_wave_ttl_sec', ENQUEUED_TTL_SEC))))
+
+    with open(args.panels_file_path, 'r') as f:
+        panels = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    log_message("INFO", {"msg": f"starting to push {len(panels)} panels to redis", "wave": wave, "parallelism": args.parallelism})
+
+    started = time.monotonic()
+    push_sec = 0
+    not_found = {panel_type: 0 for panel_type in uid_collections}
+    found_panels = set()
+    # every max uid is queued with the next batch as soon as it is known, while the other lookups go on
+    for panel_type, panel, max_uid in get_max_uids(mongo_client, panels, args.parallelism):
+        if max_uid is None:
+            log_message("ERROR", {"mag": "client not found", "client": panel, "coll_type": panel_type})
+            not_found[panel_type] += 1
+            continue
+        found_panels.add(panel)
+        push_started = time.monotonic()
+        try:
+            wave_push.add(panel_type, panel, get_panel_items(panel, max_uid, args.is_both, panel_type, args.uid_range_chunks, mongo_client))
+        except Exception as e:
+            log_message("ERROR", {"db": panel, "coll_type": panel_type, "msg": "Error while pushing panel to redis", "err": e})
+            wave_push.failed_panels.add((panel_type, panel))
+        push_sec += time.monotonic() - push_started
+    push_started = time.monotonic()
+    wave_push.flush()
+    push_sec += time.monotonic() - push_started
+
+    counts = wave_push.get_counts()
+    for panel_type in uid_collections:
+        log_message("INFO", {"msg": f"pushed {counts['pushed'][panel_type]} panels to redis", "coll_type": panel_type, "skipped": counts['skipped'][panel_type], "failed": counts['failed'][panel_type], "not_found": not_found[panel_type]})
+    total_sec = time.monotonic() - started
+    result = {
+        "wave": wave,
+        "panels": len(panels),
+        **counts,
+        "not_found": not_found,
+        "panels_not_found": len(panels) - len(found_panels),
+        "parallelism": args.parallelism,
+        "total_sec": round(total_sec, 2),
+        "push_sec": round(push_sec, 2),
+        "lookups_per_sec": round(len(panels) * len(uid_collections) / total_sec, 1) if total_sec else None,
+    }
+    log_message("INFO", {"msg": "push summary", **result})
+    # the last line of the output is the summary, read by smart_migration.py
+    print(json.dumps(result))
@@ -0,0 +1,87 @@
+import redis
+import os
+import signal
+import argparse
+
+from modules.log_utils import setup_logger, log_message, get_log_settings
+from modules.migration_methods import PRODUCER_METHODS, CONSUMER_METHODS
+from modules.admission import AdmissionController
+from modules.retry_queue import RetryPolicy
+from modules.kafka_offsets import LagMonitor
+from modules.orchestrator import MigrationOrchestrator
+
+PROPERTY_FILE = os.getenv("PROPERTY_FILE", "/etc/mongoremodel.properties")
+config_dict = {}
+
+def read_property_file() -> tuple[bool, dict]:
+    """
+    Reads the property file and returns its contents as a dictionary.
+    
+    Returns:
+        tuple: (success: bool, result: dict)
+            - success: True if file was read successfully, False otherwise
+            - result: Dictionary containing property file contents or error message
+    """
+    try:
+        global config_dict
+        config_dict = {}
+
+        with open(PROPERTY_FILE, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    if '=' in line:
+                        key, value = line.split('=', 1)
+                        config_dict[key.strip()] = value.strip()
+        return True, config_dict
+    except Exception as e:
+        return False, f"Failed to read property file: {str(e)}"
+
+read_property_file()
+
+redis_config = {
+    "redis_host": config_dict['redis_uri'],
+    "redis_port": int(config_dict['redis_port']),
+    "redis_db": int(config_dict.get('redis_db', 0)) 
+}
+
+try:
+    # one pool shared by every slot, the pid registry and the housekeeping thread
+    redis_pool = redis.ConnectionPool(host=redis_config['redis_host'], port=redis_config['redis_port'], db=redis_config['redis_db'], decode_responses=True)
+    r = redis.Redis(connection_pool=redis_pool)
+except Exception as e:
+    log_message('ERROR', {"msg": "error while connecting to redis", "error": e})
+    exit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run producers and consumers of every panel from one scheduler, starting each consumer together with its producer.")
+    parser.add_argument("log_file_name", help="Name of the log file")
+    parser.add_argument("--methods", help="Comma-separated list of read and/or write methods", default=None)
+    parser.add_argument("--custom-property-file", help="Path to the custom property file", default=None)
+    parser.add_argument("--slots", type=int, default=1, help="Default number of concurrent panels per method, overridable at runtime through the migration_concurrency redis hash")
+    parser.add_argument("--global-cap", type=int, default=None, help="Maximum number of concurrently running processes across all methods")
+    parser.add_argument("--express-slots", type=int, default=0, help="Extra slots per method that take the smallest panels first")
+    parser.add_argument("--express-max-work", type=int, default=None, help="Biggest panel (in uids) the express slots pick up")
+    parser.add_argument("--drain-timeout", type=int, default=int(config_dict.get('drain_timeout_sec', 0)), help="Seconds to let running migrations finish on SIGTERM before killing and checkpointing them")
+
+    args = parser.parse_args()
+
+    methods = args.methods.split(",") if args.methods else PRODUCER_METHODS + CONSUMER_METHODS
+
+    setup_logger(args.log_file_name, **get_log_settings(config_dict))
+    scheduler = MigrationOrchestrator(
+        r, methods, args.custom_property_file,
+        default_slots=args.slots,
+        global_cap=args.global_cap,
+        express_slots=args.express_slots,
+        express_max_work=args.express_max_work,
+        drain_timeout=args.drain_timeout,
+        migration_script=config_dict.get('custom_property_file_migration_script' if args.custom_property_file else 'migration_script'),
+        admission=AdmissionController.from_properties(config_dict),
+        retry_policy=RetryPolicy.from_properties(config_dict),
+        lag_monitor=LagMonitor.from_properties(r, config_dict),
+        pause_producers=config_dict.get('lag_pause_producers', 'false').lower() == 'true',
+    )
+    signal.signal(signal.SIGTERM, scheduler.handle_sigterm)
+    scheduler.run()
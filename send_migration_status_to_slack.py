@@ -5,6 +5,7 @@ import logging
 import requests
 import sys
 import subprocess
+from modules.work_queue import queue_length
 
 # Load properties
 def load_properties(path):
@@ -145,7 +146,7 @@ if __name__ == "__main__":
 
     for queue in queue_list:
         try:
-            qlen = redis_client.llen(queue)
+            qlen = queue_length(redis_client, queue)
             total_pending_count += qlen
             redis_status_lines.append("| {:<55} | {} / {:<16} |".format(queue, qlen, total_cnt))
         except Exception as e:
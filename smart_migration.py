@@ -13,7 +13,16 @@ from langchain.tools import Tool
 from langchain_google_genai import ChatGoogleGenerativeAI
 from kafka.admin import KafkaAdminClient
 from health_check_module import health_check
+from modules.work_queue import queue_length
+from modules.work_queue import get_live_orchestrators
+from modules.orchestrator import get_running_slots, request_stop, CONCURRENCY_CONTROL_KEY, DEFAULT_SLOTS_FIELD, GLOBAL_CAP_FIELD, EXPRESS_SLOTS_FIELD, EXPRESS_MAX_WORK_FIELD
+from modules.phase_timer import get_overhead_summary, TIMING_KEY_PREFIX
+from modules.eta import get_eta
+from modules.offset_history import OffsetHistory, get_group_names
+from modules.retry_queue import get_dead_letters, requeue_dead_letters
+from modules.migration_methods import PRODUCER_METHODS, CONSUMER_METHODS
 import shutil
+import socket
 from datetime import datetime
 import time
 import json
@@ -43,9 +52,12 @@ TS_DB_CREATION_LOG = BASE_DIR + "/logs/ts_db_creation.log"
 VALIDATION_OF_NON_EXISTANCE_OF_DBS_LOG = BASE_DIR + "/logs/validation_of_non_existence_of_dbs.log"
 RUN_PRODUCER_LOG = BASE_DIR + "/logs/run_producer.log"
 RUN_CONSUMER_LOG = BASE_DIR + "/logs/run_consumer.log"
+RUN_SCHEDULER_LOG = BASE_DIR + "/logs/run_scheduler.log"
 KILL_CONSUMER_LOG = BASE_DIR + "/logs/kill_consumer.log"
 PYTHON2_PATH = "/usr/local/bin/python2.7"
 NUM_PARTITIONS = 10
+# concurrency fields where 0 turns the limit off, the slots of a method or the default take at least 1
+ZERO_ALLOWED_CONCURRENCY_FIELDS = (GLOBAL_CAP_FIELD, EXPRESS_SLOTS_FIELD, EXPRESS_MAX_WORK_FIELD)
 
 SLACK_URL = os.getenv("SLACK_URL")
 llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-001", google_api_key=os.getenv("GOOGLE_API_KEY"))
@@ -398,11 +410,11 @@ def get_migration_status(*args, **kwargs) -> tuple[bool, str]:
         # Get length of each queue using traditional for loops
         read_queues = {}
         for key in read_keys:
-            read_queues[key] = redis_client.llen(key)
+            read_queues[key] = queue_length(redis_client, key)
             
         write_queues = {}
         for key in write_keys:
-            write_queues[key] = redis_client.llen(key)
+            write_queues[key] = queue_length(redis_client, key)
         
         # Format the output string
         output = "Migration Status:\n"
@@ -1250,9 +1262,11 @@ def check_migration_processes(*args, **kwargs) -> tuple[bool, dict]:
     Checks if any migration processes are running by checking for:
     1. run_producer
     2. run_consumer
-    3. kill_consumer
-    4. java write process
-    5. java read process
+    3. run_scheduler
+    4. kill_consumer
+    5. java write process
+    6. java read process
+    on this host, plus the orchestrators of every host that have a live heartbeat in Redis.
     
     Returns:
         tuple: (success: bool, result: dict)
@@ -1262,18 +1276,19 @@ def check_migration_processes(*args, **kwargs) -> tuple[bool, dict]:
     try:
         if LOG_LEVEL == "DEBUG":
             logging.debug(f"Checking migration processes")
-            return True, {"run_producer": False, "run_consumer": False, "kill_consumer": False, "java_write": False, "java_read": False}
+            return True, {"run_producer": False, "run_consumer": False, "run_scheduler": False, "kill_consumer": False, "java_write": False, "java_read": False, "orchestrators": {}}
         else:
             processes = {
                 'run_producer': False,
                 'run_consumer': False,
+                'run_scheduler': False,
                 'kill_consumer': False,
                 'java_write': False,
                 'java_read': False
             }
         
             # Check for each process
-            for process in ['run_producer', 'run_consumer', 'kill_consumer']:
+            for process in ['run_producer', 'run_consumer', 'run_scheduler', 'kill_consumer']:
                 result = subprocess.run(
                     f"ps -eaf | grep {process}",
                     capture_output=True,
@@ -1304,6 +1319,12 @@ def check_migration_processes(*args, **kwargs) -> tuple[bool, dict]:
             processes['java_read'] = len([line for line in result.stdout.splitlines() if "grep" not in line]) > 0
             logging.info(f"Number of java read process: {len(result.stdout.splitlines())}")
 
+            # orchestrators of all hosts, with the slots running a panel
+            orchestrators = get_live_orchestrators(redis_client)
+            for orchestrator_id, slots in get_running_slots(redis_client, orchestrators).items():
+                orchestrators[orchestrator_id]["slots"] = slots
+            processes['orchestrators'] = orchestrators
+            logging.info(f"Number of live orchestrators: {len(orchestrators)}")
 
             # if all of them are false retunrn false 
             is_running = False
@@ -1324,7 +1345,9 @@ def kill_migration_processes(*args, **kwargs) -> tuple[bool, str]:
     Kills any running migration processes:
     1. run_producer
     2. run_consumer
-    3. kill_consumer
+    3. run_scheduler
+    4. kill_consumer
+    on this host, and asks the orchestrators of every other host to stop through Redis.
     
     Returns:
         tuple: (success: bool, message: str)
@@ -1334,7 +1357,7 @@ def kill_migration_processes(*args, **kwargs) -> tuple[bool, str]:
             logging.debug(f"Killing migration processes")
             return True, "Successfully killed migration processes"
         else:
-            processes = ['run_producer', 'run_consumer', 'kill_consumer']
+            processes = ['run_producer', 'run_consumer', 'run_scheduler', 'kill_consumer']
             killed = []
             
             for process in processes:
@@ -1363,6 +1386,10 @@ def kill_migration_processes(*args, **kwargs) -> tuple[bool, str]:
                         subprocess.run(['kill', '-15', pid])
                         killed.append(f"{process} (PID: {pid})")
             
+            remote = [orchestrator_id for orchestrator_id, status in get_live_orchestrators(redis_client).items() if status.get("host") != socket.gethostname()]
+            request_stop(redis_client)
+            killed += [f"orchestrator {orchestrator_id} (stop requested)" for orchestrator_id in remote]
+
             if killed:
                 killed_str = "\n".join(killed)
                 logging.info(f"Successfully killed processes:\n{killed_str}")
@@ -1375,12 +1402,13 @@ def kill_migration_processes(*args, **kwargs) -> tuple[bool, str]:
 
 def push_panels_info_to_redis(*args, **kwargs) -> tuple[bool, str]:
     """
-    Pushes panels to Redis using push_panels_to_redis.py script
-    and verifies the output log for errors.
+    Pushes panels to Redis using push_panels_to_redis.py script and checks
+    the summary it prints: panels pushed now, panels the wave had queued
+    already (skipped on a re-run) and panels that failed or were not found.
     
     Returns:
         tuple: (success: bool, message: str)
-            - success: True if panels were pushed successfully, False otherwise
+            - success: True if every panel is queued, False otherwise
             - message: Status message describing the result
     """
     try:
@@ -1400,32 +1428,24 @@ def push_panels_info_to_redis(*args, **kwargs) -> tuple[bool, str]:
             if result.returncode != 0:
                 logging.error(f"Failed to push panels to Redis: {result.stderr}")
                 return False, f"Failed to push panels to Redis: {result.stderr}"
-                
-            # Check log file for error messages and get the latest info line
-            latest_info_line = None
-            with open(os.path.join(BASE_DIR, 'logs/push.log'), 'r') as f:
-                for line in f.readlines():
-                    if 'panels to redis' in line.lower() and 'info' in line.lower():
-                        latest_info_line = line.strip()
-            
-            if latest_info_line:
-                pushed = latest_info_line.split('pushed')[1].strip()
-                pushed_cnt = int(pushed.split(' ')[0])
-                success, total_result = get_panels_file_length()
-                if not success:
-                    logging.error(f"Failed to get total panels count: {total_result}")
-                    return False, f"Failed to get total panels count: {total_result}"
-                total_cnt = total_result['panels_count']
-                
-                if pushed_cnt == total_cnt:
-                    logging.info(f"Successfully pushed {pushed_cnt} panels to Redis")
-                    return True, f"Successfully pushed {pushed_cnt} panels to Redis"
-                else:
-                    logging.error(f"Failed to push {total_cnt-pushed_cnt} panels to Redis and successfully pushed {pushed_cnt} panels")
-                    return False, f"Failed to push {total_cnt-pushed_cnt} panels to Redis and successfully pushed {pushed_cnt} panels"
+
+            output = result.stdout.strip().splitlines()
+            if not output:
+                logging.error("No panel push summary found in the output")
+                return False, "No panel push summary found in the output"
+            summary = json.loads(output[-1])
+
+            pushed_cnt, skipped_cnt, total_cnt = summary['panels_pushed'], summary['panels_skipped'], summary['panels']
+            message = f"{pushed_cnt} panels pushed to Redis, {skipped_cnt} already queued by wave {summary['wave']}"
+            if pushed_cnt + skipped_cnt == total_cnt:
+                logging.info(f"Successfully pushed panels to Redis: {summary}")
+                return True, f"Successfully pushed panels to Redis: {message}"
             else:
-                logging.error("No panel push information found in log file")
-                return False, "No panel push information found in log file"
+                logging.error(f"Failed to push {total_cnt-pushed_cnt-skipped_cnt} panels to Redis: {summary}")
+                return False, f"Failed to push {total_cnt-pushed_cnt-skipped_cnt} of {total_cnt} panels to Redis ({summary['panels_failed']} failed, {summary['panels_not_found']} not found): {message}"
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to parse the panel push summary: {str(e)}")
+        return False, f"Failed to parse the panel push summary: {str(e)}"
     except Exception as e:
         logging.error(f"Failed to push panels to Redis: {str(e)}")
         return False, f"Failed to push panels to Redis: {str(e)}"
@@ -1724,6 +1744,51 @@ def start_consumer_processes_for_specific_methods(text: str, *args, **kwargs) ->
         return False, f"Failed to start consumer process: {str(e)}"
 
 
+def start_scheduler_processes(*args, **kwargs) -> tuple[bool, str]:
+    """
+    Starts the scheduler process which runs producers and consumers of all methods,
+    starting the consumer of every panel together with its producer, and verifies its status.
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        script = 'run_scheduler.py'
+        cmd = [
+            'python3',
+            os.path.join(BASE_DIR, script),
+            os.path.join(BASE_DIR, 'logs', RUN_SCHEDULER_LOG)
+        ]
+        if LOG_LEVEL == "DEBUG":
+            logging.debug(f"Starting scheduler process with command: {cmd}")
+            return True, "Successfully started scheduler process"
+        else:
+            subprocess.Popen(cmd)
+                
+            time.sleep(2)  # Give process time to start
+            
+            # Check process status
+            result = subprocess.run(
+                f'ps -eaf | grep {script}',
+                shell=True,
+                capture_output=True,
+                text=True
+            )
+            
+            # Count actual processes (excluding grep itself)
+            process_lines = [line for line in result.stdout.splitlines() if script in line and 'grep' not in line]
+            
+            if len(process_lines) == 1:
+                logging.info(f"Successfully started scheduler process\n" + result.stdout)
+                return True, "Successfully started scheduler process\n" + result.stdout
+            else:
+                logging.error(f"Expected 1 scheduler process but found {len(process_lines)}")
+                return False, f"Expected 1 scheduler process but found {len(process_lines)}"
+            
+    except Exception as e:
+        logging.error(f"Failed to start scheduler process: {str(e)}")
+        return False, f"Failed to start scheduler process: {str(e)}"
+
 def start_kill_consumer_processes(*args, **kwargs) -> tuple[bool, str]:
     """
     Starts kill consumer process and verifies its status.
@@ -1777,9 +1842,8 @@ def start_migration_processes(*args, **kwargs) -> tuple[bool, str]:
     """
     Starts migration processes and verifies their status:
     Also can be used to add more processes or clients to the migration
-    1. run_producer.py
-    2. run_consumer.py
-    3. kill_consumer.py
+    1. run_scheduler.py (producers and consumers)
+    2. kill_consumer.py
     
     Returns:
         tuple: (success: bool, message: str)
@@ -1791,16 +1855,10 @@ def start_migration_processes(*args, **kwargs) -> tuple[bool, str]:
             logging.debug(f"Starting migration processes (producer, consumer and kill_consumer processes)")
             return True, "Successfully started migration processes"
         else:
-            # Start producer process
-            success, message = start_producer_processes()
+            # Start scheduler process, it runs both producers and consumers
+            success, message = start_scheduler_processes()
             if not success:
-                logging.error(f"Failed to start producer process: {message}")
-                return False, message
-                
-            # Start consumer process
-            success, message = start_consumer_processes()
-            if not success:
-                logging.error(f"Failed to start consumer process: {message}")
+                logging.error(f"Failed to start scheduler process: {message}")
                 return False, message
                 
             # Start kill consumer process
@@ -1811,8 +1869,7 @@ def start_migration_processes(*args, **kwargs) -> tuple[bool, str]:
                 
             # Get final process status by checking each process separately
             processes = {
-                'run_producer.py': False,
-                'run_consumer.py': False,
+                'run_scheduler.py': False,
                 'kill_consumer.py': False
             }
             
@@ -1840,56 +1897,229 @@ def start_migration_processes(*args, **kwargs) -> tuple[bool, str]:
         logging.error(f"Failed to start migration processes: {str(e)}")
         return False, f"Failed to start migration processes: {str(e)}"
 
-def check_migration_concurrency(*args, **kwargs) -> tuple[bool, str]:
+def check_migration_concurrency(*args, **kwargs) -> tuple[bool, dict]:
     """
-    Checks the concurrency of the migration by counting running processes:
-    1. run_producer.py
-    2. run_consumer.py
+    Checks the concurrency of the migration: the configured slots per method
+    (migration_concurrency hash) and the slots currently running a panel
+    (migration_slots:<orchestrator> hashes published by the orchestrators of all hosts).
     
     Returns:
-        tuple: (success: bool, result: str)
+        tuple: (success: bool, result: dict)
             - success: True if check was successful, False otherwise
-            - result: Message describing the concurrency status or error message
+            - result: Dictionary with default slots, global cap, express lane and per method configured/running slots or error message
     """
     try:
         if LOG_LEVEL == "DEBUG":
             logging.debug(f"Checking migration concurrency")
             return True, "Successfully checked migration concurrency in DEBUG mode"
         else:
-            # Check producer processes
-            ps_process = subprocess.Popen(['ps', '-eaf'], stdout=subprocess.PIPE)
-        grep_process = subprocess.Popen(
-            ['grep', 'run_producer.py'],
-            stdin=ps_process.stdout,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        ps_process.stdout.close()
-        stdout, stderr = grep_process.communicate()
-        producer_count = len([line for line in stdout.decode().splitlines() if 'grep' not in line])
-        
-        # Check consumer processes
-        ps_process = subprocess.Popen(['ps', '-eaf'], stdout=subprocess.PIPE)
-        grep_process = subprocess.Popen(
-            ['grep', 'run_consumer.py'],
-            stdin=ps_process.stdout,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        ps_process.stdout.close()
-        stdout, stderr = grep_process.communicate()
-        consumer_count = len([line for line in stdout.decode().splitlines() if 'grep' not in line])
-        
-        if producer_count == consumer_count:
-            logging.info(f"Currently migration concurrency is {producer_count}")
-            return True, f"Currently migration concurrency is {producer_count}"
-        else:
-            logging.warning(f"Concurrency mismatch: {producer_count} producers and {consumer_count} consumers are running")
-            return False, f"Concurrency mismatch: {producer_count} producers and {consumer_count} consumers are running"
+            limits = {key.decode(): int(value) for key, value in redis_client.hgetall(CONCURRENCY_CONTROL_KEY).items()}
+            running_slots = [slot for slots in get_running_slots(redis_client).values() for slot in slots]
+
+            methods = {}
+            for slot in running_slots:
+                method = slot.rsplit(':', 1)[0]
+                methods.setdefault(method, {"configured": None, "running": 0})
+                methods[method]["running"] += 1
+            for method, slots in limits.items():
+                if method in (DEFAULT_SLOTS_FIELD, GLOBAL_CAP_FIELD, EXPRESS_SLOTS_FIELD, EXPRESS_MAX_WORK_FIELD):
+                    continue
+                methods.setdefault(method, {"configured": None, "running": 0})
+                methods[method]["configured"] = slots
+
+            result = {
+                "default_slots": limits.get(DEFAULT_SLOTS_FIELD),
+                "global_cap": limits.get(GLOBAL_CAP_FIELD),
+                "express_slots": limits.get(EXPRESS_SLOTS_FIELD),
+                "express_max_work": limits.get(EXPRESS_MAX_WORK_FIELD),
+                "running_total": len(running_slots),
+                "methods": methods
+            }
+            logging.info(f"Currently migration concurrency is {result}")
+            return True, result
     except Exception as e:
         logging.error(f"Failed to check migration concurrency: {str(e)}")
         return False, f"Failed to check migration concurrency: {str(e)}"
 
+def check_orchestration_overhead(*args, **kwargs) -> tuple[bool, dict]:
+    """
+    Checks how much of the migration time is orchestration overhead: per method
+    the total run time of the panels, the time the migration processes actually
+    ran, the time launches were held on purpose (host load, kafka lag) and the
+    rest as overhead in seconds and as a percentage of the total, plus the
+    timings of every phase (claim, spawn, pid registration, ack, the kill path
+    of kill_consumer.py) from the orchestration_timing:<method> histograms.
+    
+    Returns:
+        tuple: (success: bool, result: dict)
+            - success: True if check was successful, False otherwise
+            - result: Dictionary of method to overhead summary or error message
+    """
+    try:
+        if LOG_LEVEL == "DEBUG":
+            logging.debug(f"Checking orchestration overhead")
+            return True, "Successfully checked orchestration overhead in DEBUG mode"
+        else:
+            methods = sorted(key.decode().removeprefix(TIMING_KEY_PREFIX) for key in redis_client.scan_iter(match=TIMING_KEY_PREFIX + "*", count=1000))
+            result = get_overhead_summary(redis_client, methods)
+            logging.info(f"Orchestration overhead is {result}")
+            return True, result
+    except Exception as e:
+        logging.error(f"Failed to check orchestration overhead: {str(e)}")
+        return False, f"Failed to check orchestration overhead: {str(e)}"
+
+def get_migration_eta(*args, **kwargs) -> tuple[bool, dict]:
+    """
+    Predicts when the migration will be done, per method and overall. The
+    duration of a panel is fitted against its uid range from the panels that
+    already finished (updated by the orchestrators as panels finish, seeded
+    from the debug-*.log files by get_execution_time_mins_from_log_files.py)
+    and applied to the queued and running panels and the slots of the live
+    orchestrators.
+    
+    Returns:
+        tuple: (success: bool, result: dict)
+            - success: True if the ETA was computed, False otherwise
+            - result: Dictionary with the overall and per method ETA or error message
+    """
+    try:
+        if LOG_LEVEL == "DEBUG":
+            logging.debug(f"Getting migration ETA")
+            return True, "Successfully got migration ETA in DEBUG mode"
+        else:
+            result = get_eta(redis_client, get_running_slots(redis_client))
+            logging.info(f"Migration ETA is {result}")
+            return True, result
+    except Exception as e:
+        logging.error(f"Failed to get migration ETA: {str(e)}")
+        return False, f"Failed to get migration ETA: {str(e)}"
+
+def get_consumer_progress(*args, **kwargs) -> tuple[bool, dict]:
+    """
+    Gets the progress of every consumer group from its recent offset history
+    (the offset_history:<group> streams kill_consumer.py samples): lag, consume
+    and produce rates per second, estimated seconds until the lag is drained
+    and whether the group stalled, i.e. consumed nothing with lag left.
+    
+    Returns:
+        tuple: (success: bool, result: dict)
+            - success: True if check was successful, False otherwise
+            - result: Dictionary with the stalled groups and the progress per group or error message
+    """
+    try:
+        if LOG_LEVEL == "DEBUG":
+            logging.debug(f"Getting consumer progress")
+            return True, "Successfully got consumer progress in DEBUG mode"
+        else:
+            groups = OffsetHistory.from_properties(config_dict).get_stats(redis_client, get_group_names(redis_client))
+            result = {
+                "stalled": sorted(group_name for group_name, stats in groups.items() if stats["stalled"]),
+                "groups": groups,
+            }
+            logging.info(f"Consumer progress of {len(groups)} groups, stalled: {result['stalled']}")
+            return True, result
+    except Exception as e:
+        logging.error(f"Failed to get consumer progress: {str(e)}")
+        return False, f"Failed to get consumer progress: {str(e)}"
+
+def get_failed_panels(*args, **kwargs) -> tuple[bool, dict]:
+    """
+    Gets the panels that failed every retry of a method and were moved to its
+    dlq:<method> dead letter queue, with the reason of the last failure.
+    
+    Returns:
+        tuple: (success: bool, result: dict)
+            - success: True if check was successful, False otherwise
+            - result: Dictionary of method to the failed panels or error message
+    """
+    try:
+        if LOG_LEVEL == "DEBUG":
+            logging.debug(f"Getting failed panels")
+            return True, "Successfully got failed panels in DEBUG mode"
+        else:
+            dead_letters = get_dead_letters(redis_client, PRODUCER_METHODS + CONSUMER_METHODS)
+            result = {method: list(failures.values()) for method, failures in dead_letters.items()}
+            logging.info(f"Failed panels are {result}")
+            return True, result
+    except Exception as e:
+        logging.error(f"Failed to get failed panels: {str(e)}")
+        return False, f"Failed to get failed panels: {str(e)}"
+
+def requeue_failed_panels(text=None, *args, **kwargs) -> tuple[bool, str]:
+    """
+    Puts the failed panels of the dead letter queues back on their queues with
+    fresh retries, so only the failed panel/method pairs are migrated again.
+    
+    Args:
+        text (str | dict): optional JSON object with "panels" and/or "methods" lists
+            to requeue only those, everything in the dead letter queues without it
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        filters = (json.loads(text) if isinstance(text, str) else dict(text)) if text else {}
+        all_methods = PRODUCER_METHODS + CONSUMER_METHODS
+        methods = filters.get("methods") or all_methods
+        invalid = [method for method in methods if method not in all_methods]
+        if invalid:
+            return False, f"Invalid methods: {invalid}"
+
+        if LOG_LEVEL == "DEBUG":
+            logging.debug(f"Requeueing failed panels: {filters}")
+            return True, f"Requeued failed panels for {filters}"
+        else:
+            requeued = requeue_dead_letters(redis_client, methods, filters.get("panels"))
+            logging.info(f"Requeued failed panels: {requeued}")
+            return True, f"Requeued {sum(requeued.values())} failed panel/method pairs: {requeued}"
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to parse failed panels filter: {str(e)}")
+        return False, f"Failed to parse failed panels filter, expected a JSON object: {str(e)}"
+    except Exception as e:
+        logging.error(f"Failed to requeue failed panels: {str(e)}")
+        return False, f"Failed to requeue failed panels: {str(e)}"
+
+def set_migration_concurrency(text, *args, **kwargs) -> tuple[bool, str]:
+    """
+    Sets the number of concurrent panels per method at runtime, picked up by the
+    running orchestrators within a few seconds without a restart.
+    
+    Args:
+        text (str | dict): JSON object of <read or write method>: slots, "default": slots for unlisted methods,
+            "global": cap on concurrently running processes per orchestrator (0 removes the cap),
+            "express": extra slots per method taking the smallest panels first and
+            "express_max_work": biggest panel in uids the express slots take (0 removes the limit).
+            Slots are positive integers, only the last three fields take 0.
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        limits = json.loads(text) if isinstance(text, str) else dict(text)
+        if not isinstance(limits, dict):
+            return False, "Invalid migration concurrency, expected a JSON object"
+        for field, value in limits.items():
+            if field not in PRODUCER_METHODS and field not in CONSUMER_METHODS and field not in (DEFAULT_SLOTS_FIELD, *ZERO_ALLOWED_CONCURRENCY_FIELDS):
+                return False, f"Unknown concurrency field {field}, expected a read or write method or one of {DEFAULT_SLOTS_FIELD}, {', '.join(ZERO_ALLOWED_CONCURRENCY_FIELDS)}"
+            minimum = 0 if field in ZERO_ALLOWED_CONCURRENCY_FIELDS else 1
+            if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+                return False, f"Invalid concurrency for {field}: {value}, expected an integer of at least {minimum}"
+
+        if LOG_LEVEL == "DEBUG":
+            logging.debug(f"Setting migration concurrency: {limits}")
+            return True, f"Migration concurrency set to {limits}"
+        else:
+            if limits:
+                redis_client.hset(CONCURRENCY_CONTROL_KEY, mapping=limits)
+            logging.info(f"Migration concurrency set to {limits}")
+            return True, f"Migration concurrency set to {limits}"
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to parse migration concurrency: {str(e)}")
+        return False, f"Failed to parse migration concurrency, expected a JSON object: {str(e)}"
+    except Exception as e:
+        logging.error(f"Failed to set migration concurrency: {str(e)}")
+        return False, f"Failed to set migration concurrency: {str(e)}"
+
 def validate_time_series_collections(*args, **kwargs) -> tuple[bool, str]:
     """
     Validates time series indexes by running ts_mongo_ind_index_validation.py
@@ -2154,14 +2384,21 @@ tools = [
     Tool.from_function(func=get_panels_file_length, name="get_panels_file_length", description="Gets the number of panels in the panels.txt file."),
     Tool.from_function(func=delete_panels_file, name="delete_panels_file", description="Deletes the panels.txt file from the BASE_DIR."),
     Tool.from_function(func=clean_migration_logs, name="clean_migration_logs", description="Cleans the migration logs directory by backing up existing files to a timestamped directory."),
-    Tool.from_function(func=check_migration_processes, name="check_migration_processes", description="Checks if any migration processes are running by checking for: 1. run_producer 2. run_consumer 3. kill_consumer 4. java write process 5. java read process"),
-    Tool.from_function(func=kill_migration_processes, name="kill_migration_processes", description="Kills any running migration processes: 1. run_producer 2. run_consumer 3. kill_consumer"),
+    Tool.from_function(func=check_migration_processes, name="check_migration_processes", description="Checks if any migration processes are running by checking for: 1. run_producer 2. run_consumer 3. run_scheduler 4. kill_consumer 5. java write process 6. java read process on this host, plus the live orchestrators (and the panels they run) of every host."),
+    Tool.from_function(func=kill_migration_processes, name="kill_migration_processes", description="Kills any running migration processes: 1. run_producer 2. run_consumer 3. run_scheduler 4. kill_consumer on this host, and asks the orchestrators of every other host to stop."),
     Tool.from_function(func=pre_migration_check, name="pre_migration_check", description="Performs pre-migration checks and preparation for migration: 1. Health check 2. Redis cleanup and verification 3. Kafka cleanup, topic creation and validation 4. Log folder cleanup 5. Time series collections validation 6. Push panels to Redis 7. Check for running migration processes 8. Final health check"),
-    Tool.from_function(func=start_migration_processes, name="start_migration_processes", description="Starts migration processes and verifies their status and can be used to add more processes or clients to the migration: 1. run_producer.py 2. run_consumer.py 3. kill_consumer.py"),
-    Tool.from_function(func=check_migration_concurrency, name="check_migration_concurrency", description="Checks the concurrency of the migration by counting running processes: 1. run_producer.py 2. run_consumer.py"),
+    Tool.from_function(func=start_migration_processes, name="start_migration_processes", description="Starts migration processes and verifies their status and can be used to add more processes or clients to the migration: 1. run_scheduler.py (producers and consumers) 2. kill_consumer.py"),
+    Tool.from_function(func=check_migration_concurrency, name="check_migration_concurrency", description="Checks the concurrency of the migration: configured slots per method and the slots currently running a panel."),
+    Tool.from_function(func=check_orchestration_overhead, name="check_orchestration_overhead", description="Checks how much of the migration time per method is orchestration overhead (claiming, spawning, pid registration, acking, killing consumers) as a percentage of the total runtime, with the timings of every phase."),
+    Tool.from_function(func=get_migration_eta, name="get_migration_eta", description="Predicts when the migration will be done, per method and overall, from the durations of the panels that already finished and the queued and running panels."),
+    Tool.from_function(func=get_consumer_progress, name="get_consumer_progress", description="Gets the lag, consume and produce rates, estimated time to drain and stall state of every consumer group from its recent offset history."),
+    Tool.from_function(func=get_failed_panels, name="get_failed_panels", description="Gets the panels per method that failed all their retries and were moved to the dead letter queue, with the reason of the failure."),
+    Tool.from_function(func=requeue_failed_panels, name="requeue_failed_panels", description="Requeues the failed panels of the dead letter queues so only those panel/method pairs are migrated again. This function optionally expects a JSON object with 'panels' and/or 'methods' lists to requeue only those."),
+    Tool.from_function(func=set_migration_concurrency, name="set_migration_concurrency", description="Sets the number of concurrent panels per method at runtime without restarting the orchestrators. This function expects a JSON object of read or write method name to slots (positive integers), optionally with 'default', 'global', 'express' (small-panel express slots per method) and 'express_max_work' keys."),
     Tool.from_function(func=validate_time_series_collections, name="validate_time_series_collections", description="Validates time series indexes by running ts_mongo_ind_index_validation.py and checks the output log for errors.NOTE: This does not create the time series collections, it only validates them."),
     Tool.from_function(func=start_producer_processes, name="start_producer_processes", description="Starts the run_producer.py script which start the producer processes for all methods."),
     Tool.from_function(func=start_consumer_processes, name="start_consumer_processes", description="Starts the run_consumer.py script which start the consumer processes for all methods."),
+    Tool.from_function(func=start_scheduler_processes, name="start_scheduler_processes", description="Starts the run_scheduler.py script which runs the producer and consumer processes for all methods, starting the consumer of every panel together with its producer."),
     Tool.from_function(func=start_kill_consumer_processes, name="start_kill_consumer_processes", description="Starts the kill_consumer.py script which kills the consumer processes if the migration is completed for the respective method."),
     Tool.from_function(func=push_panels_info_to_redis, name="push_panels_info_to_redis", description="Runs the push_panels_info_to_redis.py script which pushes the panels info to Redis."),
     Tool.from_function(func=run_health_check, name="run_health_check", description="Runs the health_check.py script and returns the result."),
@@ -2548,6 +2785,57 @@ def api_check_migration_concurrency():
         return jsonify({"success": True, "data": result})
     return jsonify({"success": False, "message": result})
 
+@app.route('/migration/overhead', methods=['GET'])
+def api_check_orchestration_overhead():
+    success, result = check_orchestration_overhead()
+    if success:
+        return jsonify({"success": True, "data": result})
+    return jsonify({"success": False, "message": result})
+
+@app.route('/migration/eta', methods=['GET'])
+def api_get_migration_eta():
+    success, result = get_migration_eta()
+    if success:
+        return jsonify({"success": True, "data": result})
+    return jsonify({"success": False, "message": result})
+
+@app.route('/migration/consumers/progress', methods=['GET'])
+def api_get_consumer_progress():
+    success, result = get_consumer_progress()
+    if success:
+        return jsonify({"success": True, "data": result})
+    return jsonify({"success": False, "message": result})
+
+@app.route('/migration/failed', methods=['GET'])
+def api_get_failed_panels():
+    success, result = get_failed_panels()
+    if success:
+        return jsonify({"success": True, "data": result})
+    return jsonify({"success": False, "message": result})
+
+@app.route('/migration/failed/requeue', methods=['POST'])
+def api_requeue_failed_panels():
+    filters = request.get_json(silent=True) or {}
+    if not isinstance(filters, dict):
+        return jsonify({
+            "success": False,
+            "message": "JSON object with optional panels and methods lists is expected in request body"
+        }), 400
+
+    success, message = requeue_failed_panels(filters)
+    return jsonify({"success": success, "message": message})
+
+@app.route('/migration/concurrency', methods=['POST'])
+def api_set_migration_concurrency():
+    if not request.json or not isinstance(request.json, dict):
+        return jsonify({
+            "success": False,
+            "message": "JSON object of method to slots is required in request body"
+        }), 400
+
+    success, message = set_migration_concurrency(request.json)
+    return jsonify({"success": success, "message": message})
+
 @app.route('/migration/validate/ts-indexes', methods=['POST'])
 def api_validate_time_series_collections():
     success, message = validate_time_series_collections()
@@ -2568,6 +2856,11 @@ def api_start_consumer():
     success, message = start_consumer_processes()
     return jsonify({"success": success, "message": message})
 
+@app.route('/migration/start/scheduler', methods=['POST'])
+def api_start_scheduler():
+    success, message = start_scheduler_processes()
+    return jsonify({"success": success, "message": message})
+
 @app.route('/migration/start/kill-consumer', methods=['POST'])
 def api_start_kill_consumer():
     success, message = start_kill_consumer_processes()
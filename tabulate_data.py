@@ -6,6 +6,7 @@ import sys
 import ast
 from datetime import datetime
 import numpy as np
+from modules.codec import decode_json
 
 PROPERTY_FILE = "/etc/mongoremodel.properties"
 config_dict = {}
@@ -65,7 +66,7 @@ def fetch_and_display_redis_data(file_name=None, selected_columns=None, **filter
 
         for field, value in data.items():
             try:
-                parsed_value = json.loads(value)
+                parsed_value = decode_json(value)
 
                 if isinstance(parsed_value, dict):
                     parsed_value = [parsed_value]
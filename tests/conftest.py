@@ -0,0 +1,46 @@
+import shutil
+import socket
+import subprocess
+import time
+
+import pytest
+import redis
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def redis_port():
+    """Port of a throwaway redis-server, the tests needing redis are skipped where none is installed."""
+    binary = shutil.which("redis-server")
+    if binary is None:
+        pytest.skip("redis-server is not installed")
+    port = get_free_port()
+    process = subprocess.Popen([binary, "--port", str(port), "--save", "", "--appendonly", "no"], stdout=subprocess.DEVNULL)
+    client = redis.Redis(port=port)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            client.ping()
+            break
+        except redis.ConnectionError:
+            if time.monotonic() > deadline:
+                process.kill()
+                pytest.skip("redis-server did not start")
+            time.sleep(0.05)
+    yield port
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture
+def redis_client(redis_port):
+    """Client of an empty database, decoding responses like the orchestrator's."""
+    client = redis.Redis(port=redis_port, decode_responses=True)
+    client.flushall()
+    yield client
+    client.close()
@@ -0,0 +1,41 @@
+import time
+
+from modules.admission import AdmissionController, DEFAULT_THRESHOLDS
+
+SAMPLE = {"cpu_percent": 50, "memory_percent": 50, "load_per_cpu": 1.0, "disk_percent": 50, "free_fds": 10000}
+
+
+def test_no_violations_under_the_thresholds():
+    assert AdmissionController().violations(SAMPLE) == []
+
+
+def test_violations():
+    controller = AdmissionController()
+    violations = controller.violations({**SAMPLE, "cpu_percent": 95, "free_fds": 10})
+    assert [violation.split("=")[0] for violation in violations] == ["cpu_percent", "free_fds"]
+
+
+def test_zero_disables_a_check():
+    controller = AdmissionController({"admission_max_cpu_percent": 0})
+    assert controller.violations({**SAMPLE, "cpu_percent": 100}) == []
+
+
+def test_from_properties():
+    controller = AdmissionController.from_properties({"admission_max_memory_percent": "70", "admission_disk_path": "/nonexistent"})
+    assert controller.thresholds["admission_max_memory_percent"] == 70
+    assert controller.thresholds["admission_max_cpu_percent"] == DEFAULT_THRESHOLDS["admission_max_cpu_percent"]
+    assert controller.disk_path == "/"
+
+
+def test_not_held_with_every_check_disabled():
+    controller = AdmissionController({name: 0 for name in DEFAULT_THRESHOLDS})
+    assert controller.wait_for_capacity("readUserAttributes", "panel1") < 1
+
+
+def test_held_launch_gives_up_once_stopping():
+    controller = AdmissionController(check_interval=0.01)
+    controller.sample = lambda: {**SAMPLE, "cpu_percent": 100}
+    started = time.monotonic()
+    checks = iter([False, False, True])
+    controller.wait_for_capacity("readUserAttributes", "panel1", stopping=lambda: next(checks))
+    assert time.monotonic() - started < 1
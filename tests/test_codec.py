@@ -0,0 +1,33 @@
+import pytest
+
+from modules.codec import encode_item, decode_item, decode_status, legacy_items
+
+PANEL_DATA = {"panel_name": "panel1", "start_uid": 1, "end_uid": 1100, "chunk_id": 2, "chunk_count": 4}
+
+
+def test_round_trip():
+    item = encode_item(PANEL_DATA)
+    assert item.startswith('{"v":1')
+    assert '"p":"panel1"' in item
+    assert decode_item(item) == PANEL_DATA
+    assert decode_item(item.encode()) == PANEL_DATA
+
+
+def test_same_payload_same_item():
+    assert encode_item(PANEL_DATA) == encode_item(dict(PANEL_DATA))
+
+
+def test_decodes_legacy_items():
+    for item in legacy_items(PANEL_DATA):
+        assert decode_item(item) == PANEL_DATA
+    assert decode_item(str({"panel_name": "panel1"}).encode()) == {"panel_name": "panel1"}
+
+
+def test_unknown_version():
+    with pytest.raises(ValueError):
+        decode_item('{"v":2,"p":"panel1"}')
+
+
+def test_decode_status_of_a_list():
+    assert decode_status('[{"pid": 1, "status": "running"}, {"pid": 2}]') == {"pid": 1, "status": "running"}
+    assert decode_status('{"pid": 1}') == {"pid": 1}
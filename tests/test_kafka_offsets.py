@@ -0,0 +1,62 @@
+import threading
+from collections import namedtuple
+
+from kafka import TopicPartition
+
+from modules.kafka_offsets import KafkaOffsetReader
+
+OffsetAndMetadata = namedtuple("OffsetAndMetadata", ["offset", "metadata"])
+
+
+class FakeAdminClient:
+    def __init__(self, barrier):
+        self.barrier = barrier
+        self.closed = False
+
+    def list_consumer_group_offsets(self, group_id):
+        # every group has to be requested at once to get past the barrier
+        self.barrier.wait()
+        return {
+            TopicPartition("topic_" + group_id, 0): OffsetAndMetadata(7, ""),
+            TopicPartition("topic_" + group_id, 1): OffsetAndMetadata(-1, ""),
+        }
+
+    def close(self):
+        self.closed = True
+
+
+class FakeReader(KafkaOffsetReader):
+    def __init__(self, barrier, fetch_threads):
+        self.barrier = barrier
+        self.admin_clients = []
+        super().__init__("localhost:9092", fetch_threads=fetch_threads)
+
+    def _create_consumer(self):
+        return FakeAdminClient(self.barrier)
+
+    def _create_admin_client(self):
+        admin_client = FakeAdminClient(self.barrier)
+        self.admin_clients.append(admin_client)
+        return admin_client
+
+
+def test_committed_offsets_of_the_groups_are_fetched_concurrently():
+    groups = [f"group_{i}" for i in range(4)]
+    reader = FakeReader(threading.Barrier(len(groups), timeout=5), fetch_threads=len(groups))
+
+    offsets = reader.get_committed_offsets_batch(groups)
+
+    assert offsets == {group: {"topic_" + group: {0: 7}} for group in groups}
+    assert len(reader.admin_clients) == len(groups)
+    reader.close()
+    assert all(admin_client.closed for admin_client in reader.admin_clients)
+
+
+def test_admin_clients_are_reused_across_batches():
+    reader = FakeReader(threading.Barrier(1), fetch_threads=1)
+
+    reader.get_committed_offsets_batch(["a", "b"])
+    reader.get_committed_offsets_batch(["c"])
+
+    assert len(reader.admin_clients) == 1
+    reader.close()
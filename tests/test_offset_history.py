@@ -0,0 +1,55 @@
+from modules.offset_history import OffsetHistory, SOURCE_STATUS, SOURCE_KAFKA, get_group_names
+
+
+def test_rates_and_time_to_drain():
+    history = OffsetHistory(rate_windows=2)
+    stats = history.get_progress([(0, 0, 100, SOURCE_STATUS), (10, 20, 110, SOURCE_STATUS), (20, 50, 120, SOURCE_STATUS)])
+    assert (stats["lag"], stats["consume_rate"], stats["produce_rate"]) == (70, 2.5, 1.0)
+    assert stats["time_to_drain_sec"] == 47
+    assert not stats["stalled"] and not stats["drained"]
+
+
+def test_stalled():
+    history = OffsetHistory(stall_windows=2)
+    assert history.get_progress([(0, 10, 100, SOURCE_STATUS), (10, 10, 100, SOURCE_STATUS), (20, 10, 120, SOURCE_STATUS)])["stalled"]
+    assert not history.get_progress([(10, 10, 100, SOURCE_STATUS), (20, 10, 120, SOURCE_STATUS)])["stalled"]
+
+
+def test_drained_without_an_extra_window_once_lag_is_gone():
+    history = OffsetHistory(drained_windows=1)
+    assert history.get_progress([(0, 100, 100, SOURCE_KAFKA)])["drained"]
+    assert history.get_progress([(0, 90, 100, SOURCE_KAFKA), (10, 100, 100, SOURCE_KAFKA)])["drained"]
+    # the producer still wrote since the previous sample
+    assert not history.get_progress([(0, 90, 90, SOURCE_KAFKA), (10, 100, 100, SOURCE_KAFKA)])["drained"]
+    assert not history.get_progress([(0, 90, 100, SOURCE_KAFKA)])["drained"]
+
+
+def test_stats_only_use_the_samples_of_the_newest_source():
+    history = OffsetHistory(drained_windows=1)
+    stats = history.get_progress([(0, 0, 50, SOURCE_KAFKA), (10, 40, 90, SOURCE_STATUS), (20, 100, 100, SOURCE_KAFKA)])
+    assert (stats["source"], stats["samples"], stats["consume_rate"]) == (SOURCE_KAFKA, 1, None)
+    assert stats["drained"]
+
+
+def test_record_keeps_one_sample_per_interval_and_source(redis_client):
+    history = OffsetHistory(interval_sec=3600)
+    assert history.record(redis_client, {"group1": (10, 100, SOURCE_STATUS), "group2": (0, 0, SOURCE_STATUS)}) == 2
+    assert history.record(redis_client, {"group1": (20, 100, SOURCE_STATUS)}) == 0
+    samples = history.get_samples(redis_client, ["group1", "group3"])
+    assert list(samples) == ["group1"]
+    assert [sample[1:] for sample in samples["group1"]] == [(10, 100, SOURCE_STATUS)]
+    assert history.get_stats(redis_client, ["group1"])["group1"]["lag"] == 90
+    assert get_group_names(redis_client) == ["group1", "group2"]
+
+    # a kafka sample is never held back by a status sample
+    assert history.record(redis_client, {"group1": (100, 100, SOURCE_KAFKA)}) == 1
+    assert history.get_stats(redis_client, ["group1"])["group1"]["drained"]
+
+
+def test_stats_take_the_latest_offsets_the_history_skipped(redis_client):
+    history = OffsetHistory(interval_sec=3600)
+    history.record(redis_client, {"group1": (90, 100, SOURCE_KAFKA)})
+    latest = {"group1": (100, 100, SOURCE_KAFKA)}
+    assert history.record(redis_client, latest) == 0
+    assert not history.get_stats(redis_client, ["group1"])["group1"]["drained"]
+    assert history.get_stats(redis_client, ["group1"], latest)["group1"]["drained"]
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import orjson
+import pytest
+
+from modules.admission import AdmissionController, DEFAULT_THRESHOLDS
+from modules.codec import encode_item, decode_item
+from modules.orchestrator import MigrationOrchestrator
+from modules.uid_ranges import set_remaining_chunks, get_remaining_chunks
+from modules.work_queue import enqueue
+
+READ_METHOD = "readUserAttributes"
+PANEL_NAME = "panel1"
+PID = 4242
+
+
+@pytest.fixture
+def orchestrator(redis_client):
+    return MigrationOrchestrator(redis_client, [READ_METHOD])
+
+
+def set_status(redis_client, pid, status):
+    redis_client.hset(f"producer_{PANEL_NAME}", READ_METHOD, orjson.dumps({"pid": pid, "status": status}))
+
+
+def test_completed_producer_is_no_failure(orchestrator, redis_client):
+    set_status(redis_client, PID, "completed")
+    assert orchestrator.get_exit_failure(READ_METHOD, PANEL_NAME, PID, 0) is None
+
+
+@pytest.mark.parametrize("status", ["running", "killed"])
+def test_unfinished_status_is_a_failure(orchestrator, redis_client, status):
+    set_status(redis_client, PID, status)
+    assert f"status {status}" in orchestrator.get_exit_failure(READ_METHOD, PANEL_NAME, PID, 0)
+
+
+def test_non_zero_exit_code_is_a_failure(orchestrator, redis_client):
+    set_status(redis_client, PID, "completed")
+    assert "code 1" in orchestrator.get_exit_failure(READ_METHOD, PANEL_NAME, PID, 1)
+
+
+def test_exit_before_registering_is_a_failure(orchestrator):
+    assert orchestrator.get_exit_failure(READ_METHOD, PANEL_NAME, PID, 1) is not None
+    assert orchestrator.get_exit_failure(READ_METHOD, PANEL_NAME, PID, None) is not None
+
+
+def test_entry_of_another_chunk(orchestrator, redis_client):
+    set_status(redis_client, PID + 1, "running")
+    assert orchestrator.get_exit_failure(READ_METHOD, PANEL_NAME, PID, 0) is None
+    assert orchestrator.get_exit_failure(READ_METHOD, PANEL_NAME, PID, None) is not None
+
+
+def test_consumers_never_fail(orchestrator):
+    assert orchestrator.get_exit_failure("writeUserAttributes", PANEL_NAME, PID, 143) is None
+
+
+def test_single_read_slot_pairs_the_consumer_with_the_last_chunk(redis_client, monkeypatch):
+    write_method = "writeUserAttributes"
+    orchestrator = MigrationOrchestrator(redis_client, [READ_METHOD, write_method], admission=AdmissionController({name: 0 for name in DEFAULT_THRESHOLDS}))
+    # chunk 0 is the biggest, the slot claims it first
+    chunks = [{"panel_name": PANEL_NAME, "start_uid": 1, "end_uid": 60, "chunk_id": 0, "chunk_count": 2},
+              {"panel_name": PANEL_NAME, "start_uid": 61, "end_uid": 100, "chunk_id": 1, "chunk_count": 2}]
+    set_remaining_chunks(redis_client, PANEL_NAME, [READ_METHOD], len(chunks))
+    enqueue(redis_client, READ_METHOD, [(encode_item(chunk), chunk) for chunk in chunks])
+    consumer_data = {"panel_name": PANEL_NAME}
+    enqueue(redis_client, write_method, [(encode_item(consumer_data), consumer_data)])
+
+    pids = iter(range(PID, PID + 10))
+    monkeypatch.setattr(orchestrator, "launch", lambda method, slot, panel_data, timer=None: next(pids))
+    remaining_when_waited = []
+
+    def wait_for_completion(method, slot, pid, panel_name):
+        if method == READ_METHOD:
+            set_status(redis_client, pid, "completed")
+        else:
+            # kill_consumer.py only stops the consumer once no chunk is left, it would never exit otherwise
+            remaining_when_waited.append(get_remaining_chunks(redis_client, PANEL_NAME, READ_METHOD))
+        return 0
+
+    monkeypatch.setattr(orchestrator, "wait_for_completion", wait_for_completion)
+
+    queue = orchestrator._get_queue(READ_METHOD, 0)
+    paired_chunks = []
+    for _ in chunks:
+        item = queue.claim(timeout=0)
+        panel_data = decode_item(item)
+        paired = orchestrator._claim_paired_consumer(READ_METHOD, 0, item, panel_data)
+        if paired:
+            paired_chunks.append(panel_data["chunk_id"])
+        assert orchestrator.run_migration(READ_METHOD, 0, panel_data, paired)
+        queue.ack(item)
+
+    assert paired_chunks == [1]
+    assert remaining_when_waited == [0]
+    assert redis_client.zcard("writeUserAttributes_queue") == 0
+
+
+class OverloadedAdmission(AdmissionController):
+    def sample(self):
+        return {"cpu_percent": 100}
+
+
+def test_held_launch_is_not_drained_and_gives_up_once_stopping(redis_client):
+    orchestrator = MigrationOrchestrator(redis_client, [READ_METHOD], admission=OverloadedAdmission(check_interval=0.01))
+    launched, results = [], []
+    orchestrator.launch = lambda *args: launched.append(args)
+    orchestrator._acquire_global_slot()
+    thread = threading.Thread(target=lambda: results.append(orchestrator.run_migration(READ_METHOD, 0, {"panel_name": PANEL_NAME})))
+    thread.start()
+    deadline = time.monotonic() + 5
+    while orchestrator._held == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    orchestrator.drain(5)
+    assert time.monotonic() - started < 1
+
+    orchestrator._stopping = True
+    thread.join(5)
+    assert results == [False] and launched == []
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import time
+
+from modules.process_watcher import ProcessWatcher
+
+
+def start(seconds: float) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-c", f"import sys, time; time.sleep({seconds}); sys.exit(3)"])
+
+
+def test_wakes_up_on_exit_and_leaves_the_exit_code():
+    watcher = ProcessWatcher()
+    process = start(0.2)
+    started = time.monotonic()
+    assert watcher.wait(process.pid, timeout=10)
+    assert time.monotonic() - started < 5
+    # the watcher doesn't reap, the parent still gets the exit code
+    assert process.wait(timeout=1) == 3
+    assert process.pid not in watcher.watched_pids()
+
+
+def test_times_out_while_running():
+    watcher = ProcessWatcher()
+    process = start(60)
+    try:
+        assert not watcher.wait(process.pid, timeout=0.2)
+        assert process.pid in watcher.watched_pids()
+    finally:
+        process.kill()
+        process.wait()
+    assert watcher.wait(process.pid, timeout=10)
+
+
+def test_reaped_pid_counts_as_exited():
+    process = start(0)
+    process.wait()
+    assert ProcessWatcher().wait(process.pid, timeout=10)
+
+
+def test_psutil_fallback_without_pidfd(monkeypatch):
+    monkeypatch.delattr(os, "pidfd_open", raising=False)
+    watcher = ProcessWatcher(fallback_interval=0.05)
+    process = start(0.2)
+    assert watcher.wait(process.pid, timeout=10)
+    assert process.wait(timeout=1) == 3
+    # reaped by now, psutil doesn't find it anymore
+    assert watcher.wait(process.pid, timeout=10)
+
@@ -0,0 +1,73 @@
+import importlib
+import sys
+
+import pytest
+
+from modules.work_queue import get_pair
+
+
+class FakeEnqueuer:
+    """Queues every pair except the `failing` ones, which fail like a batch redis rejected."""
+
+    def __init__(self, failing=(), queued_before=()):
+        self.failing = set(failing)
+        self.queued_before = set(queued_before)
+        self.failed_pairs = set()
+
+    def add(self, panel_name, method, items):
+        pair = get_pair(panel_name, method)
+        if pair in self.failing:
+            self.failed_pairs.add(pair)
+            return []
+        return [] if pair in self.queued_before else [pair]
+
+    def flush(self):
+        return []
+
+
+@pytest.fixture(scope="module")
+def push_panels(tmp_path_factory):
+    property_file = tmp_path_factory.mktemp("push_panels") / "mongoremodel.properties"
+    property_file.write_text("redis_uri=localhost\nredis_port=6379\n")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("PROPERTY_FILE", str(property_file))
+        sys.modules.pop("push_panels_to_redis", None)
+        yield importlib.import_module("push_panels_to_redis")
+
+
+def push(push_panels, enqueuer, panels):
+    wave = push_panels.WavePush(enqueuer)
+    for panel_type, panel_name, methods in panels:
+        wave.add(panel_type, panel_name, [(method, [("item", {"panel_name": panel_name})]) for method in methods])
+    wave.flush()
+    return wave.get_counts()
+
+
+def test_counts_pushed_and_skipped(push_panels):
+    enqueuer = FakeEnqueuer(queued_before={get_pair("p2", "readUserAttributes")})
+    counts = push(push_panels, enqueuer, [("normal", "p1", ["readUserAttributes"]), ("normal", "p2", ["readUserAttributes"])])
+    assert (counts["panels_pushed"], counts["panels_skipped"], counts["panels_failed"]) == (1, 1, 0)
+    assert counts["pushed"]["normal"] == 1 and counts["skipped"]["normal"] == 1
+
+
+def test_panel_with_a_failed_item_only_counts_as_failed(push_panels):
+    enqueuer = FakeEnqueuer(failing={get_pair("p1", "readAnonUserAttributes")})
+    counts = push(push_panels, enqueuer, [("normal", "p1", ["readUserAttributes"]), ("anon", "p1", ["readAnonUserAttributes"])])
+    assert (counts["panels_pushed"], counts["panels_skipped"], counts["panels_failed"]) == (0, 0, 1)
+    assert counts["pairs_pushed"] == 1 and counts["pairs_failed"] == 1
+
+
+def test_partly_queued_panel_counts_as_pushed(push_panels):
+    enqueuer = FakeEnqueuer(queued_before={get_pair("p1", "readUserAttributes")})
+    counts = push(push_panels, enqueuer, [("normal", "p1", ["readUserAttributes", "writeUserAttributes"])])
+    assert (counts["panels_pushed"], counts["panels_skipped"], counts["panels_failed"]) == (1, 0, 0)
+
+
+def test_default_wave_follows_the_panels_file_contents(push_panels, tmp_path):
+    panels_file = tmp_path / "panels.txt"
+    panels_file.write_text("p1\np2\n")
+    wave = push_panels.get_default_wave(str(panels_file))
+    assert wave.startswith("panels.txt:")
+    assert push_panels.get_default_wave(str(panels_file)) == wave
+    panels_file.write_text("p3\n")
+    assert push_panels.get_default_wave(str(panels_file)) != wave
@@ -0,0 +1,54 @@
+from modules.codec import encode_item
+from modules.retry_queue import (RetryPolicy, fail_item, promote_due_retries, get_dead_letters, requeue_dead_letters,
+                                 get_retry_key, get_attempts_key)
+from modules.work_queue import ReliableQueue, enqueue, get_queue_key
+
+METHOD = "readUserAttributes"
+PANEL_DATA = {"panel_name": "panel1", "start_uid": 1, "end_uid": 1000}
+ITEM = encode_item(PANEL_DATA)
+
+
+def claim(redis_client):
+    queue = ReliableQueue(redis_client, METHOD, "host:1", 0)
+    assert queue.claim(timeout=0) == ITEM
+    return queue
+
+
+def test_retry_delay_doubles_up_to_the_max():
+    policy = RetryPolicy(max_attempts=5, base_delay=10, max_delay=30)
+    assert [policy.get_delay(attempt) for attempt in (1, 2, 3)] == [10, 20, 30]
+
+
+def test_failed_item_is_retried_then_dead_lettered(redis_client):
+    policy = RetryPolicy(max_attempts=2, base_delay=0)
+    enqueue(redis_client, METHOD, [(ITEM, PANEL_DATA)])
+
+    queue = claim(redis_client)
+    assert not fail_item(redis_client, METHOD, queue.processing_key, ITEM, "exited with code 1", policy)
+    assert redis_client.zscore(get_retry_key(METHOD), ITEM) is not None
+    # not a read*/write* key the status APIs would take for a queue
+    assert redis_client.keys("read*") == []
+    assert promote_due_retries(redis_client, [METHOD]) == 1
+    assert redis_client.zscore(get_queue_key(METHOD), ITEM) == 999
+
+    queue = claim(redis_client)
+    assert fail_item(redis_client, METHOD, queue.processing_key, ITEM, "exited with code 1", policy, "host:1")
+    assert redis_client.llen(queue.processing_key) == 0
+    assert redis_client.keys("read*") == []
+    failure = get_dead_letters(redis_client, [METHOD])[METHOD][ITEM]
+    assert (failure["panel_name"], failure["attempts"], failure["orchestrator"]) == ("panel1", 2, "host:1")
+    assert not redis_client.hexists(get_attempts_key(METHOD), ITEM)
+
+
+def test_requeue_dead_letters_of_some_panels(redis_client):
+    other_data = {"panel_name": "panel2", "start_uid": 1, "end_uid": 10}
+    enqueue(redis_client, METHOD, [(ITEM, PANEL_DATA), (encode_item(other_data), other_data)])
+    policy = RetryPolicy(max_attempts=1)
+    queue = ReliableQueue(redis_client, METHOD, "host:1", 0)
+    for _ in range(2):
+        item = queue.claim(timeout=0)
+        fail_item(redis_client, METHOD, queue.processing_key, item, "failed", policy)
+
+    assert requeue_dead_letters(redis_client, [METHOD], ["panel1"]) == {METHOD: 1}
+    assert redis_client.zscore(get_queue_key(METHOD), ITEM) is not None
+    assert list(get_dead_letters(redis_client, [METHOD])[METHOD]) == [encode_item(other_data)]
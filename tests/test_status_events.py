@@ -0,0 +1,25 @@
+from modules.status_events import enable_keyspace_events, get_panel_name
+
+
+def get_flags(redis_client) -> set:
+    return set(redis_client.config_get("notify-keyspace-events")["notify-keyspace-events"])
+
+
+def test_merges_the_required_flags(redis_client):
+    redis_client.config_set("notify-keyspace-events", "El")
+    assert enable_keyspace_events(redis_client, "Kh")
+    assert get_flags(redis_client) >= set("ElKh")
+    assert enable_keyspace_events(redis_client)
+    assert get_flags(redis_client) >= set("ElKhg")
+
+
+def test_keeps_the_all_alias(redis_client):
+    redis_client.config_set("notify-keyspace-events", "KA")
+    assert enable_keyspace_events(redis_client)
+    assert get_flags(redis_client) == set("KA")
+
+
+def test_get_panel_name():
+    assert get_panel_name("producer_panel1") == "panel1"
+    assert get_panel_name("migration_chunks:panel1") == "panel1"
+    assert get_panel_name("other_panel1") is None
@@ -0,0 +1,44 @@
+import subprocess
+import sys
+import time
+
+import orjson
+
+from modules.phase_timer import PhaseTimer
+from modules.termination_tracker import TerminationTracker
+
+KEY = "consumer_panel1"
+FIELD = "writeUserAttributes"
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_stops_the_consumer_and_marks_it_completed(redis_client):
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    data = {"pid": process.pid, "status": "running", "topic_name": "topic1"}
+    redis_client.hset(KEY, FIELD, orjson.dumps(data))
+    tracker = TerminationTracker(redis_client, grace_sec=5)
+
+    assert tracker.terminate(KEY, FIELD, dict(data), PhaseTimer())
+    assert not tracker.terminate(KEY, FIELD, dict(data), PhaseTimer())
+    assert tracker.is_terminating(KEY, FIELD)
+
+    assert process.wait(timeout=10) != 0
+    wait_until(lambda: tracker.pending() == 0)
+    assert orjson.loads(redis_client.hget(KEY, FIELD))["status"] == "completed"
+
+
+def test_kills_a_consumer_ignoring_sigterm(redis_client):
+    process = subprocess.Popen([sys.executable, "-c", "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print(flush=True); time.sleep(60)"], stdout=subprocess.PIPE)
+    process.stdout.readline()
+    tracker = TerminationTracker(redis_client, grace_sec=0.2)
+
+    tracker.terminate(KEY, FIELD, {"pid": process.pid, "status": "running"}, PhaseTimer())
+    assert process.wait(timeout=10) == -9
+    wait_until(lambda: tracker.pending() == 0)
+    assert orjson.loads(redis_client.hget(KEY, FIELD))["status"] == "completed"
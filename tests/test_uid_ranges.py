@@ -0,0 +1,32 @@
+from modules.uid_ranges import split_uid_range, set_remaining_chunks, complete_chunk, get_remaining_chunks
+
+METHODS = ["readUserAttributes", "writeUserAttributes"]
+
+
+def test_equal_widths():
+    assert split_uid_range(1, 100, 4) == [(1, 25), (26, 50), (51, 75), (76, 100)]
+
+
+def test_cuts_follow_the_boundaries():
+    assert split_uid_range(1, 100, 2, [10, 20, 30, 90]) == [(1, 29), (30, 100)]
+
+
+def test_never_more_ranges_than_uids():
+    assert split_uid_range(1, 2, 4) == [(1, 1), (2, 2)]
+
+
+def test_chunk_countdown(redis_client):
+    set_remaining_chunks(redis_client, "panel1", METHODS, 2)
+    chunk = {"panel_name": "panel1", "chunk_id": 0, "chunk_count": 2}
+    complete_chunk(redis_client, METHODS[0], chunk)
+    assert get_remaining_chunks(redis_client, "panel1", METHODS[0]) == 1
+    complete_chunk(redis_client, METHODS[0], chunk)
+    complete_chunk(redis_client, METHODS[0], chunk)
+    assert get_remaining_chunks(redis_client, "panel1", METHODS[0]) == 0
+    assert get_remaining_chunks(redis_client, "panel1", METHODS[1]) == 2
+
+
+def test_unchunked_panels_have_no_chunks(redis_client):
+    complete_chunk(redis_client, METHODS[0], {"panel_name": "panel1"})
+    assert get_remaining_chunks(redis_client, "panel1", METHODS[0]) == 0
+    assert not redis_client.exists("migration_chunks:panel1")
@@ -0,0 +1,121 @@
+import time
+
+from modules.codec import encode_item
+from modules.uid_ranges import get_remaining_chunks
+from modules.work_queue import ReliableQueue, WaveEnqueuer, enqueue, get_pair, get_queue_key, queue_length, reap_orphaned_items, send_heartbeat, SHORTEST_FIRST
+
+METHOD = "readUserAttributes"
+
+
+def make_items(*ranges):
+    items = []
+    for n, end_uid in enumerate(ranges):
+        panel_data = {"panel_name": f"panel{n}", "start_uid": 1, "end_uid": end_uid}
+        items.append((encode_item(panel_data), panel_data))
+    return items
+
+
+def test_claim_moves_the_item_to_the_processing_list(redis_client):
+    items = make_items(100)
+    enqueue(redis_client, METHOD, items)
+    queue = ReliableQueue(redis_client, METHOD, "host:1", 0)
+    assert queue.claim(timeout=0) == items[0][0]
+    assert redis_client.lrange(queue.processing_key, 0, -1) == [items[0][0]]
+    assert queue_length(redis_client, get_queue_key(METHOD)) == 0
+
+
+def test_claims_the_biggest_panel_first(redis_client):
+    items = make_items(100, 1000, 10)
+    assert enqueue(redis_client, METHOD, items) == 3
+    queue = ReliableQueue(redis_client, METHOD, "host:1", 0)
+    assert [queue.claim(timeout=0) for _ in items] == [items[1][0], items[0][0], items[2][0]]
+
+
+def test_express_slot_claims_the_smallest_panel_up_to_max_work(redis_client):
+    items = make_items(100, 1000, 10)
+    enqueue(redis_client, METHOD, items)
+    queue = ReliableQueue(redis_client, METHOD, "host:1", "express0", SHORTEST_FIRST, max_work=50)
+    assert queue.claim(timeout=0) == items[2][0]
+    assert queue.claim(timeout=0) is None
+
+
+def test_serves_legacy_list_queues_in_order(redis_client):
+    items = make_items(100, 1000)
+    redis_client.rpush(get_queue_key(METHOD), *[item for item, _ in items])
+    queue = ReliableQueue(redis_client, METHOD, "host:1", 0)
+    assert queue.claim(timeout=0) == items[0][0]
+    queue.requeue(items[0][0])
+    assert redis_client.lrange(get_queue_key(METHOD), 0, -1) == [items[1][0], items[0][0]]
+
+
+def test_claim_waits_for_an_enqueue(redis_client):
+    queue = ReliableQueue(redis_client, METHOD, "host:1", 0)
+    started = time.monotonic()
+    assert queue.claim(timeout=0.2) is None
+    assert time.monotonic() - started >= 0.2
+
+
+def test_ack_and_requeue(redis_client):
+    items = make_items(100, 1000)
+    enqueue(redis_client, METHOD, items)
+    queue = ReliableQueue(redis_client, METHOD, "host:1", 0)
+    first = queue.claim(timeout=0)
+    queue.requeue(first)
+    assert queue.claim(timeout=0) == first
+
+    queue.ack(first)
+    assert redis_client.llen(queue.processing_key) == 0
+    assert queue_length(redis_client, get_queue_key(METHOD)) == 1
+
+
+def test_claim_item(redis_client):
+    items = make_items(100, 1000)
+    enqueue(redis_client, METHOD, items)
+    queue = ReliableQueue(redis_client, METHOD, "host:1", "pair0")
+    assert queue.claim_item(items[0][0])
+    assert not queue.claim_item(items[0][0])
+    assert redis_client.lrange(queue.processing_key, 0, -1) == [items[0][0]]
+    assert queue_length(redis_client, get_queue_key(METHOD)) == 1
+
+
+def test_reaps_the_items_of_dead_orchestrators_only(redis_client):
+    items = make_items(100, 1000)
+    enqueue(redis_client, METHOD, items)
+    send_heartbeat(redis_client, "live:1")
+    live = ReliableQueue(redis_client, METHOD, "live:1", 0)
+    dead = ReliableQueue(redis_client, METHOD, "dead:1", 0)
+    live_item, dead_item = live.claim(timeout=0), dead.claim(timeout=0)
+
+    assert reap_orphaned_items(redis_client) == 1
+    assert redis_client.lrange(live.processing_key, 0, -1) == [live_item]
+    assert redis_client.llen(dead.processing_key) == 0
+    assert redis_client.zscore(get_queue_key(METHOD), dead_item) is not None
+
+
+def make_chunks(panel_name, count):
+    items = []
+    for chunk_id in range(count):
+        panel_data = {"panel_name": panel_name, "start_uid": chunk_id * 10 + 1, "end_uid": chunk_id * 10 + 10, "chunk_id": chunk_id, "chunk_count": count}
+        items.append((encode_item(panel_data), panel_data))
+    return items
+
+
+def test_wave_sets_the_remaining_chunks_with_the_items(redis_client):
+    enqueuer = WaveEnqueuer(redis_client, "wave1")
+    enqueuer.add("panel0", METHOD, make_chunks("panel0", 3))
+    enqueuer.add("panel1", METHOD, make_items(100))
+    assert enqueuer.flush() == [get_pair("panel0", METHOD), get_pair("panel1", METHOD)]
+    assert queue_length(redis_client, get_queue_key(METHOD)) == 4
+    assert get_remaining_chunks(redis_client, "panel0", METHOD) == 3
+    assert not redis_client.exists("migration_chunks:panel1")
+
+
+def test_wave_skips_the_pairs_it_queued_before(redis_client):
+    enqueuer = WaveEnqueuer(redis_client, "wave1")
+    enqueuer.add("panel0", METHOD, make_chunks("panel0", 2))
+    enqueuer.flush()
+    # a chunk finished meanwhile, queueing the wave again leaves its counter alone
+    redis_client.hincrby("migration_chunks:panel0", METHOD, -1)
+    enqueuer.add("panel0", METHOD, make_chunks("panel0", 2))
+    assert enqueuer.flush() == []
+    assert get_remaining_chunks(redis_client, "panel0", METHOD) == 1
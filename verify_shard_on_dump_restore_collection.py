@@ -1,8 +1,7 @@
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
-import logging
-from datetime import datetime
 import sys
+from modules.log_utils import setup_logger, log_message, get_log_settings
 from pymongo import MongoClient
 
 PROPERTY_FILE = "/etc/mongoremodel.properties"
@@ -111,36 +110,6 @@ NUM_OF_DESTINATION_TS_COLLETIONS = 6
 TIMESERIES_COLLECTIONS = ["userAttributes", "anonUserAttributes", "disableUserAttributes", "userEvents", "anonUserEvents", "disableUserEvents", "anonEngagementDetails", "anonUserDetails", "disableEngagementDetails", "disableUserDetails", "engagementDetails", "userDetails"]
 # TIMESERIES_COLLECTIONS = ["test_1_c1", "test_1_c2", "test_2_c1", "test_2_c2"]
 
-def setup_logger(log_file_path):
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(message)s",
-        handlers=[
-            logging.FileHandler(log_file_path, mode="a")
-        ]
-    )
-
-
-def log_message(level: str, data: dict):
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    log_level = level.upper()
-    log_details = " ".join([f"[{key}:{val}]" for key, val in data.items()])
-    message = f"{timestamp} {log_level} {log_details}"
-    
-    if log_level == "DEBUG":
-        logging.debug(message)
-    elif log_level == "INFO":
-        logging.info(message)
-    elif log_level == "WARNING":
-        logging.warning(message)
-    elif log_level == "ERROR":
-        logging.error(message)
-    elif log_level == "CRITICAL":
-        logging.critical(message)
-    else:
-        logging.info(message)
-
-
 def get_mongo_connection(host, port, username=None, password=None, auth_source="admin"):
     try:
         uri = f"mongodb://{username}:{password}@{host}:{port}/" if username and password else f"mongodb://{host}:{port}/"
@@ -241,7 +210,7 @@ if __name__ == '__main__':
         print('usage: python3 create_shard_on_dump_restore_creation.py <panels_file_path> <log_file_path>')
         exit()
     
-    setup_logger(log_file_path)
+    setup_logger(log_file_path, **get_log_settings(config_dict))
 
     with open(panels_file_path, "r") as file:
         panels = [line.strip() for line in file if line.strip()]